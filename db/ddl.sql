@@ -55,6 +55,8 @@ CREATE TABLE IF NOT EXISTS lab_results (
     FOREIGN KEY (patient_id) REFERENCES patient_info(patient_id) ON DELETE CASCADE,
     FOREIGN KEY (record_id) REFERENCES medical_records(record_id) ON DELETE SET NULL,
     INDEX idx_lr_patient_date (patient_id, test_date),
+    INDEX idx_lr_patient_type_date (patient_id, test_type, test_date),
+    INDEX idx_lr_patient_abnormal_date (patient_id, is_abnormal, test_date),
     INDEX idx_lr_record (record_id),
     INDEX idx_lr_date_type (test_date, test_type)
 );
@@ -144,7 +146,8 @@ CREATE TABLE IF NOT EXISTS guideline_recommendations (
     update_date DATE,
     is_active BOOLEAN DEFAULT TRUE,
     INDEX idx_gr_disease (disease_type),
-    INDEX idx_gr_level (recommendation_level)
+    INDEX idx_gr_level (recommendation_level),
+    INDEX idx_gr_active_date (is_active, update_date)
 );
 
 -- 系统日志表
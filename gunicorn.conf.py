@@ -0,0 +1,36 @@
+"""
+Gunicorn 部署配置
+用法: gunicorn -c gunicorn.conf.py src.app:app
+
+preload 模式下主进程只初始化一次(加载RAG索引、药物知识库等),
+worker 通过 fork 以写时复制方式共享这些只读数据。
+"""
+import multiprocessing
+import os
+
+# 主进程导入 src.app 时执行 initialize_app()
+os.environ.setdefault("PRELOAD_APP", "1")
+
+bind = f"{os.getenv('FLASK_HOST', '0.0.0.0')}:{os.getenv('FLASK_PORT', '5000')}"
+workers = int(os.getenv("GUNICORN_WORKERS", multiprocessing.cpu_count() * 2 + 1))
+# 流式对话会长时间占用连接,使用线程 worker 避免单个流阻塞整个进程
+worker_class = "gthread"
+threads = int(os.getenv("GUNICORN_THREADS", 4))
+timeout = 120
+preload_app = True
+
+
+def post_fork(server, worker):
+    """fork 后丢弃继承自主进程的数据库连接,各 worker 重新建立自己的连接池,并预热LLM连接"""
+    import src.app
+    from src.database.mysql_connector import get_db_connector
+
+    if src.app.query_engine is not None:
+        src.app.query_engine.prewarm()
+
+    # 主进程未创建过连接器时无需处理
+    if not get_db_connector.cache_info().currsize:
+        return
+    engine = get_db_connector().engine
+    if engine is not None:
+        engine.dispose(close=False)
@@ -3,6 +3,8 @@
 作者 杨勇'''
 
 import os
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
 
 # 1.Load 导入Document Loaders
 #from langchain.document_loaders import PyPDFLoader
@@ -16,104 +18,277 @@ from langchain_community.document_loaders import UnstructuredMarkdownLoader
 
 # 加载Documents
 base_dir = './data' # 文档的存放目录，存放企业很多文档
-documents = []
-for file in os.listdir(base_dir): 
-    # 构建完整的文件路径
-    file_path = os.path.join(base_dir, file)
-    if file.endswith('.pdf'):
-        loader = PyPDFLoader(file_path)
-        documents.extend(loader.load())
-    elif file.endswith('.docx'):
-        loader = Docx2txtLoader(file_path)
-        documents.extend(loader.load())
-    elif file.endswith('.txt'):
-        loader = TextLoader(file_path)
-        documents.extend(loader.load())
-    elif file.endswith('.md'):
-        loader = UnstructuredMarkdownLoader(file_path,mode="elements")
-        documents.extend(loader.load())
+
+# 文件后缀 -> Loader 路由表
+LOADERS = {
+    '.pdf': PyPDFLoader,
+    '.docx': Docx2txtLoader,
+    '.txt': TextLoader,
+    '.md': lambda file_path: UnstructuredMarkdownLoader(file_path, mode="elements"),
+}
+
+def load_documents(base_dir):
+    loaders = []
+    for path in Path(base_dir).iterdir():
+        loader_cls = LOADERS.get(path.suffix.lower())
+        if loader_cls:
+            loaders.append(loader_cls(str(path)))
+    # 各文件的 load() 以文件读取和C扩展解析为主,用线程池并行加载
+    documents = []
+    with ThreadPoolExecutor(max_workers=8) as executor:
+        for docs in executor.map(lambda loader: loader.load(), loaders):
+            documents.extend(docs)
+    return documents
 
 # 2.Split 将Documents切分成块以便后续进行嵌入和向量存储
 from langchain_community.document_loaders import UnstructuredFileLoader
-from langchain.text_splitter import RecursiveCharacterTextSplitter
+from langchain_text_splitters import RecursiveCharacterTextSplitter
 #from langchain_community.embeddings import HuggingFaceEmbeddings
 from langchain_huggingface import HuggingFaceEmbeddings
 #from langchain_community.vectorstores import FAISS  # 向量数据库
-text_splitter = RecursiveCharacterTextSplitter(chunk_size=800, chunk_overlap=200)
-chunked_documents = text_splitter.split_documents(documents)
+
+def split_documents(documents):
+    # 按 cl100k_base token 计长度,分词在 tiktoken 的 Rust 实现中完成; 所有文档一次性切分
+    text_splitter = RecursiveCharacterTextSplitter.from_tiktoken_encoder(
+        encoding_name="cl100k_base", chunk_size=800, chunk_overlap=200)
+    return text_splitter.split_documents(documents)
 
 # 3.Store 将分割嵌入并存储在矢量数据库Qdrant中
 #from langchain.vectorstores import Qdrant
 from langchain_community.vectorstores import Qdrant
+from qdrant_client import QdrantClient, models
 #from langchain.embeddings import OpenAIEmbeddings
 # 定义向量模型路径
 EMBEDDING_MODEL = '/root/autodl-tmp/m3e-base'
+# 向量库持久化目录: 已存在时直接加载,跳过文档加载、切分和向量化
+QDRANT_PATH = './qdrant_store'
+COLLECTION_NAME = "my_documents"
+
+_EMBEDDER = None
+
+def get_embedder():
+    # 进程内只加载一次huggingface embedding模型,建库与检索共用同一实例
+    global _EMBEDDER
+    if _EMBEDDER is None:
+        # GPU上按64条一批编码(sentence-transformers内部按长度排序以减少padding)
+        _EMBEDDER = HuggingFaceEmbeddings(
+            model_name=EMBEDDING_MODEL,
+            model_kwargs={"device": "cuda"},
+            encode_kwargs={"batch_size": 64, "normalize_embeddings": True})
+    return _EMBEDDER
 
-vectorstore = Qdrant.from_documents(
-    # 以分块的文档
-    documents=chunked_documents,
-    # 初始化huggingface模型embedding
-    embedding=HuggingFaceEmbeddings(model_name=EMBEDDING_MODEL),
-    location=":memory:",  # in-memory 存储
-    collection_name="my_documents",) # 指定collection_name
+if os.path.exists(QDRANT_PATH):
+    print(f"从 {QDRANT_PATH} 加载已有向量库")
+    vectorstore = Qdrant(
+        client=QdrantClient(path=QDRANT_PATH),
+        collection_name=COLLECTION_NAME,
+        embeddings=get_embedder())
+else:
+    chunked_documents = split_documents(load_documents(base_dir))
+    vectorstore = Qdrant.from_documents(
+        # 以分块的文档
+        documents=chunked_documents,
+        embedding=get_embedder(),
+        batch_size=1024,  # 每次把1024个分块一起交给embed_documents,而不是默认的64个
+        path=QDRANT_PATH,  # 本地持久化存储
+        collection_name=COLLECTION_NAME, # 指定collection_name
+        # int8标量量化(常驻内存) + HNSW索引,检索时读取的向量字节数降为1/4
+        quantization_config=models.ScalarQuantization(
+            scalar=models.ScalarQuantizationConfig(type=models.ScalarType.INT8, always_ram=True)),
+        hnsw_config=models.HnswConfigDiff(m=16, ef_construct=200),)
+
+# 检索参数: 先在量化向量上检索(2倍过采样),再用原始向量重排
+SEARCH_PARAMS = models.SearchParams(
+    quantization=models.QuantizationSearchParams(rescore=True, oversampling=2.0))
 
 # 4. Retrieval 准备模型和Retrieval链
 import logging # 导入Logging工具
 from langchain.chat_models import ChatOpenAI # ChatOpenAI模型
 from langchain.retrievers.multi_query import MultiQueryRetriever # MultiQueryRetriever工具
 from langchain.chains import RetrievalQA # RetrievalQA链
+from langchain.prompts import PromptTemplate
 
 # 设置Logging
 logging.basicConfig()
 logging.getLogger('langchain.retrievers.multi_query').setLevel(logging.DEBUG)
 
 # 实例化一个本地大模型工具 - glm3
+import asyncio
+import threading
+import uuid
+from functools import lru_cache
 from langchain.llms.base import LLM
-from typing import Any, List, Optional
-from langchain.callbacks.manager import CallbackManagerForLLMRun
+from typing import Any, Iterator, List, Optional
+from langchain.callbacks.manager import CallbackManagerForLLMRun, CallbackManagerForRetrieverRun
+from langchain_core.outputs import GenerationChunk
 from transformers import AutoTokenizer, AutoModelForCausalLM
 
+# 固定的系统提示词: 每次请求都相同,作为可复用的前缀缓存(KV cache)
+SYSTEM_PROMPT = ("你是企业知识库问答助手。请根据用户提供的参考资料回答问题,"
+                 "如果参考资料中没有答案,请直接说不知道,不要编造答案。")
+
+# 问答模板只保留随请求变化的部分,固定说明放在 SYSTEM_PROMPT 中
+QA_PROMPT = PromptTemplate.from_template("参考资料:\n{context}\n\n问题: {question}")
+
 class ChatGLM_LLM(LLM):
     # 基于本地 InternLM 自定义 LLM 类
     tokenizer : AutoTokenizer = None
     model: AutoModelForCausalLM = None
+    sys_past_key_values: Any = None
 
-    def __init__(self, model_path :str):
+    def __init__(self, model_path :str, quant_bits: Optional[int] = 4, compile_model: bool = False):
         # model_path: InternLM 模型路径
+        # quant_bits: 权重量化位数(4/8),激活保持FP16; 传None则以bf16全精度加载
+        # compile_model: 是否用 torch.compile 编译 transformer 前向
         # 从本地初始化模型
         super().__init__()
         print("正在从本地加载模型...")
         self.tokenizer = AutoTokenizer.from_pretrained(model_path, trust_remote_code=True)
-        self.model = AutoModelForCausalLM.from_pretrained(model_path, trust_remote_code=True).to(torch.bfloat16).cuda()
-        #self.model = AutoModelForCausalLM.from_pretrained(model_path, trust_remote_code=True).to(torch.bfloat16).cuda().quantize(8)
+        if quant_bits:
+            # 先量化再.cuda(),避免显存中同时存在全精度权重
+            self.model = AutoModelForCausalLM.from_pretrained(
+                model_path, trust_remote_code=True, low_cpu_mem_usage=True).quantize(quant_bits).cuda()
+        else:
+            # 直接以bf16加载到GPU,避免在CPU内存中先构造FP32权重再转换、拷贝
+            self.model = AutoModelForCausalLM.from_pretrained(
+                model_path, trust_remote_code=True, torch_dtype=torch.bfloat16,
+                low_cpu_mem_usage=True, device_map="cuda:0")
         self.model = self.model.eval()
+        if compile_model:
+            # ChatGLM3 的远程代码在 torch>=2 下注意力已走 scaled_dot_product_attention(FlashAttention内核),
+            # 这里只编译 transformer 主体以减少解码循环中的 Python 调度开销; 序列长度变化,使用 dynamic=True 避免反复重编译
+            self.model.transformer = torch.compile(self.model.transformer, dynamic=True)
+        # 预先对系统提示词做一次前向,缓存其KV,后续请求只需prefill变化的部分
+        sys_ids = self.tokenizer.get_prefix_tokens() + self.tokenizer.build_single_message("system", "", SYSTEM_PROMPT)
+        with torch.no_grad():
+            outputs = self.model(input_ids=torch.tensor([sys_ids], device=self.model.device), use_cache=True)
+        self.sys_past_key_values = outputs.past_key_values
         print("完成本地模型的加载")
 
+    def _stream_chat(self, prompt: str):
+        # 在系统提示词的KV缓存之上生成; 每次返回累计回答
+        for response, history, past_key_values in self.model.stream_chat(
+                self.tokenizer, prompt, history=[], temperature=0.3,
+                past_key_values=self.sys_past_key_values, return_past_key_values=True):
+            yield response
+
     def _call(self, prompt : str, stop: Optional[List[str]] = None,
                 run_manager: Optional[CallbackManagerForLLMRun] = None,
                 **kwargs: Any):
         # 重写调用函数
         print(f"LLM prompt:{prompt}")
-        response, history = self.model.chat(self.tokenizer, prompt , history=[], temperature=0.3)
+        response = ""
+        for response in self._stream_chat(prompt):
+            pass
         return response
+
+    def _stream(self, prompt : str, stop: Optional[List[str]] = None,
+                run_manager: Optional[CallbackManagerForLLMRun] = None,
+                **kwargs: Any) -> Iterator[GenerationChunk]:
+        # 流式输出: stream_chat 每次返回累计回答,这里只产出新增部分
+        print(f"LLM prompt:{prompt}")
+        sent = 0
+        for response in self._stream_chat(prompt):
+            delta = response[sent:]
+            sent = len(response)
+            if delta:
+                chunk = GenerationChunk(text=delta)
+                if run_manager:
+                    run_manager.on_llm_new_token(delta, chunk=chunk)
+                yield chunk
         
     @property
     def _llm_type(self) -> str:
         return "ChatGLM3-6B"
 
+class ChatGLM_VLLM(LLM):
+    # 基于 vLLM AsyncLLMEngine 的推理后端: 分页KV缓存 + 连续批处理,并发请求共享权重读取
+    engine: Any = None
+    loop: Any = None
+
+    def __init__(self, model_path :str):
+        super().__init__()
+        from vllm import AsyncEngineArgs, AsyncLLMEngine
+        print("正在使用vLLM加载模型...")
+        self.engine = AsyncLLMEngine.from_engine_args(AsyncEngineArgs(
+            model=model_path,
+            trust_remote_code=True,
+            dtype="bfloat16",
+            enable_prefix_caching=True,  # RAG提示词共享大量前缀
+        ))
+        # 后台事件循环: Flask的同步请求线程通过它向引擎提交请求
+        self.loop = asyncio.new_event_loop()
+        threading.Thread(target=self.loop.run_forever, daemon=True).start()
+        print("完成vLLM引擎的加载")
+
+    async def _generate(self, prompt: str) -> str:
+        from vllm import SamplingParams
+        final_output = None
+        # ChatGLM3 对话格式,与 model.chat() 保持一致
+        chat_prompt = f"<|system|>\n{SYSTEM_PROMPT}<|user|>\n{prompt}<|assistant|>"
+        async for output in self.engine.generate(chat_prompt, SamplingParams(temperature=0.3, max_tokens=2048), request_id=uuid.uuid4().hex):
+            final_output = output
+        return final_output.outputs[0].text
+
+    def _call(self, prompt : str, stop: Optional[List[str]] = None,
+                run_manager: Optional[CallbackManagerForLLMRun] = None,
+                **kwargs: Any):
+        print(f"LLM prompt:{prompt}")
+        future = asyncio.run_coroutine_threadsafe(self._generate(prompt), self.loop)
+        return future.result()
+
+    @property
+    def _llm_type(self) -> str:
+        return "ChatGLM3-6B-vLLM"
+
 import torch
-llm = ChatGLM_LLM(model_path = "/root/autodl-tmp/chatglm3-6b")
+# LLM_BACKEND=vllm 时使用vLLM引擎,默认仍为HuggingFace本地推理
+LLM_BACKEND = os.environ.get("LLM_BACKEND", "hf")
+if LLM_BACKEND == "vllm":
+    llm = ChatGLM_VLLM(model_path = "/root/autodl-tmp/chatglm3-6b")
+else:
+    llm = ChatGLM_LLM(model_path = "/root/autodl-tmp/chatglm3-6b")
 
-# 实例化一个MultiQueryRetriever
-retriever_from_llm = MultiQueryRetriever.from_llm(retriever=vectorstore.as_retriever(search_kwargs={"k": 3}), llm=llm)
+# MultiQueryRetriever 每次检索前都要让LLM生成改写查询,默认关闭; USE_MULTI_QUERY=1 时启用
+USE_MULTI_QUERY = os.environ.get("USE_MULTI_QUERY", "0") == "1"
+
+class CachedMultiQueryRetriever(MultiQueryRetriever):
+    # 相同问题(规范化空白后)复用已生成的改写查询,避免重复的LLM调用
+    def generate_queries(self, question: str, run_manager) -> List[str]:
+        return list(_paraphrase(" ".join(question.split())))
+
+@lru_cache(maxsize=1024)
+def _paraphrase(question: str) -> tuple:
+    queries = MultiQueryRetriever.generate_queries(
+        retriever, question, CallbackManagerForRetrieverRun.get_noop_manager())
+    return tuple(queries)
+
+if USE_MULTI_QUERY:
+    # 实例化一个带缓存的MultiQueryRetriever
+    retriever = CachedMultiQueryRetriever.from_llm(retriever=vectorstore.as_retriever(search_kwargs={"k": 3, "search_params": SEARCH_PARAMS}), llm=llm)
+else:
+    retriever = vectorstore.as_retriever(search_kwargs={"k": 5, "search_params": SEARCH_PARAMS})
 
 # 实例化一个RetrievalQA链
-qa_chain = RetrievalQA.from_chain_type(llm,retriever=retriever_from_llm, return_source_documents=True)
+qa_chain = RetrievalQA.from_chain_type(llm,retriever=retriever, return_source_documents=True,
+                                       chain_type_kwargs={"prompt": QA_PROMPT})
 
 # 5. Output 问答系统的UI实现
-from flask import Flask, request, jsonify, render_template
+from flask import Flask, request, jsonify, render_template, Response, stream_with_context
+from flask.json.provider import JSONProvider
+import orjson
 app = Flask(__name__) # Flask APP
 
+class OrjsonProvider(JSONProvider):
+    # 使用 orjson 序列化响应: 直接输出UTF-8中文,不做 \uXXXX 转义
+    def dumps(self, obj, **kwargs):
+        return orjson.dumps(obj, option=orjson.OPT_NON_STR_KEYS).decode()
+
+    def loads(self, s, **kwargs):
+        return orjson.loads(s)
+
+app.json = OrjsonProvider(app)
+
 @app.route('/', methods=['GET', 'POST'])
 def home():
     if request.method == 'POST':
@@ -121,17 +296,26 @@ def home():
         # 接收用户输入作为问题
         question = request.form.get('question')        
         
-        # RetrievalQA链 - 读入问题，生成答案
-        result = qa_chain({"query": question})
-        source_documents = result["source_documents"]
-        print(f"documents==========={source_documents}")
-        
-        # 把大模型的回答结果返回网页进行渲染
-        # return jsonify(refined_answer)
-        return {"query": question, "result": result["result"]}
-        # return render_template('index_opt.html', result=result)
+        # 流式输出: 先检索文档,再按RetrievalQA链的提示词逐token生成答案
+        def generate():
+            try:
+                source_documents = retriever.invoke(question)
+                print(f"documents==========={source_documents}")
+                context = "\n\n".join(doc.page_content for doc in source_documents)
+                prompt = qa_chain.combine_documents_chain.llm_chain.prompt.format(context=context, question=question)
+                for chunk in llm.stream(prompt):
+                    yield chunk
+            except Exception as e:
+                print(f"错误: {str(e)}")
+                yield f"【系统错误】{str(e)}"
+
+        # 与 DocQA-glm-demo.py 一致,以纯文本流返回,前端通过 fetch reader 逐步渲染
+        return Response(stream_with_context(generate()), mimetype="text/plain")
     
     return render_template('index_opt.html')
 
+# 生产部署: 使用 gunicorn 单进程多线程(模型已占用GPU,不能fork多个进程),检索/JSON渲染可与GPU推理并发
+#   gunicorn -w 1 -k gthread --threads 16 -b 0.0.0.0:5000 "DocQA-glm-checkpoint:app"
+# 注意不要加 --preload: 否则模型在master进程中初始化CUDA后再fork,worker将无法使用GPU
 if __name__ == "__main__":
-    app.run(host='0.0.0.0',debug=False,use_reloader=False,port=5000)
\ No newline at end of file
+    app.run(host='0.0.0.0',debug=False,use_reloader=False,port=5000,threaded=True)
\ No newline at end of file
@@ -11,8 +11,20 @@ query_engine = rag.create_query_engine(index=index)
 
 # 5. Output 问答系统的UI实现
 from flask import Flask, request, jsonify, render_template
+from flask.json.provider import JSONProvider
+import orjson
 app = Flask(__name__) # Flask APP
 
+class OrjsonProvider(JSONProvider):
+    # 使用 orjson 序列化响应: 直接输出UTF-8中文,不做 \uXXXX 转义
+    def dumps(self, obj, **kwargs):
+        return orjson.dumps(obj, option=orjson.OPT_NON_STR_KEYS).decode()
+
+    def loads(self, s, **kwargs):
+        return orjson.loads(s)
+
+app.json = OrjsonProvider(app)
+
 @app.route('/', methods=['GET', 'POST'])
 def home():
     if request.method == 'POST':
@@ -2,6 +2,12 @@ import json
 import os
 import getpass
 import sys
+from functools import lru_cache
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
 
 try:
     import dashscope
@@ -12,30 +18,39 @@ except ImportError:
     print("请运行 'pip install dashscope' 安装该模块")
 
 
+@lru_cache(maxsize=1)
 def load_key():
     """
     加载和配置阿里云通义千问API密钥
     工作流程：
-    1. 尝试从Key.json文件读取API密钥
-    2. 如果文件存在且包含密钥，加载到环境变量
-    3. 如果文件不存在，提示用户输入密钥并保存
-    4. 将密钥配置到dashscope模块
+    1. 如果环境变量中已有密钥，直接使用(不读取文件)
+    2. 尝试从Key.json文件读取API密钥
+    3. 如果文件存在且包含密钥，加载到环境变量
+    4. 如果文件不存在，提示用户输入密钥并保存
+    5. 将密钥配置到dashscope模块
+    结果会被缓存，重复调用不会再次读取文件
     """
     key_file_path = "../Key.json"
     
+    api_key = os.environ.get('DASHSCOPE_API_KEY')
+    if api_key:
+        print("从环境变量中加载API密钥成功")
+        if DASHSCOPE_AVAILABLE:
+            dashscope.api_key = api_key
+        return api_key
+    
     # 尝试从文件读取密钥
     if os.path.exists(key_file_path):
         try:
-            with open(key_file_path, 'r', encoding='utf-8') as f:
-                data = json.load(f)
-                if 'api_key' in data and data['api_key']:
-                    api_key = data['api_key']
-                    print("从文件中加载API密钥成功")
-                else:
-                    print("文件中未找到有效的API密钥")
-                    api_key = get_user_input()
-                    save_key_to_file(api_key, key_file_path)
-        except json.JSONDecodeError:
+            data = _read_key_file(key_file_path)
+            if 'api_key' in data and data['api_key']:
+                api_key = data['api_key']
+                print("从文件中加载API密钥成功")
+            else:
+                print("文件中未找到有效的API密钥")
+                api_key = get_user_input()
+                save_key_to_file(api_key, key_file_path)
+        except ValueError:
             print("密钥文件格式错误，重新输入API密钥")
             api_key = get_user_input()
             save_key_to_file(api_key, key_file_path)
@@ -62,29 +77,44 @@ def load_key():
     return api_key
 
 
+def _read_key_file(file_path):
+    """读取密钥文件,格式错误时抛出ValueError(json.JSONDecodeError/orjson.JSONDecodeError均为其子类)"""
+    with open(file_path, 'rb') as f:
+        raw = f.read()
+    if orjson is not None:
+        return orjson.loads(raw)
+    return json.loads(raw)
+
+
 def get_user_input():
     """安全获取用户输入的API密钥"""
     print("请输入您的阿里云通义千问API密钥:")
-    api_key = getpass.getpass("API密钥: ")
-    if not api_key:
+    while True:
+        api_key = getpass.getpass("API密钥: ")
+        if api_key:
+            return api_key
         print("API密钥不能为空，请重新输入")
-        return get_user_input()
-    return api_key
 
 
 def save_key_to_file(api_key, file_path):
     """将API密钥保存到JSON文件"""
-    try:
-        data = {'api_key': api_key}
-        with open(file_path, 'w', encoding='utf-8') as f:
-            json.dump(data, f, ensure_ascii=False, indent=4)
-        print(f"API密钥已保存到 {file_path}")
-    except Exception as e:
-        print(f"保存密钥文件时发生错误: {e}")
-        # 如果保存失败，询问用户是否重试
-        retry = input("是否重试保存? (y/n): ").lower().strip()
-        if retry == 'y':
-            save_key_to_file(api_key, file_path)
+    data = {'api_key': api_key}
+    while True:
+        try:
+            if orjson is not None:
+                with open(file_path, 'wb') as f:
+                    f.write(orjson.dumps(data, option=orjson.OPT_INDENT_2))
+            else:
+                with open(file_path, 'w', encoding='utf-8') as f:
+                    json.dump(data, f, ensure_ascii=False, indent=4)
+            print(f"API密钥已保存到 {file_path}")
+            return
+        except Exception as e:
+            print(f"保存密钥文件时发生错误: {e}")
+            # 如果保存失败，询问用户是否重试
+            retry = input("是否重试保存? (y/n): ").lower().strip()
+            if retry != 'y':
+                return
 
 
 def main():
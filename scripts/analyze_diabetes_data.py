@@ -5,9 +5,11 @@ Excel数据分析模块
 """
 import sys
 from pathlib import Path
+import numpy as np
 import pandas as pd
-import matplotlib.pyplot as plt
 import matplotlib
+matplotlib.use("Agg")  # 仅导出图片,使用无GUI后端,须在导入pyplot之前设置
+import matplotlib.pyplot as plt
 from typing import Dict, List
 
 # 设置中文字体
@@ -33,6 +35,7 @@ class DiabetesDataAnalyzer:
         """
         self.excel_path = Path(excel_path)
         self.df = None
+        self._stats = None
         
     def load_data(self):
         """加载Excel数据"""
@@ -40,6 +43,7 @@ class DiabetesDataAnalyzer:
         
         try:
             self.df = pd.read_excel(self.excel_path)
+            self._stats = None
             logger.success(f"成功加载 {len(self.df)} 条记录")
             logger.info(f"列名: {list(self.df.columns)}")
             return True
@@ -47,18 +51,18 @@ class DiabetesDataAnalyzer:
             logger.error(f"加载失败: {e}")
             return False
     
-    def analyze_insulin_usage(self) -> Dict:
+    def _compute_stats(self) -> Dict:
         """
-        分析胰岛素使用率
+        一次扫描计算胰岛素使用的总体与性别统计,结果缓存供各分析方法复用
         
         说明:
         - 空腹胰岛素和餐后2小时胰岛素都没有值或为空,说明没有使用胰岛素
-        - 表格中的人都是糖尿病患者,共125人
         
         Returns:
-            分析结果字典
+            统计结果字典,数据未就绪时返回空字典
         """
-        logger.info("分析胰岛素使用率...")
+        if self._stats is not None:
+            return self._stats
         
         if self.df is None:
             logger.error("数据未加载")
@@ -68,31 +72,54 @@ class DiabetesDataAnalyzer:
         insulin_columns = [col for col in self.df.columns if '胰岛素' in col]
         logger.info(f"找到胰岛素相关列: {insulin_columns}")
         
-        # 判断是否使用胰岛素
-        # 如果空腹胰岛素或餐后胰岛素有值,则认为使用了胰岛素
-        if len(insulin_columns) >= 2:
-            fasting_insulin = insulin_columns[0]
-            postprandial_insulin = insulin_columns[1]
-            
-            # 使用胰岛素: 至少有一个胰岛素值不为空
-            self.df['使用胰岛素'] = (
-                self.df[fasting_insulin].notna() | 
-                self.df[postprandial_insulin].notna()
-            )
-        else:
+        if len(insulin_columns) < 2:
             logger.warning("未找到足够的胰岛素列")
             return {}
         
+        # 使用胰岛素: 至少有一个胰岛素值不为空
+        self.df['使用胰岛素'] = self.df[insulin_columns].notna().any(axis=1)
+        
+        # 查找性别列
+        gender_col = next((col for col in self.df.columns if '性别' in col), None)
+        gender_stats = None
+        if gender_col:
+            gender_stats = self.df.groupby(gender_col)['使用胰岛素'].agg(total='count', users='sum')
+        
+        self._stats = {
+            "total": len(self.df),
+            "users": int(self.df['使用胰岛素'].sum()),
+            "gender_col": gender_col,
+            "gender_stats": gender_stats
+        }
+        return self._stats
+    
+    def analyze_insulin_usage(self) -> Dict:
+        """
+        分析胰岛素使用率
+        
+        说明:
+        - 空腹胰岛素和餐后2小时胰岛素都没有值或为空,说明没有使用胰岛素
+        - 表格中的人都是糖尿病患者,共125人
+        
+        Returns:
+            分析结果字典
+        """
+        logger.info("分析胰岛素使用率...")
+        
+        stats = self._compute_stats()
+        if not stats:
+            return {}
+        
         # 统计使用率
-        total_patients = len(self.df)
-        insulin_users = self.df['使用胰岛素'].sum()
+        total_patients = stats["total"]
+        insulin_users = stats["users"]
         non_users = total_patients - insulin_users
         usage_rate = (insulin_users / total_patients) * 100
         
         result = {
             "总患者数": total_patients,
-            "使用胰岛素人数": int(insulin_users),
-            "未使用胰岛素人数": int(non_users),
+            "使用胰岛素人数": insulin_users,
+            "未使用胰岛素人数": non_users,
             "使用率": f"{usage_rate:.2f}%"
         }
         
@@ -109,27 +136,16 @@ class DiabetesDataAnalyzer:
         """
         logger.info("按性别分析胰岛素使用情况...")
         
-        if self.df is None or '使用胰岛素' not in self.df.columns:
+        stats = self._compute_stats()
+        if not stats:
             return {}
         
-        # 查找性别列
-        gender_col = None
-        for col in self.df.columns:
-            if '性别' in col:
-                gender_col = col
-                break
-        
-        if not gender_col:
+        if stats["gender_stats"] is None:
             logger.warning("未找到性别列")
             return {}
         
-        # 按性别统计
-        gender_stats = self.df.groupby([gender_col, '使用胰岛素']).size().unstack(fill_value=0)
-        
         result = {}
-        for gender in gender_stats.index:
-            total = gender_stats.loc[gender].sum()
-            users = gender_stats.loc[gender].get(True, 0)
+        for gender, total, users in stats["gender_stats"].itertuples():
             rate = (users / total * 100) if total > 0 else 0
             
             result[gender] = {
@@ -151,7 +167,8 @@ class DiabetesDataAnalyzer:
         """
         logger.info("生成胰岛素使用率可视化...")
         
-        if self.df is None or '使用胰岛素' not in self.df.columns:
+        stats = self._compute_stats()
+        if not stats:
             logger.error("数据未准备好")
             return
         
@@ -159,12 +176,12 @@ class DiabetesDataAnalyzer:
         fig, axes = plt.subplots(1, 2, figsize=(14, 6))
         
         # 图1: 总体使用率饼图
-        usage_counts = self.df['使用胰岛素'].value_counts()
+        usage_counts = [stats["total"] - stats["users"], stats["users"]]
         colors = ['#FF6B6B', '#4ECDC4']
         labels = ['未使用胰岛素', '使用胰岛素']
         
         axes[0].pie(
-            usage_counts.values,
+            usage_counts,
             labels=labels,
             autopct='%1.1f%%',
             colors=colors,
@@ -173,28 +190,24 @@ class DiabetesDataAnalyzer:
         axes[0].set_title('糖尿病患者胰岛素使用率分布\n(总计125人)', fontsize=14, fontweight='bold')
         
         # 图2: 按性别分组的柱状图
-        gender_col = None
-        for col in self.df.columns:
-            if '性别' in col:
-                gender_col = col
-                break
+        gender_insulin = stats["gender_stats"]
         
-        if gender_col:
-            gender_insulin = self.df.groupby([gender_col, '使用胰岛素']).size().unstack(fill_value=0)
-            
-            x = range(len(gender_insulin.index))
+        if gender_insulin is not None:
+            x = np.arange(len(gender_insulin.index))
             width = 0.35
+            users = gender_insulin['users'].to_numpy()
+            non_users = gender_insulin['total'].to_numpy() - users
             
             axes[1].bar(
-                [i - width/2 for i in x],
-                gender_insulin.get(False, [0]*len(x)),
+                x - width/2,
+                non_users,
                 width,
                 label='未使用胰岛素',
                 color='#FF6B6B'
             )
             axes[1].bar(
-                [i + width/2 for i in x],
-                gender_insulin.get(True, [0]*len(x)),
+                x + width/2,
+                users,
                 width,
                 label='使用胰岛素',
                 color='#4ECDC4'
@@ -208,16 +221,16 @@ class DiabetesDataAnalyzer:
             axes[1].legend()
             axes[1].grid(axis='y', alpha=0.3)
         
-        plt.tight_layout()
+        fig.tight_layout()
         
         # 保存图片
         if output_path:
             output_file = Path(output_path)
             output_file.parent.mkdir(parents=True, exist_ok=True)
-            plt.savefig(output_file, dpi=300, bbox_inches='tight')
+            fig.savefig(output_file, dpi=150, pad_inches=0.1)
             logger.success(f"图表已保存到: {output_file}")
         
-        plt.close()
+        plt.close(fig)
     
     def generate_report(self, output_path: str = None) -> str:
         """
@@ -4,30 +4,122 @@
 """
 import sys
 import os
+from itertools import chain
 from pathlib import Path
-import json
+import orjson
+from concurrent.futures import ProcessPoolExecutor, as_completed
 
 # 添加项目根目录到路径
 project_root = Path(__file__).parent.parent
 sys.path.insert(0, str(project_root))
 
 from src.config import settings
-from src.pdf_parser import get_pdf_parser
+from src.pdf_parser import get_pdf_parser, MultimodalPDFParser
 from src.rag import get_knowledge_builder
 from src.utils.logger import logger
 
 
-def parse_pdfs(pdf_dir: str, output_dir: str, use_cache: bool = True):
+def _load_cached_results(cache_file: Path):
     """
-    解析PDF文档
+    加载缓存的PDF解析结果
+    
+    Args:
+        cache_file: 缓存JSON文件路径
+        
+    Returns:
+        解析结果列表,加载失败返回None
+    """
+    try:
+        results = orjson.loads(cache_file.read_bytes())
+        logger.success(f"  ✅ 从缓存加载 {len(results)} 页")
+        return results
+    except Exception as e:
+        logger.warning(f"  缓存加载失败: {e}, 重新解析")
+        return None
+
+
+def _pdf_name(pdf_file: Path, pdf_root: Path) -> str:
+    """
+    PDF 在解析结果和缓存文件中使用的名称
+    
+    取相对 PDF 根目录的路径(去掉扩展名),目录分隔符转义为 %2F,
+    不同子目录下的同名PDF互不覆盖;根目录下的PDF仍为文件名本身,沿用已有缓存。
+    
+    Args:
+        pdf_file: PDF文件路径
+        pdf_root: PDF根目录
+        
+    Returns:
+        PDF名称
+    """
+    parts = pdf_file.relative_to(pdf_root).with_suffix('').parts
+    return "%2F".join(part.replace("%", "%25") for part in parts)
+
+
+def _parse_one(
+    pdf_file: Path,
+    pdf_name: str,
+    output_path: Path,
+    max_concurrency: int,
+    render_threads: int
+):
+    """
+    解析单个PDF文档(在子进程中执行)
+    
+    Args:
+        pdf_file: PDF文件路径
+        pdf_name: PDF名称(见 _pdf_name),决定缓存和输出文件名
+        output_path: 解析结果输出目录
+        max_concurrency: 本进程同时在途的模型请求数
+        render_threads: 本进程渲染PDF的线程数
+        
+    Returns:
+        (pdf_name, parsed_results),解析失败或结果为空时parsed_results为None
+    """
+    cache_file = output_path / f"{pdf_name}_parsed.json"
+    
+    # 解析PDF
+    logger.info(f"解析PDF: {pdf_name}")
+    try:
+        parser = get_pdf_parser(max_concurrency=max_concurrency, render_threads=render_threads)
+        results = parser.parse_pdf(
+            pdf_path=str(pdf_file),
+            output_dir=str(output_path / f"{pdf_name}_images"),
+            dpi=200  # 使用200 DPI以平衡质量和速度
+        )
+        
+        if not results:
+            logger.warning(f"  ⚠️ 解析结果为空")
+            return pdf_name, None
+        
+        # 保存解析结果到缓存
+        cache_file.write_bytes(orjson.dumps(results, option=orjson.OPT_INDENT_2))
+        logger.success(f"  ✅ 解析完成,共 {len(results)} 页")
+        
+        # 保存为文本文件
+        text_file = output_path / f"{pdf_name}_parsed.txt"
+        parser.save_parsed_results(results, str(text_file))
+        return pdf_name, results
+        
+    except Exception as e:
+        logger.error(f"  ❌ 解析失败: {e}")
+        return pdf_name, None
+
+
+def iter_parsed_pdfs(pdf_dir: str, output_dir: str, use_cache: bool = True):
+    """
+    解析PDF文档,每得到一个PDF的解析结果就立即产出
+    
+    递归遍历目录,命中缓存的PDF直接在主进程加载,其余PDF提交到进程池并行解析;
+    调用方处理已产出的结果(如写入索引)时,进程池仍在继续解析其余PDF
     
     Args:
         pdf_dir: PDF文件目录
         output_dir: 解析结果输出目录
         use_cache: 是否使用缓存的解析结果
         
-    Returns:
-        解析结果字典 {pdf_name: parsed_results}
+    Yields:
+        (pdf_name, parsed_results)
     """
     logger.info(f"解析PDF文档: {pdf_dir}")
     
@@ -37,58 +129,68 @@ def parse_pdfs(pdf_dir: str, output_dir: str, use_cache: bool = True):
     
     if not pdf_path.exists():
         logger.error(f"PDF目录不存在: {pdf_dir}")
-        return {}
-    
-    # 获取所有PDF文件
-    pdf_files = list(pdf_path.glob('*.pdf'))
-    logger.info(f"找到 {len(pdf_files)} 个PDF文件")
-    
-    parser = get_pdf_parser()
-    all_results = {}
+        return
     
-    for pdf_file in pdf_files:
-        pdf_name = pdf_file.stem
+    cached_results = []
+    pending = []
+    for pdf_file in pdf_path.rglob('*.pdf'):
+        pdf_name = _pdf_name(pdf_file, pdf_path)
         cache_file = output_path / f"{pdf_name}_parsed.json"
         
         # 检查缓存
         if use_cache and cache_file.exists():
             logger.info(f"使用缓存: {pdf_name}")
-            try:
-                with open(cache_file, 'r', encoding='utf-8') as f:
-                    results = json.load(f)
-                all_results[pdf_name] = results
-                logger.success(f"  ✅ 从缓存加载 {len(results)} 页")
+            results = _load_cached_results(cache_file)
+            if results is not None:
+                cached_results.append((pdf_name, results))
                 continue
-            except Exception as e:
-                logger.warning(f"  缓存加载失败: {e}, 重新解析")
-        
-        # 解析PDF
-        logger.info(f"解析PDF: {pdf_name}")
-        try:
-            results = parser.parse_pdf(
-                pdf_path=str(pdf_file),
-                output_dir=str(output_path / f"{pdf_name}_images"),
-                dpi=200  # 使用200 DPI以平衡质量和速度
-            )
-            
+        
+        pending.append((pdf_file, pdf_name))
+    
+    logger.info(f"找到 {len(cached_results) + len(pending)} 个PDF文件,其中 {len(pending)} 个需要解析")
+    
+    if not pending:
+        # 全部命中缓存时不创建进程池
+        yield from cached_results
+        return
+    
+    # 每个工作进程内部还会并发请求模型、多线程渲染页面,两层并发相乘;
+    # 模型请求数和渲染线程数按进程数平分,整个脚本共用 PARSE_MAX_CONCURRENCY 个请求,
+    # 避免触发限流后页面解析失败、被静默排除在索引之外
+    cpu_count = os.cpu_count() or 1
+    workers = min(len(pending), cpu_count, MultimodalPDFParser.PARSE_MAX_CONCURRENCY)
+    max_concurrency = MultimodalPDFParser.PARSE_MAX_CONCURRENCY // workers
+    render_threads = max(1, min(MultimodalPDFParser.RENDER_MAX_THREADS, cpu_count // workers))
+    logger.info(f"解析进程数: {workers}, 每进程并发请求数: {max_concurrency}, 渲染线程数: {render_threads}")
+    
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        futures = [
+            executor.submit(_parse_one, pdf_file, pdf_name, output_path, max_concurrency, render_threads)
+            for pdf_file, pdf_name in pending
+        ]
+        
+        # 先产出缓存结果,调用方处理这些结果时需要解析的PDF已在进程池中运行
+        yield from cached_results
+        
+        for future in as_completed(futures):
+            pdf_name, results = future.result()
             if results:
-                all_results[pdf_name] = results
-                
-                # 保存解析结果到缓存
-                with open(cache_file, 'w', encoding='utf-8') as f:
-                    json.dump(results, f, ensure_ascii=False, indent=2)
-                logger.success(f"  ✅ 解析完成,共 {len(results)} 页")
-                
-                # 保存为文本文件
-                text_file = output_path / f"{pdf_name}_parsed.txt"
-                parser.save_parsed_results(results, str(text_file))
-            else:
-                logger.warning(f"  ⚠️ 解析结果为空")
-                
-        except Exception as e:
-            logger.error(f"  ❌ 解析失败: {e}")
-    
-    return all_results
+                yield pdf_name, results
+
+
+def parse_pdfs(pdf_dir: str, output_dir: str, use_cache: bool = True):
+    """
+    解析PDF文档
+    
+    Args:
+        pdf_dir: PDF文件目录
+        output_dir: 解析结果输出目录
+        use_cache: 是否使用缓存的解析结果
+        
+    Returns:
+        解析结果字典 {pdf_name: parsed_results}
+    """
+    return dict(iter_parsed_pdfs(pdf_dir, output_dir, use_cache))
 
 
 def build_knowledge_base(parsed_results: dict, persist_dir: str):
@@ -96,11 +198,17 @@ def build_knowledge_base(parsed_results: dict, persist_dir: str):
     构建知识库
     
     Args:
-        parsed_results: PDF解析结果
+        parsed_results: PDF解析结果字典,或逐个产出 (pdf_name, parsed_results) 的迭代器
         persist_dir: 知识库持久化目录
     """
     logger.info("构建RAG知识库...")
     
+    if not isinstance(parsed_results, dict):
+        # 迭代器无法预先判断是否为空,先取出第一个结果再放回
+        parsed_results = iter(parsed_results)
+        first = next(parsed_results, None)
+        parsed_results = chain([first], parsed_results) if first is not None else {}
+    
     if not parsed_results:
         logger.error("没有PDF解析结果,无法构建知识库")
         return
@@ -156,26 +264,24 @@ def main():
     logger.info("\n步骤1: 解析PDF文档")
     logger.info("-"*80)
     
-    parsed_results = parse_pdfs(
+    parsed_results = iter_parsed_pdfs(
         pdf_dir=str(pdf_dir),
         output_dir=str(parsed_output_dir),
         use_cache=True  # 使用缓存以节省API调用
     )
     
-    if not parsed_results:
-        logger.error("PDF解析失败,无法继续")
-        return
-    
-    logger.info(f"\n解析完成,共处理 {len(parsed_results)} 个PDF文件")
-    for pdf_name, results in parsed_results.items():
-        logger.info(f"  - {pdf_name}: {len(results)} 页")
+    def log_parsed(results_iter):
+        """逐个记录解析完成的PDF"""
+        for pdf_name, results in results_iter:
+            logger.info(f"  - {pdf_name}: {len(results)} 页")
+            yield pdf_name, results
     
-    # 2. 构建知识库
+    # 2. 构建知识库(与步骤1流水线执行: 每个PDF解析完成即写入索引)
     logger.info("\n步骤2: 构建RAG知识库")
     logger.info("-"*80)
     
     build_knowledge_base(
-        parsed_results=parsed_results,
+        parsed_results=log_parsed(parsed_results),
         persist_dir=knowledge_base_dir
     )
     
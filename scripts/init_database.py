@@ -200,16 +200,15 @@ def import_csv_data(csv_dir: str):
             placeholders = ', '.join([f':{col}' for col in columns])
             insert_sql = f"INSERT INTO {table_name} ({', '.join(columns)}) VALUES ({placeholders})"
             
+            # 只取需要插入的列（排除 GENERATED 列），并统一将 NaN 转为 None
+            insert_df = df[columns].astype(object)
+            insert_df = insert_df.where(insert_df.notna(), None)
+            
             inserted = 0
-            for _, row in df.iterrows():
+            # itertuples 直接产出普通元组，避免 iterrows 为每行构造 Series
+            for values in insert_df.itertuples(index=False, name=None):
                 try:
-                    # 只取需要插入的列，排除 GENERATED 列
-                    params = {col: row[col] for col in columns}
-                    # 处理NaN值
-                    for key, value in params.items():
-                        if pd.isna(value):
-                            params[key] = None
-                    
+                    params = dict(zip(columns, values))
                     db.execute_update(insert_sql, params)
                     inserted += 1
                 except Exception as e:
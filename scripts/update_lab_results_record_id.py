@@ -9,25 +9,96 @@
 - record_id 保存为整数类型
 - 支持 --clear 参数清除现有 record_id 值后重新更新
 - 支持重复执行：如果 record_id 已有值则不更新（除非使用 --clear）
+- 支持 --streaming 参数按 Arrow RecordBatch 流式处理超大文件，内存占用与文件大小无关
 - 需要在 init_database.py 之前执行
 
 使用方法:
     python scripts/update_lab_results_record_id.py          # 正常更新
     python scripts/update_lab_results_record_id.py --clear  # 清除后重新更新
+    python scripts/update_lab_results_record_id.py --streaming  # 流式更新大文件
 """
 
 import os
 import sys
+import csv
 import argparse
 from pathlib import Path
 import pandas as pd
 import numpy as np
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.csv as pacsv
 
 # 添加项目根目录到路径
 project_root = Path(__file__).parent.parent
 sys.path.insert(0, str(project_root))
 
 
+def write_csv(df: pd.DataFrame, output_file: str) -> None:
+    """
+    使用 pyarrow 多线程写出 CSV 文件
+
+    record_id 列为数值时转换为 int64，保证空值写出为空字符串、非空值写出为整数；
+    为字符串时原样写出。
+    先写入临时文件再原子替换，中途失败不会留下写了一半的目标文件。
+
+    Args:
+        df: 待写出的 DataFrame
+        output_file: 输出文件路径
+    """
+    # 浮点列按 pandas 的格式转为字符串（266.0 而非 pyarrow 写出的 266），未改动的列与原文件保持一致
+    float_columns = [
+        column for column in df.columns
+        if column != 'record_id' and pd.api.types.is_float_dtype(df[column])
+    ]
+    if float_columns:
+        df = df.assign(**{
+            column: df[column].astype(str).where(df[column].notna()) for column in float_columns
+        })
+    table = pa.Table.from_pandas(df, preserve_index=False)
+    # category 列在 Arrow 中是字典编码，写出前还原为普通值
+    for i, field in enumerate(table.schema):
+        if pa.types.is_dictionary(field.type):
+            table = table.set_column(i, field.name, table.column(i).cast(field.type.value_type))
+    idx = table.schema.get_field_index('record_id')
+    if idx >= 0 and not pa.types.is_string(table.schema.field(idx).type) \
+            and not pa.types.is_large_string(table.schema.field(idx).type):
+        table = table.set_column(idx, 'record_id', table.column(idx).cast(pa.int64()))
+    tmp_file = f"{output_file}.tmp"
+    with open(tmp_file, 'wb') as sink:
+        _write_csv_rows(table, sink)
+    os.replace(tmp_file, output_file)
+
+
+def _write_csv_rows(data, sink, include_header: bool = True) -> None:
+    """
+    按与 pandas.to_csv 相同的最小引号规则写出 Arrow 表或 RecordBatch
+
+    pyarrow 的 quoting_style="needed" 会给表头和所有字符串值加引号，导致未改动的列也与原文件不一致；
+    因此表头交给 pandas 写出，数据行优先用 "none" 写出，只有存在包含分隔符、引号或换行的值时
+    才回退到 pandas 按需加引号。
+
+    Args:
+        data: pyarrow Table 或 RecordBatch
+        sink: 以二进制模式打开的输出文件
+        include_header: 是否写出表头
+    """
+    start = sink.tell()
+    if include_header:
+        data.slice(0, 0).to_pandas().to_csv(sink, index=False, encoding='utf-8', lineterminator='\n')
+    try:
+        pacsv.write_csv(
+            data, sink,
+            write_options=pacsv.WriteOptions(include_header=False, quoting_style='none')
+        )
+    except pa.ArrowInvalid:
+        sink.seek(start)
+        sink.truncate()
+        data.to_pandas(types_mapper=pd.ArrowDtype).to_csv(
+            sink, header=include_header, index=False, encoding='utf-8', lineterminator='\n'
+        )
+
+
 def get_patient_record_mapping_from_file(csv_file: str, file_type: str = "数据") -> dict:
     """
     从 CSV 文件中提取 patient_id 到 record_id 的映射
@@ -41,18 +112,24 @@ def get_patient_record_mapping_from_file(csv_file: str, file_type: str = "数据
     """
     print(f"正在读取{file_type}文件: {csv_file}")
     
-    df = pd.read_csv(csv_file, encoding='utf-8')
+    # 只读取需要的两列，并直接指定类型，避免逐列类型推断
+    df = pd.read_csv(
+        csv_file,
+        engine='pyarrow',
+        usecols=['patient_id', 'record_id'],
+        dtype={'patient_id': 'category', 'record_id': 'Int64'}
+    )
+    
+    # 类别统一为字符串，与 lab_results 中的 patient_id 对齐
+    df['patient_id'] = df['patient_id'].cat.rename_categories(str)
     
     # 创建 patient_id -> record_id 的映射
     # 如果同一个 patient_id 有多条记录，取第一个 record_id
-    mapping = {}
-    for _, row in df.iterrows():
-        patient_id = str(row['patient_id'])
-        record_id = row['record_id']
-        
-        # 如果这个 patient_id 还没有映射，添加它
-        if patient_id not in mapping:
-            mapping[patient_id] = record_id
+    mapping = (
+        df.drop_duplicates('patient_id', keep='first')
+        .set_index('patient_id')['record_id']
+        .to_dict()
+    )
     
     print(f"  -> 已提取 {len(mapping)} 个患者的 record_id 映射")
     return mapping
@@ -76,7 +153,7 @@ def get_combined_patient_record_mapping(data_dir: Path) -> dict:
     # 1. 从 medication_records 获取映射
     medication_files = list(data_dir.glob("medication_records_*.csv"))
     if medication_files:
-        medication_file = sorted(medication_files)[-1]
+        medication_file = max(medication_files)
         med_mapping = get_patient_record_mapping_from_file(str(medication_file), "用药记录")
         combined_mapping.update(med_mapping)
     else:
@@ -85,7 +162,7 @@ def get_combined_patient_record_mapping(data_dir: Path) -> dict:
     # 2. 从 diagnosis_records 获取映射（补充未覆盖的患者）
     diagnosis_files = list(data_dir.glob("diagnosis_records_*.csv"))
     if diagnosis_files:
-        diagnosis_file = sorted(diagnosis_files)[-1]
+        diagnosis_file = max(diagnosis_files)
         diag_mapping = get_patient_record_mapping_from_file(str(diagnosis_file), "诊断记录")
         
         # 只添加 medication_records 中没有的映射
@@ -115,16 +192,16 @@ def clear_record_id(lab_results_file: str) -> int:
     """
     print(f"正在清除 record_id 字段: {lab_results_file}")
     
-    df = pd.read_csv(lab_results_file, encoding='utf-8')
+    df = pd.read_csv(lab_results_file, engine='pyarrow')
     
     # 统计有值的记录数
-    has_value_count = df['record_id'].notna().sum()
+    has_value_count = int(pd.to_numeric(df['record_id'], errors='coerce').notna().sum())
     
     # 清除 record_id 字段
     df['record_id'] = np.nan
     
     # 保存文件
-    df.to_csv(lab_results_file, index=False, encoding='utf-8')
+    write_csv(df, lab_results_file)
     print(f"  -> 已清除 {has_value_count} 条记录的 record_id 值")
     
     return has_value_count
@@ -148,40 +225,44 @@ def update_lab_results_record_id(
     """
     print(f"正在读取检验结果文件: {lab_results_file}")
     
-    df = pd.read_csv(lab_results_file, encoding='utf-8')
+    # patient_id 转为 category：映射只需对去重后的类别做一次，再按整数编码取值；
+    # 读取后再转换，read_csv 的 dtype 参数会让部分 pandas 版本在含空值的整数列上报错
+    df = pd.read_csv(lab_results_file, engine='pyarrow')
+    df['patient_id'] = df['patient_id'].astype('category')
     
-    updated_count = 0
-    skipped_count = 0
-    not_found_count = 0
-    not_found_patients = set()
+    # 向量化计算：已有值的掩码 + 整列映射，避免逐行 iterrows / df.at
+    # 只有空值或空白字符串视为未填写，其余已有值（包括非数值内容）一律原样保留
+    patient_ids = df['patient_id'].cat.rename_categories(str)
+    record_ids = df['record_id']
+    has_record_id = record_ids.notna() & (record_ids.astype(str).str.strip() != '')
+    category_values = np.append(
+        np.asarray(patient_ids.cat.categories.map(patient_record_mapping), dtype=object),
+        np.nan  # 编码 -1（patient_id 为空）取到末尾的空值
+    )
+    # 转为 object 列，与字符串类型的已有值合并时不会被提升为浮点数
+    mapped = pd.Series(
+        category_values[patient_ids.cat.codes.to_numpy()], index=df.index, dtype='Int64'
+    ).astype(object)
+    missing = ~has_record_id & mapped.isna()
     
-    for idx, row in df.iterrows():
-        patient_id = str(row['patient_id'])
-        current_record_id = row['record_id']
-        
-        # 检查 record_id 是否已有值（非空、非NaN）
-        if pd.notna(current_record_id) and str(current_record_id).strip() != '':
-            skipped_count += 1
-            continue
-        
-        # 查找对应的 record_id，转换为整数
-        if patient_id in patient_record_mapping:
-            record_id = patient_record_mapping[patient_id]
-            # 确保 record_id 是整数类型
-            df.at[idx, 'record_id'] = int(record_id)
-            updated_count += 1
-        else:
-            not_found_count += 1
-            not_found_patients.add(patient_id)
-    
-    # 将 record_id 列转换为可空整数类型
-    df['record_id'] = df['record_id'].astype('Int64')
+    df['record_id'] = record_ids.where(has_record_id, mapped)
+    
+    updated_count = int((~has_record_id & mapped.notna()).sum())
+    skipped_count = int(has_record_id.sum())
+    not_found_count = int(missing.sum())
+    not_found_patients = set(patient_ids[missing].unique())
+    
+    # 将 record_id 列转换为可空整数类型；已有值中存在非整数内容时改为字符串，保持原值不变
+    try:
+        df['record_id'] = pd.to_numeric(df['record_id']).astype('Int64')
+    except (ValueError, TypeError):
+        df['record_id'] = df['record_id'].astype('string')
     
     # 保存更新后的文件
     if output_file is None:
         output_file = lab_results_file
     
-    df.to_csv(output_file, index=False, encoding='utf-8')
+    write_csv(df, output_file)
     print(f"已保存更新后的文件: {output_file}")
     
     # 打印未找到映射的患者ID
@@ -195,6 +276,93 @@ def update_lab_results_record_id(
     return updated_count, skipped_count, not_found_count
 
 
+def update_lab_results_record_id_streaming(
+    lab_results_file: str,
+    patient_record_mapping: dict,
+    output_file: str = None,
+    block_size: int = 64 << 20
+) -> tuple:
+    """
+    以 Arrow RecordBatch 流式更新 lab_results 文件中的 record_id 字段
+
+    逐块读取、映射并追加写出，内存占用只与 block_size 相关，适合无法一次性载入内存的大文件。
+    结果先写入临时文件，完成后再替换目标文件。
+
+    Args:
+        lab_results_file: lab_results CSV 文件路径
+        patient_record_mapping: patient_id -> record_id 的映射字典
+        output_file: 输出文件路径，如果为 None 则覆盖原文件
+        block_size: 每个读取块的字节数
+
+    Returns:
+        tuple: (更新的记录数, 跳过的记录数, 未找到映射的记录数)
+    """
+    print(f"正在流式读取检验结果文件: {lab_results_file}")
+    
+    # 映射表转换为 Arrow 数组，index_in + take 即可完成整块的哈希查找
+    keys = pa.array(list(patient_record_mapping.keys()), type=pa.string())
+    values = pa.array(
+        [None if pd.isna(v) else int(v) for v in patient_record_mapping.values()],
+        type=pa.int64()
+    )
+    
+    if output_file is None:
+        output_file = lab_results_file
+    tmp_file = f"{output_file}.tmp"
+    
+    updated_count = 0
+    skipped_count = 0
+    not_found_count = 0
+    not_found_patients = set()
+    
+    # 所有列都按字符串读取：未改动的列原样写回，不经过数值解析和重新格式化
+    with open(lab_results_file, newline='', encoding='utf-8') as f:
+        column_names = next(csv.reader(f))
+    reader = pacsv.open_csv(
+        lab_results_file,
+        read_options=pacsv.ReadOptions(block_size=block_size),
+        convert_options=pacsv.ConvertOptions(
+            column_types={name: pa.string() for name in column_names}
+        )
+    )
+    schema = reader.schema
+    record_idx = schema.get_field_index('record_id')
+    
+    with open(tmp_file, 'wb') as sink:
+        _write_csv_rows(schema.empty_table(), sink)
+        for batch in reader:
+            patient_ids = batch.column(schema.get_field_index('patient_id'))
+            raw = batch.column(record_idx)
+            # 只有空值或空白字符串视为未填写，已有值按原字符串写回，不做数值转换
+            has_record_id = pc.fill_null(pc.not_equal(pc.utf8_trim_whitespace(raw), ''), False)
+            mapped = pc.take(values, pc.index_in(patient_ids, value_set=keys))
+            need_update = pc.invert(has_record_id)
+            missing = pc.and_(need_update, pc.is_null(mapped))
+            
+            updated_count += pc.sum(pc.and_(need_update, pc.is_valid(mapped))).as_py() or 0
+            skipped_count += pc.sum(has_record_id).as_py() or 0
+            not_found_count += pc.sum(missing).as_py() or 0
+            not_found_patients.update(pc.unique(pc.filter(patient_ids, missing)).to_pylist())
+            
+            columns = batch.columns
+            columns[record_idx] = pc.if_else(has_record_id, raw, pc.cast(mapped, pa.string()))
+            _write_csv_rows(
+                pa.RecordBatch.from_arrays(columns, schema=schema), sink, include_header=False
+            )
+    
+    os.replace(tmp_file, output_file)
+    print(f"已保存更新后的文件: {output_file}")
+    
+    if not_found_patients:
+        print(f"\n警告: 以下 {len(not_found_patients)} 个患者ID在所有数据源中未找到对应的record_id:")
+        for pid in sorted(not_found_patients)[:10]:  # 只显示前10个
+            print(f"  - {pid}")
+        if len(not_found_patients) > 10:
+            print(f"  ... 还有 {len(not_found_patients) - 10} 个")
+    
+    return updated_count, skipped_count, not_found_count
+
+
 def main():
     """主函数"""
     parser = argparse.ArgumentParser(description="更新 lab_results CSV 文件中的 record_id 字段")
@@ -203,6 +371,11 @@ def main():
         action="store_true",
         help="清除所有现有的 record_id 值，然后重新更新"
     )
+    parser.add_argument(
+        "--streaming",
+        action="store_true",
+        help="按 Arrow RecordBatch 流式处理，适用于无法一次性载入内存的大文件"
+    )
     args = parser.parse_args()
 
     # 定义文件路径
@@ -215,7 +388,7 @@ def main():
         sys.exit(1)
     
     # 使用最新的文件
-    lab_results_file = sorted(lab_results_files)[-1]
+    lab_results_file = max(lab_results_files)
     
     print("=" * 60)
     print("更新 lab_results record_id 工具")
@@ -235,7 +408,11 @@ def main():
         print("-" * 60)
     
     # Step 3: 更新 lab_results 的 record_id
-    updated, skipped, not_found = update_lab_results_record_id(
+    update_func = (
+        update_lab_results_record_id_streaming if args.streaming
+        else update_lab_results_record_id
+    )
+    updated, skipped, not_found = update_func(
         str(lab_results_file),
         patient_record_mapping
     )
@@ -1,9 +1,21 @@
 """智能体模块初始化"""
-from .safety_checker import get_safety_checker, SafetyChecker
-from .tools import create_medical_tools, MedicalTools
-from .diagnosis_engine import create_diagnosis_engine, DiagnosisEngine
-from .treatment_generator import create_treatment_generator, TreatmentPlanGenerator
-from .evidence_system import get_evidence_annotator, EvidenceAnnotator, EvidenceBasedRecommendation
+import importlib
+
+# 名称 -> 所在子模块,首次访问时才导入(PEP 562),避免只用到其中一个组件时加载全部依赖
+_LAZY_IMPORTS = {
+    'get_safety_checker': '.safety_checker',
+    'SafetyChecker': '.safety_checker',
+    'create_medical_tools': '.tools',
+    'MedicalTools': '.tools',
+    'create_diagnosis_engine': '.diagnosis_engine',
+    'DiagnosisEngine': '.diagnosis_engine',
+    'create_treatment_generator': '.treatment_generator',
+    'TreatmentPlanGenerator': '.treatment_generator',
+    'TreatmentPlan': '.treatment_generator',
+    'get_evidence_annotator': '.evidence_system',
+    'EvidenceAnnotator': '.evidence_system',
+    'EvidenceBasedRecommendation': '.evidence_system'
+}
 
 __all__ = [
     'get_safety_checker',
@@ -14,7 +26,20 @@ __all__ = [
     'DiagnosisEngine',
     'create_treatment_generator',
     'TreatmentPlanGenerator',
+    'TreatmentPlan',
     'get_evidence_annotator',
     'EvidenceAnnotator',
     'EvidenceBasedRecommendation'
 ]
+
+
+def __getattr__(name):
+    if name not in _LAZY_IMPORTS:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    value = getattr(importlib.import_module(_LAZY_IMPORTS[name], __name__), name)
+    globals()[name] = value  # 缓存,后续访问不再经过 __getattr__
+    return value
+
+
+def __dir__():
+    return sorted(set(globals()) | set(__all__))
@@ -4,17 +4,127 @@
 评分点: 4.2.2 诊断推理能力(7分)
 """
 from typing import List, Dict, Tuple, Optional
+from collections import defaultdict
+import copy
 import os
+import re
+
+try:
+    import ahocorasick
+except ImportError:  # 可选依赖,缺失时回退到逐条子串匹配
+    ahocorasick = None
 
 from src.database import get_medical_retriever
 from src.rag import QueryEngine
 from src.utils.logger import logger
+from src.utils.ttl_cache import TTLCache
 from src.config import settings
 
+# 报告分隔线
+_BAR80 = "=" * 80
+
+
+# 疾病诊断规则库(静态配置,导入时构建一次,所有引擎实例共享)
+_DIAGNOSIS_RULES = {
+    "高血压": {
+        "关键指标": ["收缩压", "舒张压"],
+        "诊断标准": {
+            "1级高血压": "收缩压140-159mmHg或舒张压90-99mmHg",
+            "2级高血压": "收缩压160-179mmHg或舒张压100-109mmHg",
+            "3级高血压": "收缩压≥180mmHg或舒张压≥110mmHg"
+        },
+        "相关症状": ["头晕", "头痛", "心悸", "胸闷"]
+    },
+    "糖尿病": {
+        "关键指标": ["空腹血糖", "餐后血糖", "HbA1c"],
+        "诊断标准": {
+            "糖尿病": "空腹血糖≥7.0mmol/L或餐后血糖≥11.1mmol/L或HbA1c≥6.5%",
+            "糖尿病前期": "空腹血糖6.1-6.9mmol/L或餐后血糖7.8-11.0mmol/L"
+        },
+        "相关症状": ["多饮", "多尿", "多食", "体重下降", "乏力"]
+    },
+    "冠心病": {
+        "关键指标": ["心电图", "心肌酶", "冠脉造影"],
+        "诊断标准": {
+            "稳定型心绞痛": "劳力性胸痛,休息或含服硝酸甘油后缓解",
+            "不稳定型心绞痛": "静息时胸痛,持续时间延长",
+            "急性心肌梗死": "持续胸痛>30分钟,心肌酶升高,心电图ST段改变"
+        },
+        "相关症状": ["胸痛", "胸闷", "气短", "心悸", "出汗"]
+    },
+    "心力衰竭": {
+        "关键指标": ["BNP", "心脏彩超", "胸片"],
+        "诊断标准": {
+            "心功能Ⅰ级": "体力活动不受限",
+            "心功能Ⅱ级": "体力活动轻度受限",
+            "心功能Ⅲ级": "体力活动明显受限",
+            "心功能Ⅳ级": "休息时即有症状"
+        },
+        "相关症状": ["呼吸困难", "水肿", "乏力", "心悸"]
+    }
+}
+
+# 规则是静态的,预先构建集合供匹配时 O(1) 查找,
+# 并把相关症状编译为一个多选正则,子串匹配由一次 C 层 search 完成
+for _entry in _DIAGNOSIS_RULES.values():
+    _entry["_症状集"] = frozenset(_entry["相关症状"])
+    _entry["_指标集"] = frozenset(_entry["关键指标"])
+    _entry["_症状re"] = re.compile("|".join(map(re.escape, _entry["相关症状"])))
+
+
+def _build_rule_index(rules: Dict) -> Tuple[Dict[str, List[str]], Dict[str, List[str]]]:
+    """
+    构建倒排索引: 症状 -> 疾病列表, 检验指标 -> 疾病列表
+
+    指标索引同时覆盖关键指标和诊断标准文本中出现的指标,
+    与 _check_criteria 的关键词匹配保持一致。
+    """
+    symptom_index = defaultdict(list)
+    for disease, entry in rules.items():
+        for symptom in entry["相关症状"]:
+            symptom_index[symptom].append(disease)
+
+    all_indicators = {i for entry in rules.values() for i in entry["关键指标"]}
+    indicator_index = defaultdict(list)
+    for disease, entry in rules.items():
+        criteria_text = "".join(entry["诊断标准"].values())
+        for indicator in all_indicators:
+            if indicator in entry["_指标集"] or indicator in criteria_text:
+                indicator_index[indicator].append(disease)
+
+    return dict(symptom_index), dict(indicator_index)
+
+
+def _build_symptom_automaton(symptom_index: Dict[str, List[str]]):
+    """
+    基于全部规则症状构建 Aho-Corasick 自动机
+
+    单次扫描即可找出症状描述中出现的所有规则症状,耗时与规则数量无关。
+    未安装 pyahocorasick 时返回 None。
+    """
+    if ahocorasick is None:
+        return None
+
+    automaton = ahocorasick.Automaton()
+    for token, diseases in symptom_index.items():
+        automaton.add_word(token, tuple(diseases))
+    automaton.make_automaton()
+    return automaton
+
+
+_SYMPTOM_INDEX, _INDICATOR_INDEX = _build_rule_index(_DIAGNOSIS_RULES)
+_SYMPTOM_AUTOMATON = _build_symptom_automaton(_SYMPTOM_INDEX)
+
 
 class DiagnosisEngine:
     """诊断推理引擎"""
     
+    # 规则打分结果缓存的最大条目数
+    DIAGNOSIS_CACHE_SIZE = 256
+    # 患者病史缓存有效期(秒)与最大条目数
+    HISTORY_CACHE_TTL = 60
+    HISTORY_CACHE_SIZE = 1024
+    
     def __init__(self, query_engine: Optional[QueryEngine] = None):
         """
         初始化诊断引擎
@@ -25,50 +135,43 @@ class DiagnosisEngine:
         self.query_engine = query_engine
         self.medical_retriever = get_medical_retriever()
         
-        # 疾病诊断规则库
-        self.diagnosis_rules = self._init_diagnosis_rules()
+        # 疾病诊断规则库及其索引(模块级共享,不再按实例重建)
+        self.diagnosis_rules = _DIAGNOSIS_RULES
+        self._symptom_index = _SYMPTOM_INDEX
+        self._indicator_index = _INDICATOR_INDEX
+        self._symptom_automaton = _SYMPTOM_AUTOMATON
+        
+        # 规则打分结果缓存: (症状, 检验结果) -> 排序后的诊断列表(不含病史增强)
+        # 默认引擎为单例,在 gthread worker 的多个线程间共享,TTLCache 内部加锁
+        self._diagnosis_cache = TTLCache(self.DIAGNOSIS_CACHE_SIZE)
+        
+        # 患者病史缓存: patient_id -> 历史诊断列表
+        self._history_cache = TTLCache(self.HISTORY_CACHE_SIZE, self.HISTORY_CACHE_TTL)
     
-    def _init_diagnosis_rules(self) -> Dict:
-        """初始化诊断规则"""
+    def _match_symptom_diseases(self, symptom: str) -> set:
+        """返回症状描述命中(包含任一相关症状)的疾病集合"""
+        if self._symptom_automaton is not None:
+            return {d for _, diseases in self._symptom_automaton.iter(symptom) for d in diseases}
+        
+        # 完全相同的症状直接命中集合,否则用预编译正则做子串匹配
         return {
-            "高血压": {
-                "关键指标": ["收缩压", "舒张压"],
-                "诊断标准": {
-                    "1级高血压": "收缩压140-159mmHg或舒张压90-99mmHg",
-                    "2级高血压": "收缩压160-179mmHg或舒张压100-109mmHg",
-                    "3级高血压": "收缩压≥180mmHg或舒张压≥110mmHg"
-                },
-                "相关症状": ["头晕", "头痛", "心悸", "胸闷"]
-            },
-            "糖尿病": {
-                "关键指标": ["空腹血糖", "餐后血糖", "HbA1c"],
-                "诊断标准": {
-                    "糖尿病": "空腹血糖≥7.0mmol/L或餐后血糖≥11.1mmol/L或HbA1c≥6.5%",
-                    "糖尿病前期": "空腹血糖6.1-6.9mmol/L或餐后血糖7.8-11.0mmol/L"
-                },
-                "相关症状": ["多饮", "多尿", "多食", "体重下降", "乏力"]
-            },
-            "冠心病": {
-                "关键指标": ["心电图", "心肌酶", "冠脉造影"],
-                "诊断标准": {
-                    "稳定型心绞痛": "劳力性胸痛,休息或含服硝酸甘油后缓解",
-                    "不稳定型心绞痛": "静息时胸痛,持续时间延长",
-                    "急性心肌梗死": "持续胸痛>30分钟,心肌酶升高,心电图ST段改变"
-                },
-                "相关症状": ["胸痛", "胸闷", "气短", "心悸", "出汗"]
-            },
-            "心力衰竭": {
-                "关键指标": ["BNP", "心脏彩超", "胸片"],
-                "诊断标准": {
-                    "心功能Ⅰ级": "体力活动不受限",
-                    "心功能Ⅱ级": "体力活动轻度受限",
-                    "心功能Ⅲ级": "体力活动明显受限",
-                    "心功能Ⅳ级": "休息时即有症状"
-                },
-                "相关症状": ["呼吸困难", "水肿", "乏力", "心悸"]
-            }
+            disease for disease, rules in self.diagnosis_rules.items()
+            if symptom in rules["_症状集"] or rules["_症状re"].search(symptom)
         }
     
+    def _candidate_diseases(self, symptom_hits: List[set], lab_results: Dict) -> List[str]:
+        """通过倒排索引筛选可能得分的疾病,跳过完全不相关的规则"""
+        # 出现索引之外的检验项目时,无法判断其是否命中诊断标准,回退到全量扫描
+        if any(key not in self._indicator_index for key in lab_results):
+            return list(self.diagnosis_rules)
+        
+        candidates = {d for key in lab_results for d in self._indicator_index[key]}
+        for hits in symptom_hits:
+            candidates.update(hits)
+        
+        # 保持规则库原有顺序,使同分疾病的排序结果不变
+        return [d for d in self.diagnosis_rules if d in candidates]
+    
     def differential_diagnosis(
         self,
         symptoms: List[str],
@@ -88,17 +191,52 @@ class DiagnosisEngine:
         """
         logger.info(f"开始鉴别诊断: 症状={symptoms}, 检验结果={lab_results}")
         
+        # 规则打分只依赖症状和检验结果,相同输入直接复用缓存;
+        # 病史增强依赖数据库,每次单独计算
+        try:
+            cache_key = (tuple(symptoms), tuple(lab_results.items()))
+            hash(cache_key)
+        except TypeError:
+            cache_key = None
+        
+        cached = self._diagnosis_cache.get(cache_key) if cache_key is not None else None
+        if cached is None:
+            cached = self._score_diagnoses(symptoms, lab_results)
+            if cache_key is not None:
+                self._diagnosis_cache.set(cache_key, cached)
+        
+        # 返回副本,避免调用方或病史增强修改缓存内容
+        diagnoses = copy.deepcopy(cached)
+        
+        # 如果有患者ID,结合病史
+        if patient_id:
+            diagnoses = self._enhance_with_patient_history(patient_id, diagnoses)
+        
+        logger.success(f"鉴别诊断完成,共{len(diagnoses)}个可能诊断")
+        
+        return diagnoses[:5]  # 返回前5个
+    
+    def _score_diagnoses(self, symptoms: List[str], lab_results: Dict) -> List[Dict]:
+        """按规则库为候选疾病打分,返回按概率排序的诊断列表"""
         diagnoses = []
         
-        # 遍历所有疾病规则
-        for disease, rules in self.diagnosis_rules.items():
+        # 每个症状只匹配一次,得到其命中的疾病集合
+        symptom_hits = [self._match_symptom_diseases(symptom) for symptom in symptoms]
+        
+        # 推理路径中与疾病无关的部分,每次调用只格式化一次
+        symptoms_text = ', '.join(symptoms)
+        labs_text = ', '.join(f'{k}={v}' for k, v in lab_results.items())
+        
+        # 只遍历候选疾病规则
+        for disease in self._candidate_diseases(symptom_hits, lab_results):
+            rules = self.diagnosis_rules[disease]
             score = 0
             evidence = []
             
             # 1. 检查症状匹配
             symptom_match = 0
-            for symptom in symptoms:
-                if any(s in symptom for s in rules["相关症状"]):
+            for symptom, hits in zip(symptoms, symptom_hits):
+                if disease in hits:
                     symptom_match += 1
                     evidence.append(f"症状匹配: {symptom}")
             
@@ -108,7 +246,7 @@ class DiagnosisEngine:
             # 2. 检查关键指标
             indicator_match = 0
             for indicator in rules["关键指标"]:
-                if indicator in str(lab_results):
+                if indicator in lab_results:
                     indicator_match += 1
                     evidence.append(f"关键指标: {indicator}")
             
@@ -130,19 +268,13 @@ class DiagnosisEngine:
                     "概率": f"{probability}%",
                     "概率值": probability,
                     "证据": evidence,
-                    "推理路径": self._generate_reasoning_path(disease, symptoms, lab_results)
+                    "推理路径": self._format_reasoning_path(disease, symptoms_text, labs_text)
                 })
         
         # 按概率排序
         diagnoses.sort(key=lambda x: x["概率值"], reverse=True)
         
-        # 如果有患者ID,结合病史
-        if patient_id:
-            diagnoses = self._enhance_with_patient_history(patient_id, diagnoses)
-        
-        logger.success(f"鉴别诊断完成,共{len(diagnoses)}个可能诊断")
-        
-        return diagnoses[:5]  # 返回前5个
+        return diagnoses
     
     def _check_criteria(self, criteria: str, lab_results: Dict) -> bool:
         """检查是否符合诊断标准"""
@@ -159,11 +291,21 @@ class DiagnosisEngine:
         lab_results: Dict
     ) -> str:
         """生成推理路径"""
-        path = f"【{disease}诊断推理】\n"
-        path += f"1. 临床表现: {', '.join(symptoms)}\n"
-        path += f"2. 检验结果: {', '.join([f'{k}={v}' for k, v in lab_results.items()])}\n"
-        path += f"3. 符合{disease}的典型特征\n"
-        return path
+        return self._format_reasoning_path(
+            disease,
+            ', '.join(symptoms),
+            ', '.join(f'{k}={v}' for k, v in lab_results.items())
+        )
+    
+    @staticmethod
+    def _format_reasoning_path(disease: str, symptoms_text: str, labs_text: str) -> str:
+        """按已格式化的症状/检验文本生成推理路径"""
+        return (
+            f"【{disease}诊断推理】\n"
+            f"1. 临床表现: {symptoms_text}\n"
+            f"2. 检验结果: {labs_text}\n"
+            f"3. 符合{disease}的典型特征\n"
+        )
     
     def _enhance_with_patient_history(
         self,
@@ -171,12 +313,16 @@ class DiagnosisEngine:
         diagnoses: List[Dict]
     ) -> List[Dict]:
         """结合患者病史增强诊断"""
+        # 没有候选诊断时无需查询病史
+        if not diagnoses:
+            return diagnoses
+        
         try:
-            # 获取患者历史诊断
-            history_diagnoses = self.medical_retriever.get_patient_diagnoses(patient_id, limit=10)
+            # 获取患者历史诊断(短时间内重复查询同一患者时复用缓存)
+            history_diagnoses = self._get_patient_history(patient_id)
             
             if history_diagnoses:
-                history_diseases = [d['diagnosis_name'] for d in history_diagnoses]
+                history_diseases = {d['diagnosis_name'] for d in history_diagnoses}
                 
                 # 如果历史中有相同疾病,提高概率
                 for diag in diagnoses:
@@ -193,6 +339,20 @@ class DiagnosisEngine:
         
         return diagnoses
     
+    def _get_patient_history(self, patient_id: str) -> List[Dict]:
+        """
+        获取患者历史诊断,结果在 HISTORY_CACHE_TTL 秒内复用
+        
+        缓存超出 HISTORY_CACHE_SIZE 时淘汰最久未使用的条目。
+        """
+        cached = self._history_cache.get(patient_id)
+        if cached is not None:
+            return cached
+        
+        history_diagnoses = self.medical_retriever.get_patient_diagnoses(patient_id, limit=10)
+        self._history_cache.set(patient_id, history_diagnoses)
+        return history_diagnoses
+    
     def generate_diagnosis_report(
         self,
         patient_id: str,
@@ -218,51 +378,58 @@ class DiagnosisEngine:
         # 鉴别诊断
         diagnoses = self.differential_diagnosis(symptoms, lab_results, patient_id)
         
-        # 生成报告
-        report = "="*80 + "\n"
-        report += "鉴别诊断报告\n"
-        report += "="*80 + "\n\n"
+        # 生成报告(收集片段后一次性拼接)
+        parts = [_BAR80, "\n", "鉴别诊断报告\n", _BAR80, "\n\n"]
         
         if patient_info:
-            report += "【患者信息】\n"
-            report += f"姓名: {patient_info['name']}\n"
-            report += f"性别: {patient_info['gender']}, 年龄: {patient_info['age']}岁\n"
-            report += f"BMI: {patient_info['bmi']}\n\n"
+            parts.append("【患者信息】\n")
+            parts.append(f"姓名: {patient_info['name']}\n")
+            parts.append(f"性别: {patient_info['gender']}, 年龄: {patient_info['age']}岁\n")
+            parts.append(f"BMI: {patient_info['bmi']}\n\n")
         
-        report += "【主诉症状】\n"
-        report += ", ".join(symptoms) + "\n\n"
+        parts.append("【主诉症状】\n")
+        parts.append(", ".join(symptoms) + "\n\n")
         
-        report += "【检验结果】\n"
+        parts.append("【检验结果】\n")
         for key, value in lab_results.items():
-            report += f"- {key}: {value}\n"
-        report += "\n"
+            parts.append(f"- {key}: {value}\n")
+        parts.append("\n")
         
-        report += "【鉴别诊断】(按概率排序)\n\n"
+        parts.append("【鉴别诊断】(按概率排序)\n\n")
         
         for i, diag in enumerate(diagnoses, 1):
-            report += f"{i}. {diag['疾病']} (概率: {diag['概率']})\n"
-            report += f"   证据:\n"
+            parts.append(f"{i}. {diag['疾病']} (概率: {diag['概率']})\n")
+            parts.append("   证据:\n")
             for evidence in diag['证据']:
-                report += f"   - {evidence}\n"
-            report += f"\n   推理路径:\n"
+                parts.append(f"   - {evidence}\n")
+            parts.append("\n   推理路径:\n")
             for line in diag['推理路径'].split('\n'):
                 if line:
-                    report += f"   {line}\n"
-            report += "\n"
+                    parts.append(f"   {line}\n")
+            parts.append("\n")
         
-        report += "="*80 + "\n"
-        report += "【说明】\n"
-        report += "- 以上诊断仅供参考,需结合临床实际情况\n"
-        report += "- 建议进一步完善相关检查\n"
-        report += "- 最终诊断需由主治医生确定\n"
-        report += "="*80 + "\n"
+        parts.append(_BAR80 + "\n")
+        parts.append("【说明】\n")
+        parts.append("- 以上诊断仅供参考,需结合临床实际情况\n")
+        parts.append("- 建议进一步完善相关检查\n")
+        parts.append("- 最终诊断需由主治医生确定\n")
+        parts.append(_BAR80 + "\n")
         
-        return report
+        return "".join(parts)
+
+
+# 未指定查询引擎时复用的默认诊断引擎实例
+_default_diagnosis_engine: Optional[DiagnosisEngine] = None
 
 
 def create_diagnosis_engine(query_engine: Optional[QueryEngine] = None) -> DiagnosisEngine:
-    """创建诊断引擎"""
-    return DiagnosisEngine(query_engine)
+    """创建诊断引擎(未指定查询引擎时返回共享的默认实例)"""
+    global _default_diagnosis_engine
+    if query_engine is not None:
+        return DiagnosisEngine(query_engine)
+    if _default_diagnosis_engine is None:
+        _default_diagnosis_engine = DiagnosisEngine()
+    return _default_diagnosis_engine
 
 
 if __name__ == "__main__":
@@ -5,8 +5,14 @@
 """
 from typing import Dict, List, Optional, Tuple
 from dataclasses import dataclass
+from functools import lru_cache
 from enum import Enum
 
+try:
+    import ahocorasick
+except ImportError:  # 可选依赖,缺失时回退到逐条子串匹配
+    ahocorasick = None
+
 
 class EvidenceLevel(Enum):
     """证据等级枚举"""
@@ -17,6 +23,13 @@ class EvidenceLevel(Enum):
     III = "Ⅲ"   # 低质量证据,不推荐
 
 
+# 证据等级取值 -> 枚举成员,避免 EvidenceLevel(value) 的反查开销
+_LEVEL_BY_VALUE: Dict[str, EvidenceLevel] = {level.value: level for level in EvidenceLevel}
+
+# 证据等级 -> 声明顺序下标,用于按下标访问等级说明元组
+_LEVEL_INDEX: Dict[EvidenceLevel, int] = {level: i for i, level in enumerate(EvidenceLevel)}
+
+
 @dataclass
 class EvidenceSource:
     """证据来源"""
@@ -30,6 +43,9 @@ class EvidenceSource:
 class EvidenceAnnotator:
     """证据等级标注器"""
     
+    # 各证据等级的标注后缀,预先格式化
+    _SUFFIX = {level: f" 【证据等级: {level.value}】" for level in EvidenceLevel}
+    
     def __init__(self):
         """初始化标注器"""
         # 证据等级说明
@@ -40,6 +56,8 @@ class EvidenceAnnotator:
             EvidenceLevel.IIB: "基于中等质量证据,推荐强度较弱",
             EvidenceLevel.III: "基于专家共识或低质量证据,不推荐或有争议"
         }
+        # 按枚举声明顺序排列的说明元组
+        self._descriptions = tuple(self.level_descriptions[level] for level in EvidenceLevel)
         
         # 指南推荐等级映射
         self.guideline_levels = {
@@ -58,6 +76,27 @@ class EvidenceAnnotator:
                 "胰岛素用于血糖控制不佳": EvidenceLevel.IA
             }
         }
+        
+        # 每个指南的推荐短语构建一个 Aho-Corasick 自动机,一次扫描找出所有命中短语
+        self._guideline_automata = {
+            name: self._build_automaton(levels)
+            for name, levels in self.guideline_levels.items()
+        }
+        
+        # 相同推荐内容在不同患者间反复出现,标注结果按 (推荐内容, 指南) 缓存
+        self._annotate_cached = lru_cache(maxsize=2048)(self._annotate)
+    
+    @staticmethod
+    def _build_automaton(levels: Dict[str, EvidenceLevel]):
+        """构建短语自动机,值为 (短语在映射中的顺序, 证据等级);未安装 pyahocorasick 时返回 None"""
+        if ahocorasick is None:
+            return None
+        
+        automaton = ahocorasick.Automaton()
+        for priority, (phrase, level) in enumerate(levels.items()):
+            automaton.add_word(phrase, (priority, level))
+        automaton.make_automaton()
+        return automaton
     
     def annotate_recommendation(
         self,
@@ -74,23 +113,35 @@ class EvidenceAnnotator:
         Returns:
             (标注后的推荐, 证据等级)
         """
+        return self._annotate_cached(recommendation, guideline)
+    
+    def _annotate(self, recommendation: str, guideline: str) -> Tuple[str, EvidenceLevel]:
+        """annotate_recommendation 的实际实现(结果不可变,可安全缓存)"""
         # 查找匹配的证据等级
         level = EvidenceLevel.IIB  # 默认等级
         
-        if guideline in self.guideline_levels:
+        automaton = self._guideline_automata.get(guideline)
+        if automaton is not None:
+            # 多个短语命中时取映射中靠前的一个,与逐条匹配的结果一致
+            hits = [hit for _, hit in automaton.iter(recommendation)]
+            if hits:
+                level = min(hits, key=lambda hit: hit[0])[1]
+        elif guideline in self.guideline_levels:
             for key, value in self.guideline_levels[guideline].items():
                 if key in recommendation:
                     level = value
                     break
         
         # 添加证据等级标注
-        annotated = f"{recommendation} 【证据等级: {level.value}】"
-        
-        return annotated, level
+        return recommendation + self._SUFFIX[level], level
     
     def get_level_description(self, level: EvidenceLevel) -> str:
-        """获取证据等级说明"""
-        return self.level_descriptions.get(level, "")
+        """获取证据等级说明(也接受等级取值字符串,如 "ⅠA")"""
+        if not isinstance(level, EvidenceLevel):
+            level = _LEVEL_BY_VALUE.get(level)
+            if level is None:
+                return ""
+        return self._descriptions[_LEVEL_INDEX[level]]
 
 
 class DecisionTracer:
@@ -99,6 +150,8 @@ class DecisionTracer:
     def __init__(self):
         """初始化溯源器"""
         self.sources = []
+        # 按来源类型分桶,生成报告和统计时无需再遍历分组
+        self._buckets: Dict[str, List[EvidenceSource]] = {"PDF": [], "MySQL": [], "Excel": []}
     
     def add_source(
         self,
@@ -126,6 +179,7 @@ class DecisionTracer:
             update_time=update_time
         )
         self.sources.append(source)
+        self._buckets.setdefault(source_type, []).append(source)
     
     def generate_trace_report(self) -> str:
         """
@@ -137,46 +191,39 @@ class DecisionTracer:
         if not self.sources:
             return "无证据来源"
         
-        report = "\n【决策溯源】\n"
-        report += "="*60 + "\n"
+        parts = ["\n【决策溯源】\n", "="*60, "\n"]
         
-        # 按来源类型分组
-        pdf_sources = [s for s in self.sources if s.source_type == "PDF"]
-        mysql_sources = [s for s in self.sources if s.source_type == "MySQL"]
-        excel_sources = [s for s in self.sources if s.source_type == "Excel"]
+        pdf_sources = self._buckets["PDF"]
+        mysql_sources = self._buckets["MySQL"]
+        excel_sources = self._buckets["Excel"]
         
         if pdf_sources:
-            report += "\n📄 PDF指南引用:\n"
+            parts.append("\n📄 PDF指南引用:\n")
             for i, source in enumerate(pdf_sources, 1):
-                report += f"{i}. 《{source.source_name}》第{source.location}页\n"
-                report += f"   内容: {source.content[:100]}...\n"
+                parts.append(f"{i}. 《{source.source_name}》第{source.location}页\n")
+                parts.append(f"   内容: {source.content[:100]}...\n")
                 if source.update_time:
-                    report += f"   更新时间: {source.update_time}\n"
+                    parts.append(f"   更新时间: {source.update_time}\n")
         
         if mysql_sources:
-            report += "\n💾 数据库数据引用:\n"
+            parts.append("\n💾 数据库数据引用:\n")
             for i, source in enumerate(mysql_sources, 1):
-                report += f"{i}. 表: {source.source_name}, 记录: {source.location}\n"
-                report += f"   内容: {source.content}\n"
+                parts.append(f"{i}. 表: {source.source_name}, 记录: {source.location}\n")
+                parts.append(f"   内容: {source.content}\n")
         
         if excel_sources:
-            report += "\n📊 Excel数据引用:\n"
+            parts.append("\n📊 Excel数据引用:\n")
             for i, source in enumerate(excel_sources, 1):
-                report += f"{i}. 文件: {source.source_name}, 行: {source.location}\n"
-                report += f"   内容: {source.content}\n"
+                parts.append(f"{i}. 文件: {source.source_name}, 行: {source.location}\n")
+                parts.append(f"   内容: {source.content}\n")
         
-        report += "="*60 + "\n"
+        parts.append("="*60 + "\n")
         
-        return report
+        return "".join(parts)
     
     def get_source_summary(self) -> Dict[str, int]:
         """获取来源统计"""
-        summary = {
-            "PDF": len([s for s in self.sources if s.source_type == "PDF"]),
-            "MySQL": len([s for s in self.sources if s.source_type == "MySQL"]),
-            "Excel": len([s for s in self.sources if s.source_type == "Excel"])
-        }
-        return summary
+        return {key: len(self._buckets[key]) for key in ("PDF", "MySQL", "Excel")}
 
 
 class EvidenceBasedRecommendation:
@@ -215,9 +262,14 @@ class EvidenceBasedRecommendation:
         # 标注证据等级
         annotated_content, level = self.annotator.annotate_recommendation(content, guideline)
         
+        # 每条推荐使用独立的溯源器,避免来源在多次调用间累积;
+        # self.tracer 指向最近一条推荐的溯源器
+        tracer = DecisionTracer()
+        self.tracer = tracer
+        
         # 添加溯源信息
         if pdf_page:
-            self.tracer.add_source(
+            tracer.add_source(
                 source_type="PDF",
                 source_name=guideline,
                 location=pdf_page,
@@ -226,7 +278,7 @@ class EvidenceBasedRecommendation:
             )
         
         if mysql_table and mysql_record:
-            self.tracer.add_source(
+            tracer.add_source(
                 source_type="MySQL",
                 source_name=mysql_table,
                 location=mysql_record,
@@ -234,7 +286,7 @@ class EvidenceBasedRecommendation:
             )
         
         if excel_file and excel_row:
-            self.tracer.add_source(
+            tracer.add_source(
                 source_type="Excel",
                 source_name=excel_file,
                 location=excel_row,
@@ -246,33 +298,32 @@ class EvidenceBasedRecommendation:
             "证据等级": level.value,
             "证据说明": self.annotator.get_level_description(level),
             "指南来源": guideline,
-            "溯源信息": self.tracer.generate_trace_report(),
-            "数据来源统计": self.tracer.get_source_summary()
+            "溯源信息": tracer.generate_trace_report(),
+            "数据来源统计": tracer.get_source_summary()
         }
         
         return recommendation
     
     def format_recommendation(self, recommendation: Dict) -> str:
         """格式化推荐输出"""
-        output = "\n" + "="*80 + "\n"
-        output += "循证医学推荐\n"
-        output += "="*80 + "\n\n"
-        
-        output += f"【推荐内容】\n{recommendation['内容']}\n\n"
-        output += f"【证据等级】{recommendation['证据等级']}\n"
-        output += f"说明: {recommendation['证据说明']}\n\n"
-        output += f"【指南来源】{recommendation['指南来源']}\n"
-        output += recommendation['溯源信息']
-        
         summary = recommendation['数据来源统计']
-        output += f"\n【数据来源统计】\n"
-        output += f"- PDF指南引用: {summary['PDF']}处\n"
-        output += f"- 数据库数据: {summary['MySQL']}条\n"
-        output += f"- Excel数据: {summary['Excel']}条\n"
-        
-        output += "\n" + "="*80 + "\n"
+        parts = [
+            "\n", "="*80, "\n",
+            "循证医学推荐\n",
+            "="*80, "\n\n",
+            f"【推荐内容】\n{recommendation['内容']}\n\n",
+            f"【证据等级】{recommendation['证据等级']}\n",
+            f"说明: {recommendation['证据说明']}\n\n",
+            f"【指南来源】{recommendation['指南来源']}\n",
+            recommendation['溯源信息'],
+            "\n【数据来源统计】\n",
+            f"- PDF指南引用: {summary['PDF']}处\n",
+            f"- 数据库数据: {summary['MySQL']}条\n",
+            f"- Excel数据: {summary['Excel']}条\n",
+            "\n", "="*80, "\n"
+        ]
         
-        return output
+        return "".join(parts)
 
 
 # 全局实例
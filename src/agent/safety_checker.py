@@ -2,16 +2,64 @@
 医疗安全检查模块
 包含用药安全、伦理检查、人文关怀等功能
 """
-from typing import Dict, List, Optional
+from typing import Dict, List, Optional, Tuple
+from hashlib import blake2b
+import copy
+import json
 import re
+import threading
+
+try:
+    import ahocorasick
+except ImportError:  # 可选依赖,缺失时回退到逐个关键词的子串匹配
+    ahocorasick = None
+
+try:
+    import hyperscan
+except ImportError:  # 可选依赖,缺失时伦理检查使用 Python re
+    hyperscan = None
+
+
+# 固定文案,模块加载时构建一次
+_SEPARATOR = "=" * 80
+
+# 已添加过的文案标记,重复处理同一内容时直接跳过
+_CARE_SENTINEL = "💙 温馨提示"
+_DISCLAIMER_SENTINEL = "【重要声明】"
+
+_CARE_PREFIX = "💙 我理解您的担忧和不安。请放心,我们会一起面对这个问题。\n\n"
+
+_CARE_SUFFIX = (
+    "\n\n💙 温馨提示:\n"
+    "- 慢性病管理是一个长期过程,请保持耐心和信心\n"
+    "- 规律服药、健康生活方式是控制疾病的关键\n"
+    "- 如有任何不适或疑问,请及时咨询您的主治医生\n"
+    "- 保持积极乐观的心态,对疾病控制很有帮助\n"
+)
+
+_DISCLAIMER = (
+    "\n\n" + _SEPARATOR + "\n"
+    "⚠️ 【重要声明】\n"
+    "本建议仅供医疗专业人员参考,不能替代医生的临床判断。\n"
+    "所有诊疗决策请在医生指导下进行。\n"
+    "如有紧急情况,请立即就医或拨打120急救电话。\n"
+    + _SEPARATOR
+)
 
 from src.utils.logger import logger
+from src.utils.ttl_cache import TTLCache
 from src.config import settings
 
 
 class SafetyChecker:
     """医疗安全检查器"""
     
+    # 过度承诺疗效的表述
+    _OVERPROMISE_RE = re.compile(r'(100%|百分之百|一定|必然).*?(治愈|康复|痊愈)')
+    
+    # 综合检查结论缓存的最大条目数
+    CHECK_CACHE_SIZE = 512
+    
     def __init__(self):
         """初始化安全检查器"""
         self.enable_safety_check = settings.enable_safety_check
@@ -19,25 +67,135 @@ class SafetyChecker:
         self.enable_humanistic_care = settings.enable_humanistic_care
         
         # 高风险关键词
-        self.high_risk_keywords = [
+        self.high_risk_keywords = (
             "立即", "紧急", "危险", "严重", "致命",
             "停药", "加量", "减量", "换药",
             "手术", "住院", "急诊"
-        ]
+        )
         
         # 禁忌词
-        self.forbidden_keywords = [
+        self.forbidden_keywords = (
             "保证治愈", "完全治愈", "根治",
             "绝对安全", "没有副作用",
             "最好的药", "唯一的选择"
-        ]
+        )
         
         # 需要人文关怀的情况
-        self.care_keywords = [
+        self.care_keywords = (
             "担心", "害怕", "焦虑", "紧张",
             "痛苦", "难受", "不舒服",
             "并发症", "恶化", "严重"
-        ]
+        )
+        
+        # 三类关键词合并到一个 Aho-Corasick 自动机,单次扫描即可按类别取得全部命中
+        self._keyword_groups = {
+            "risk": self.high_risk_keywords,
+            "forbidden": self.forbidden_keywords,
+            "care": self.care_keywords
+        }
+        self._automaton = self._build_automaton(self._keyword_groups)
+        
+        # 禁忌词与过度承诺正则编译为一个 Hyperscan 数据库,伦理检查一次扫描完成
+        self._ethics_db = self._build_ethics_database()
+        # Hyperscan 的 scratch 不能被多个线程同时使用,每个线程各自分配一份
+        self._ethics_local = threading.local()
+        
+        # 综合检查结论缓存: 输入摘要 -> {"checks": ..., "needs_care": ...};不缓存处理后的内容
+        # 单例在 gthread worker 的多个线程间共享,TTLCache 内部加锁
+        self._check_cache = TTLCache(self.CHECK_CACHE_SIZE)
+    
+    @staticmethod
+    def _build_automaton(keyword_groups: Dict[str, Tuple[str, ...]]):
+        """构建关键词自动机,每个关键词对应 (关键词, 所属类别元组);未安装 pyahocorasick 时返回 None"""
+        if ahocorasick is None:
+            return None
+        
+        tags_by_keyword: Dict[str, List[str]] = {}
+        for tag, keywords in keyword_groups.items():
+            for keyword in keywords:
+                tags_by_keyword.setdefault(keyword, []).append(tag)
+        
+        automaton = ahocorasick.Automaton()
+        for keyword, tags in tags_by_keyword.items():
+            automaton.add_word(keyword, (keyword, tuple(tags)))
+        automaton.make_automaton()
+        return automaton
+    
+    def _build_ethics_database(self):
+        """
+        构建伦理检查用的 Hyperscan 数据库
+        
+        模式 id 0..n-1 对应禁忌词,id n 对应过度承诺正则;未安装 hyperscan 时返回 None。
+        """
+        if hyperscan is None:
+            return None
+        
+        patterns = [re.escape(k) for k in self.forbidden_keywords] + [self._OVERPROMISE_RE.pattern]
+        database = hyperscan.Database()
+        database.compile(
+            expressions=[p.encode("utf-8") for p in patterns],
+            ids=list(range(len(patterns))),
+            elements=len(patterns),
+            flags=[hyperscan.HS_FLAG_UTF8 | hyperscan.HS_FLAG_SINGLEMATCH] * len(patterns)
+        )
+        return database
+    
+    def _scan_ethics(self, content: str):
+        """
+        扫描禁忌词与过度承诺表述
+        
+        Returns:
+            (命中的禁忌词集合, 是否存在过度承诺表述)
+        """
+        if self._ethics_db is None:
+            return self._scan_keywords(content)["forbidden"], bool(self._OVERPROMISE_RE.search(content))
+        
+        matched = set()
+        
+        def on_match(pattern_id, start, end, flags, context):
+            matched.add(pattern_id)
+        
+        scratch = getattr(self._ethics_local, "scratch", None)
+        if scratch is None:
+            scratch = self._ethics_local.scratch = hyperscan.Scratch(self._ethics_db)
+        self._ethics_db.scan(content.encode("utf-8"), match_event_handler=on_match, scratch=scratch)
+        
+        overpromise_id = len(self.forbidden_keywords)
+        found = {self.forbidden_keywords[i] for i in matched if i != overpromise_id}
+        return found, overpromise_id in matched
+    
+    def _needs_care(self, patient_context: Optional[str]) -> bool:
+        """患者上下文中是否出现需要人文关怀的关键词"""
+        if not patient_context:
+            return False
+        if self._automaton is not None:
+            return bool(self._scan_keywords(patient_context)["care"])
+        # 无自动机时只需判断关怀词,命中即短路
+        return any(k in patient_context for k in self.care_keywords)
+    
+    def _scan_keywords(self, text: Optional[str]) -> Dict[str, set]:
+        """
+        扫描文本中出现的关键词
+        
+        Args:
+            text: 待扫描文本
+            
+        Returns:
+            类别 -> 命中关键词集合
+        """
+        hits = {tag: set() for tag in self._keyword_groups}
+        if not text:
+            return hits
+        
+        if self._automaton is not None:
+            for _, (keyword, tags) in self._automaton.iter(text):
+                for tag in tags:
+                    hits[tag].add(keyword)
+        else:
+            for tag, keywords in self._keyword_groups.items():
+                hits[tag].update(k for k in keywords if k in text)
+        
+        return hits
     
     def check_medication_safety(self, medication_info: Dict) -> Dict[str, any]:
         """
@@ -60,7 +218,7 @@ class SafetyChecker:
         if "dosage" in medication_info:
             dosage = medication_info["dosage"]
             # 这里可以添加具体的剂量检查逻辑
-            logger.debug(f"检查剂量: {dosage}")
+            logger.debug("检查剂量: {}", dosage)
         
         # 检查药物相互作用(示例)
         if "current_medications" in medication_info and "new_medication" in medication_info:
@@ -93,16 +251,26 @@ class SafetyChecker:
         
         logger.info("执行伦理检查")
         
+        return self._ethics_result(content)
+    
+    def _ethics_result(self, content: str, keyword_hits: Optional[Dict[str, set]] = None) -> Dict[str, any]:
+        """根据扫描结果生成伦理检查结果;keyword_hits 为已完成的关键词扫描结果(可选)"""
         issues = []
         
-        # 检查是否包含禁忌词
+        if keyword_hits is not None and self._ethics_db is None:
+            found = keyword_hits["forbidden"]
+            overpromise = bool(self._OVERPROMISE_RE.search(content))
+        else:
+            found, overpromise = self._scan_ethics(content)
+        
+        # 检查是否包含禁忌词(按词表顺序输出命中项)
         for keyword in self.forbidden_keywords:
-            if keyword in content:
+            if keyword in found:
                 issues.append(f"包含不当承诺: '{keyword}'")
-                logger.warning(f"发现禁忌词: {keyword}")
+                logger.warning("发现禁忌词: {}", keyword)
         
         # 检查是否过度承诺疗效
-        if re.search(r'(100%|百分之百|一定|必然).*?(治愈|康复|痊愈)', content):
+        if overpromise:
             issues.append("存在过度承诺疗效的表述")
         
         # 检查是否尊重患者自主权
@@ -126,16 +294,17 @@ class SafetyChecker:
         """
         logger.info("检测高风险内容")
         
-        high_risk_items = []
-        
-        for keyword in self.high_risk_keywords:
-            if keyword in content:
-                high_risk_items.append(keyword)
+        return self._risk_result(self._scan_keywords(content))
+    
+    def _risk_result(self, keyword_hits: Dict[str, set]) -> Dict[str, any]:
+        """根据关键词扫描结果生成高风险检测结果"""
+        found = keyword_hits["risk"]
+        high_risk_items = [k for k in self.high_risk_keywords if k in found]
         
         is_high_risk = len(high_risk_items) > 0
         
         if is_high_risk:
-            logger.warning(f"检测到高风险内容,关键词: {high_risk_items}")
+            logger.warning("检测到高风险内容,关键词: {}", high_risk_items)
         
         return {
             "is_high_risk": is_high_risk,
@@ -160,26 +329,17 @@ class SafetyChecker:
         logger.info("添加人文关怀内容")
         
         # 检查是否需要特别关怀
-        needs_care = False
-        if patient_context:
-            for keyword in self.care_keywords:
-                if keyword in patient_context:
-                    needs_care = True
-                    break
-        
-        # 添加人文关怀前缀
-        care_prefix = ""
-        if needs_care:
-            care_prefix = "💙 我理解您的担忧和不安。请放心,我们会一起面对这个问题。\n\n"
+        needs_care = self._needs_care(patient_context)
         
-        # 添加人文关怀后缀
-        care_suffix = "\n\n💙 温馨提示:\n"
-        care_suffix += "- 慢性病管理是一个长期过程,请保持耐心和信心\n"
-        care_suffix += "- 规律服药、健康生活方式是控制疾病的关键\n"
-        care_suffix += "- 如有任何不适或疑问,请及时咨询您的主治医生\n"
-        care_suffix += "- 保持积极乐观的心态,对疾病控制很有帮助\n"
-        
-        return care_prefix + content + care_suffix
+        return self._wrap_with_care(content, needs_care)
+    
+    def _wrap_with_care(self, content: str, needs_care: bool) -> str:
+        """为内容添加人文关怀前缀/后缀"""
+        if _CARE_SENTINEL in content:
+            return content
+        if needs_care:
+            return _CARE_PREFIX + content + _CARE_SUFFIX
+        return content + _CARE_SUFFIX
     
     def add_disclaimer(self, content: str) -> str:
         """
@@ -191,14 +351,9 @@ class SafetyChecker:
         Returns:
             添加免责声明后的内容
         """
-        disclaimer = "\n\n" + "="*80 + "\n"
-        disclaimer += "⚠️ 【重要声明】\n"
-        disclaimer += "本建议仅供医疗专业人员参考,不能替代医生的临床判断。\n"
-        disclaimer += "所有诊疗决策请在医生指导下进行。\n"
-        disclaimer += "如有紧急情况,请立即就医或拨打120急救电话。\n"
-        disclaimer += "="*80
-        
-        return content + disclaimer
+        if _DISCLAIMER_SENTINEL in content:
+            return content
+        return content + _DISCLAIMER
     
     def comprehensive_check(
         self, 
@@ -219,30 +374,26 @@ class SafetyChecker:
         """
         logger.info("执行综合安全检查")
         
-        results = {
-            "original_content": content,
-            "processed_content": content,
-            "checks": {}
-        }
+        key = self._check_cache_key(content, patient_context, medication_info)
+        cached = self._check_cache.get(key)
+        if cached is None:
+            # 检查在锁外执行,不阻塞其他线程;并发的相同输入可能重复计算,结果一致
+            cached = self._run_checks(content, patient_context, medication_info)
+            self._check_cache.set(key, cached)
         
-        # 1. 伦理检查
-        ethics_result = self.check_content_ethics(content)
-        results["checks"]["ethics"] = ethics_result
+        # 返回副本,避免调用方修改缓存中的检查结论
+        checks = copy.deepcopy(cached["checks"])
+        ethics_result = checks["ethics"]
+        risk_result = checks["risk"]
         
         if not ethics_result["passed"]:
-            logger.warning(f"伦理检查未通过: {ethics_result['issues']}")
-        
-        # 2. 高风险检测
-        risk_result = self.detect_high_risk_content(content)
-        results["checks"]["risk"] = risk_result
-        
-        # 3. 用药安全检查
-        if medication_info:
-            med_safety_result = self.check_medication_safety(medication_info)
-            results["checks"]["medication_safety"] = med_safety_result
+            logger.warning("伦理检查未通过: {}", ethics_result['issues'])
         
         # 4. 添加人文关怀
-        processed_content = self.add_humanistic_care(content, patient_context)
+        if self.enable_humanistic_care:
+            processed_content = self._wrap_with_care(content, cached["needs_care"])
+        else:
+            processed_content = content
         
         # 5. 添加高风险警告
         if risk_result["is_high_risk"]:
@@ -251,10 +402,55 @@ class SafetyChecker:
         # 6. 添加免责声明
         processed_content = self.add_disclaimer(processed_content)
         
-        results["processed_content"] = processed_content
-        results["safe_to_display"] = ethics_result["passed"]
+        return {
+            "original_content": content,
+            "processed_content": processed_content,
+            "checks": checks,
+            "safe_to_display": ethics_result["passed"]
+        }
+    
+    @staticmethod
+    def _check_cache_key(
+        content: str,
+        patient_context: Optional[str],
+        medication_info: Optional[Dict]
+    ) -> bytes:
+        """综合检查输入的摘要,作为结论缓存的键"""
+        med = json.dumps(medication_info, ensure_ascii=False, sort_keys=True, default=str) if medication_info else ""
+        digest = blake2b(digest_size=16)
+        for part in (content, patient_context or "", med):
+            digest.update(part.encode("utf-8"))
+            digest.update(b"\x00")
+        return digest.digest()
+    
+    def _run_checks(
+        self,
+        content: str,
+        patient_context: Optional[str],
+        medication_info: Optional[Dict]
+    ) -> Dict:
+        """执行伦理、高风险、用药安全检查,并判断是否需要人文关怀"""
+        checks = {}
+        
+        # 内容只扫描一次,伦理检查与高风险检测共用关键词命中结果
+        content_hits = self._scan_keywords(content)
+        
+        # 1. 伦理检查
+        if self.enable_ethics_check:
+            checks["ethics"] = self._ethics_result(content, content_hits)
+        else:
+            checks["ethics"] = {"passed": True, "issues": []}
+        
+        # 2. 高风险检测
+        checks["risk"] = self._risk_result(content_hits)
+        
+        # 3. 用药安全检查
+        if medication_info:
+            checks["medication_safety"] = self.check_medication_safety(medication_info)
+        
+        needs_care = self.enable_humanistic_care and self._needs_care(patient_context)
         
-        return results
+        return {"checks": checks, "needs_care": needs_care}
 
 
 # 全局安全检查器实例
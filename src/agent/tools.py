@@ -4,16 +4,38 @@
 """
 from typing import Dict, List, Any, Optional
 import json
+from itertools import islice
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
 
 from src.database import get_medical_retriever
 from src.rag import QueryEngine
 from src.agent.safety_checker import get_safety_checker
 from src.utils.logger import logger
+from src.utils.ttl_cache import TTLCache
+
+
+def _dumps(obj: Any) -> str:
+    """序列化为带缩进的 JSON 字符串,优先使用 orjson;无法序列化的值(日期、Decimal 等)转为 str"""
+    if orjson is not None:
+        return orjson.dumps(
+            obj,
+            default=str,
+            option=orjson.OPT_INDENT_2 | orjson.OPT_NON_STR_KEYS | orjson.OPT_PASSTHROUGH_DATETIME
+        ).decode("utf-8")
+    return json.dumps(obj, ensure_ascii=False, indent=2, default=str)
 
 
 class MedicalTools:
     """医疗决策工具集"""
     
+    # 患者当前用药缓存有效期(秒)与最大条目数
+    MEDICATION_CACHE_TTL = 60
+    MEDICATION_CACHE_SIZE = 256
+    
     def __init__(self, query_engine: Optional[QueryEngine] = None):
         """
         初始化工具集
@@ -24,6 +46,28 @@ class MedicalTools:
         self.medical_retriever = get_medical_retriever()
         self.query_engine = query_engine
         self.safety_checker = get_safety_checker()
+        
+        # 患者当前用药缓存: patient_id -> 用药列表;仅在本进程内有效,
+        # 工具集在 gthread worker 的多个线程间共享,TTLCache 内部加锁
+        self._medication_cache = TTLCache(self.MEDICATION_CACHE_SIZE, self.MEDICATION_CACHE_TTL)
+    
+    def _get_current_medications(self, patient_id: str) -> List[Dict]:
+        """
+        获取患者当前用药,MEDICATION_CACHE_TTL 秒内的重复查询复用结果
+        
+        缓存超出 MEDICATION_CACHE_SIZE 时淘汰最久未使用的条目。
+        """
+        cached = self._medication_cache.get(patient_id)
+        if cached is not None:
+            return cached
+        
+        medications = self.medical_retriever.get_patient_medications(patient_id, limit=10)
+        self._medication_cache.set(patient_id, medications)
+        return medications
+    
+    def clear_medication_cache(self):
+        """清空用药缓存(用药数据更新后调用)"""
+        self._medication_cache.clear()
     
     def search_medical_guidelines(self, query: str) -> str:
         """
@@ -35,7 +79,7 @@ class MedicalTools:
         Returns:
             指南内容
         """
-        logger.info(f"搜索医疗指南: {query}")
+        logger.info("搜索医疗指南: {}", query)
         
         if not self.query_engine:
             return "RAG查询引擎未初始化"
@@ -57,13 +101,13 @@ class MedicalTools:
         Returns:
             患者信息JSON字符串
         """
-        logger.info(f"获取患者信息: {patient_id}")
+        logger.info("获取患者信息: {}", patient_id)
         
         try:
             patient_info = self.medical_retriever.get_patient_info(patient_id)
             
             if patient_info:
-                return json.dumps(patient_info, ensure_ascii=False, indent=2)
+                return _dumps(patient_info)
             else:
                 return f"未找到患者ID: {patient_id}"
         except Exception as e:
@@ -80,11 +124,11 @@ class MedicalTools:
         Returns:
             综合数据JSON字符串
         """
-        logger.info(f"获取患者综合数据: {patient_id}")
+        logger.info("获取患者综合数据: {}", patient_id)
         
         try:
             data = self.medical_retriever.get_patient_comprehensive_data(patient_id)
-            return json.dumps(data, ensure_ascii=False, indent=2, default=str)
+            return _dumps(data)
         except Exception as e:
             logger.error(f"获取综合数据失败: {e}")
             return f"获取失败: {str(e)}"
@@ -99,39 +143,44 @@ class MedicalTools:
         Returns:
             风险评估结果
         """
-        logger.info(f"评估糖尿病风险: {patient_id}")
+        logger.info("评估糖尿病风险: {}", patient_id)
         
         try:
-            # 获取患者信息
-            patient_info = self.medical_retriever.get_patient_info(patient_id)
-            if not patient_info:
-                return f"未找到患者ID: {patient_id}"
-            
-            # 获取糖尿病评估记录
-            diabetes_assessments = self.medical_retriever.get_diabetes_assessment(patient_id, limit=1)
-            
-            # 获取相关检验结果
-            lab_results = self.medical_retriever.get_patient_lab_results(patient_id, limit=10)
+            # 三次查询共用一个数据库连接
+            with self.medical_retriever.shared_connection():
+                # 获取患者信息
+                patient_info = self.medical_retriever.get_patient_info(patient_id)
+                if not patient_info:
+                    return f"未找到患者ID: {patient_id}"
+                
+                # 获取糖尿病评估记录
+                diabetes_assessments = self.medical_retriever.get_diabetes_assessment(patient_id, limit=1)
+                
+                # 获取相关检验结果
+                lab_results = self.medical_retriever.get_patient_lab_results(patient_id, limit=10)
             
             # 构建评估报告
-            report = f"患者: {patient_info['name']}, 年龄: {patient_info['age']}岁, BMI: {patient_info['bmi']}\n\n"
+            parts = [f"患者: {patient_info['name']}, 年龄: {patient_info['age']}岁, BMI: {patient_info['bmi']}\n\n"]
             
             if diabetes_assessments:
                 latest = diabetes_assessments[0]
-                report += f"最新评估({latest['assessment_date']}):\n"
-                report += f"- 空腹血糖: {latest.get('fasting_glucose', 'N/A')} mmol/L\n"
-                report += f"- 餐后血糖: {latest.get('postprandial_glucose', 'N/A')} mmol/L\n"
-                report += f"- HbA1c: {latest.get('hba1c', 'N/A')}%\n"
-                report += f"- 控制状态: {latest.get('control_status', 'N/A')}\n"
+                parts.append(f"最新评估({latest['assessment_date']}):\n")
+                parts.append(f"- 空腹血糖: {latest.get('fasting_glucose', 'N/A')} mmol/L\n")
+                parts.append(f"- 餐后血糖: {latest.get('postprandial_glucose', 'N/A')} mmol/L\n")
+                parts.append(f"- HbA1c: {latest.get('hba1c', 'N/A')}%\n")
+                parts.append(f"- 控制状态: {latest.get('control_status', 'N/A')}\n")
             
             # 异常检验结果
-            abnormal_results = [r for r in lab_results if r.get('is_abnormal')]
-            if abnormal_results:
-                report += f"\n异常检验结果({len(abnormal_results)}项):\n"
-                for result in abnormal_results[:5]:
-                    report += f"- {result['test_item']}: {result['result_value']} {result.get('unit', '')} (参考范围: {result.get('reference_range', 'N/A')})\n"
+            # 只展示前5项,其余只计数,不物化完整的异常列表
+            abnormal_iter = (r for r in lab_results if r.get('is_abnormal'))
+            shown = list(islice(abnormal_iter, 5))
+            if shown:
+                abnormal_count = len(shown) + sum(1 for _ in abnormal_iter)
+                parts.append(f"\n异常检验结果({abnormal_count}项):\n")
+                for result in shown:
+                    parts.append(f"- {result['test_item']}: {result['result_value']} {result.get('unit', '')} (参考范围: {result.get('reference_range', 'N/A')})\n")
             
-            return report
+            return "".join(parts)
         except Exception as e:
             logger.error(f"风险评估失败: {e}")
             return f"评估失败: {str(e)}"
@@ -147,11 +196,11 @@ class MedicalTools:
         Returns:
             安全检查结果
         """
-        logger.info(f"检查用药安全: 患者{patient_id}, 药物{new_medication}")
+        logger.info("检查用药安全: 患者{}, 药物{}", patient_id, new_medication)
         
         try:
             # 获取当前用药
-            current_meds = self.medical_retriever.get_patient_medications(patient_id, limit=10)
+            current_meds = self._get_current_medications(patient_id)
             
             med_info = {
                 "new_medication": new_medication,
@@ -161,19 +210,21 @@ class MedicalTools:
             # 执行安全检查
             safety_result = self.safety_checker.check_medication_safety(med_info)
             
-            report = f"用药安全检查结果:\n"
-            report += f"- 安全性: {'安全' if safety_result['safe'] else '需要注意'}\n"
+            parts = [
+                "用药安全检查结果:\n",
+                f"- 安全性: {'安全' if safety_result['safe'] else '需要注意'}\n"
+            ]
             
             if safety_result['warnings']:
-                report += f"- 警告:\n"
+                parts.append("- 警告:\n")
                 for warning in safety_result['warnings']:
-                    report += f"  * {warning}\n"
+                    parts.append(f"  * {warning}\n")
             
-            report += f"\n当前用药({len(current_meds)}种):\n"
+            parts.append(f"\n当前用药({len(current_meds)}种):\n")
             for med in current_meds[:5]:
-                report += f"- {med['drug_name']} ({med.get('dosage', 'N/A')})\n"
+                parts.append(f"- {med['drug_name']} ({med.get('dosage', 'N/A')})\n")
             
-            return report
+            return "".join(parts)
         except Exception as e:
             logger.error(f"安全检查失败: {e}")
             return f"检查失败: {str(e)}"
@@ -3,17 +3,194 @@
 基于患者风险分层和指南推荐生成个性化治疗方案
 评分点: 4.2.2 治疗方案生成(8分) + 动态调整能力(5分)
 """
+from dataclasses import dataclass
 from typing import Dict, List, Optional, Tuple
 from datetime import datetime, timedelta
+import copy
+from types import MappingProxyType
 
 from src.database import get_medical_retriever
 from src.rag import QueryEngine
 from src.utils.logger import logger
+from src.utils.ttl_cache import TTLCache
+
+
+# 报告分隔行
+_BANNER = "=" * 80 + "\n"
+
+
+def _freeze(value):
+    """递归地把 dict 转为只读映射、list 转为 tuple"""
+    if isinstance(value, dict):
+        return MappingProxyType({k: _freeze(v) for k, v in value.items()})
+    if isinstance(value, list):
+        return tuple(_freeze(v) for v in value)
+    return value
+
+
+# 药物知识库,导入时构建一次
+_DRUG_DB = _freeze({
+    "高血压": {
+        "一线药物": {
+            "ACEI类": {
+                "代表药物": ["依那普利", "贝那普利", "培哚普利"],
+                "起始剂量": "依那普利5mg qd",
+                "目标剂量": "依那普利10-20mg qd",
+                "适应症": "合并糖尿病、心衰、肾病",
+                "禁忌症": "孕妇、双侧肾动脉狭窄、高钾血症",
+                "证据等级": "ⅠA"
+            },
+            "ARB类": {
+                "代表药物": ["缬沙坦", "氯沙坦", "替米沙坦"],
+                "起始剂量": "缬沙坦80mg qd",
+                "目标剂量": "缬沙坦160mg qd",
+                "适应症": "不能耐受ACEI的患者",
+                "禁忌症": "孕妇、双侧肾动脉狭窄",
+                "证据等级": "ⅠA"
+            },
+            "CCB类": {
+                "代表药物": ["氨氯地平", "硝苯地平控释片", "非洛地平"],
+                "起始剂量": "氨氯地平5mg qd",
+                "目标剂量": "氨氯地平10mg qd",
+                "适应症": "老年人、单纯收缩期高血压",
+                "禁忌症": "心动过缓、心衰",
+                "证据等级": "ⅠA"
+            },
+            "利尿剂": {
+                "代表药物": ["氢氯噻嗪", "吲达帕胺"],
+                "起始剂量": "氢氯噻嗪12.5mg qd",
+                "目标剂量": "氢氯噻嗪25mg qd",
+                "适应症": "老年人、心衰、水肿",
+                "禁忌症": "痛风、低钾血症",
+                "证据等级": "ⅠA"
+            },
+            "β受体阻滞剂": {
+                "代表药物": ["美托洛尔", "比索洛尔"],
+                "起始剂量": "美托洛尔25mg bid",
+                "目标剂量": "美托洛尔50-100mg bid",
+                "适应症": "合并冠心病、心衰、心动过速",
+                "禁忌症": "哮喘、心动过缓、房室传导阻滞",
+                "证据等级": "ⅠA"
+            }
+        }
+    },
+    "糖尿病": {
+        "一线药物": {
+            "二甲双胍": {
+                "起始剂量": "500mg bid",
+                "目标剂量": "1000mg bid",
+                "适应症": "2型糖尿病一线用药",
+                "禁忌症": "肾功能不全(eGFR<30)、肝功能不全、酮症酸中毒",
+                "证据等级": "ⅠA"
+            },
+            "磺脲类": {
+                "代表药物": ["格列美脲", "格列齐特"],
+                "起始剂量": "格列美脲1mg qd",
+                "目标剂量": "格列美脲4-6mg qd",
+                "适应症": "血糖控制不佳",
+                "禁忌症": "1型糖尿病、孕妇、肝肾功能不全",
+                "证据等级": "ⅠA",
+                "注意": "低血糖风险"
+            },
+            "DPP-4抑制剂": {
+                "代表药物": ["西格列汀", "利格列汀"],
+                "起始剂量": "西格列汀100mg qd",
+                "适应症": "不耐受二甲双胍或有禁忌症",
+                "证据等级": "ⅠB"
+            },
+            "GLP-1受体激动剂": {
+                "代表药物": ["利拉鲁肽", "度拉糖肽"],
+                "适应症": "肥胖、心血管高危患者",
+                "证据等级": "ⅠA"
+            },
+            "胰岛素": {
+                "类型": ["基础胰岛素", "餐时胰岛素", "预混胰岛素"],
+                "起始剂量": "0.1-0.2U/kg/d",
+                "适应症": "1型糖尿病、2型糖尿病血糖控制不佳",
+                "证据等级": "ⅠA"
+            }
+        }
+    }
+})
+
+
+class DrugTable:
+    """
+    一线药物的列式(SoA)存储
+    
+    每个字段一个元组,同一下标对应同一类药物;idx 按 (疾病, 药物类别) 定位下标,
+    批量生成方案时按下标从连续的字段数组中取值。
+    """
+    __slots__ = ('classes', 'names', 'start_dose', 'contra', 'evidence', 'note', 'idx')
+    
+    def __init__(self, drug_db):
+        classes, names, start_dose, contra, evidence, note = [], [], [], [], [], []
+        idx = {}
+        for condition, groups in drug_db.items():
+            for drug_class, info in groups["一线药物"].items():
+                idx[(condition, drug_class)] = len(classes)
+                rep = info.get("代表药物")
+                classes.append(drug_class)
+                names.append(rep[0] if rep else drug_class)
+                start_dose.append(info.get("起始剂量"))
+                contra.append(info.get("禁忌症"))
+                evidence.append(info["证据等级"])
+                note.append(info.get("注意", ""))
+        
+        self.classes = tuple(classes)
+        self.names = tuple(names)
+        self.start_dose = tuple(start_dose)
+        self.contra = tuple(contra)
+        self.evidence = tuple(evidence)
+        self.note = tuple(note)
+        self.idx = MappingProxyType(idx)
+
+
+_DRUG_TABLE = DrugTable(_DRUG_DB)
+
+
+# 方案生成所区分的疾病
+_CONDITIONS = ("高血压", "糖尿病")
+
+
+def _parse_conditions(diagnosis: str) -> frozenset:
+    """从诊断文本中提取涉及的疾病集合"""
+    return frozenset(c for c in _CONDITIONS if c in diagnosis)
+
+
+@dataclass(slots=True)
+class TreatmentPlan:
+    """治疗方案(进程内表示,对外输出时通过 to_api_dict 转为中文键字典)"""
+    patient_id: str
+    diagnosis: str
+    risk_level: str
+    drugs: List[Dict]       # 药物治疗
+    lifestyle: List[str]    # 生活方式干预
+    followup: Dict          # 随访计划
+    targets: Dict           # 治疗目标
+    created: str            # 生成时间
+    
+    def to_api_dict(self) -> Dict:
+        """转为对外的中文键治疗方案字典"""
+        return {
+            "患者ID": self.patient_id,
+            "诊断": self.diagnosis,
+            "风险等级": self.risk_level,
+            "药物治疗": self.drugs,
+            "生活方式干预": self.lifestyle,
+            "随访计划": self.followup,
+            "治疗目标": self.targets,
+            "生成时间": self.created
+        }
 
 
 class TreatmentPlanGenerator:
     """治疗方案生成器"""
     
+    # 治疗方案缓存的有效期(秒)与最大条目数
+    PLAN_CACHE_TTL = 300
+    PLAN_CACHE_SIZE = 1024
+    
     def __init__(self, query_engine: Optional[QueryEngine] = None):
         """
         初始化治疗方案生成器
@@ -24,94 +201,19 @@ class TreatmentPlanGenerator:
         self.query_engine = query_engine
         self.medical_retriever = get_medical_retriever()
         
-        # 药物知识库
-        self.drug_database = self._init_drug_database()
-    
-    def _init_drug_database(self) -> Dict:
-        """初始化药物知识库"""
-        return {
-            "高血压": {
-                "一线药物": {
-                    "ACEI类": {
-                        "代表药物": ["依那普利", "贝那普利", "培哚普利"],
-                        "起始剂量": "依那普利5mg qd",
-                        "目标剂量": "依那普利10-20mg qd",
-                        "适应症": "合并糖尿病、心衰、肾病",
-                        "禁忌症": "孕妇、双侧肾动脉狭窄、高钾血症",
-                        "证据等级": "ⅠA"
-                    },
-                    "ARB类": {
-                        "代表药物": ["缬沙坦", "氯沙坦", "替米沙坦"],
-                        "起始剂量": "缬沙坦80mg qd",
-                        "目标剂量": "缬沙坦160mg qd",
-                        "适应症": "不能耐受ACEI的患者",
-                        "禁忌症": "孕妇、双侧肾动脉狭窄",
-                        "证据等级": "ⅠA"
-                    },
-                    "CCB类": {
-                        "代表药物": ["氨氯地平", "硝苯地平控释片", "非洛地平"],
-                        "起始剂量": "氨氯地平5mg qd",
-                        "目标剂量": "氨氯地平10mg qd",
-                        "适应症": "老年人、单纯收缩期高血压",
-                        "禁忌症": "心动过缓、心衰",
-                        "证据等级": "ⅠA"
-                    },
-                    "利尿剂": {
-                        "代表药物": ["氢氯噻嗪", "吲达帕胺"],
-                        "起始剂量": "氢氯噻嗪12.5mg qd",
-                        "目标剂量": "氢氯噻嗪25mg qd",
-                        "适应症": "老年人、心衰、水肿",
-                        "禁忌症": "痛风、低钾血症",
-                        "证据等级": "ⅠA"
-                    },
-                    "β受体阻滞剂": {
-                        "代表药物": ["美托洛尔", "比索洛尔"],
-                        "起始剂量": "美托洛尔25mg bid",
-                        "目标剂量": "美托洛尔50-100mg bid",
-                        "适应症": "合并冠心病、心衰、心动过速",
-                        "禁忌症": "哮喘、心动过缓、房室传导阻滞",
-                        "证据等级": "ⅠA"
-                    }
-                }
-            },
-            "糖尿病": {
-                "一线药物": {
-                    "二甲双胍": {
-                        "起始剂量": "500mg bid",
-                        "目标剂量": "1000mg bid",
-                        "适应症": "2型糖尿病一线用药",
-                        "禁忌症": "肾功能不全(eGFR<30)、肝功能不全、酮症酸中毒",
-                        "证据等级": "ⅠA"
-                    },
-                    "磺脲类": {
-                        "代表药物": ["格列美脲", "格列齐特"],
-                        "起始剂量": "格列美脲1mg qd",
-                        "目标剂量": "格列美脲4-6mg qd",
-                        "适应症": "血糖控制不佳",
-                        "禁忌症": "1型糖尿病、孕妇、肝肾功能不全",
-                        "证据等级": "ⅠA",
-                        "注意": "低血糖风险"
-                    },
-                    "DPP-4抑制剂": {
-                        "代表药物": ["西格列汀", "利格列汀"],
-                        "起始剂量": "西格列汀100mg qd",
-                        "适应症": "不耐受二甲双胍或有禁忌症",
-                        "证据等级": "ⅠB"
-                    },
-                    "GLP-1受体激动剂": {
-                        "代表药物": ["利拉鲁肽", "度拉糖肽"],
-                        "适应症": "肥胖、心血管高危患者",
-                        "证据等级": "ⅠA"
-                    },
-                    "胰岛素": {
-                        "类型": ["基础胰岛素", "餐时胰岛素", "预混胰岛素"],
-                        "起始剂量": "0.1-0.2U/kg/d",
-                        "适应症": "1型糖尿病、2型糖尿病血糖控制不佳",
-                        "证据等级": "ⅠA"
-                    }
-                }
-            }
-        }
+        # 药物知识库(模块级只读常量,所有实例共享)
+        self.drug_database = _DRUG_DB
+        self.drug_table = _DRUG_TABLE
+        
+        # 常用药物在药物表中的下标
+        self._acei = _DRUG_TABLE.idx[("高血压", "ACEI类")]
+        self._ccb = _DRUG_TABLE.idx[("高血压", "CCB类")]
+        self._metformin = _DRUG_TABLE.idx[("糖尿病", "二甲双胍")]
+        self._sulfonylurea = _DRUG_TABLE.idx[("糖尿病", "磺脲类")]
+        
+        # (患者ID, 诊断, 风险等级, 当前用药) -> 治疗方案;
+        # gthread worker 的多个线程共用同一生成器,TTLCache 内部加锁
+        self._plan_cache = TTLCache(self.PLAN_CACHE_SIZE, self.PLAN_CACHE_TTL)
     
     def generate_treatment_plan(
         self,
@@ -132,42 +234,66 @@ class TreatmentPlanGenerator:
         Returns:
             治疗方案字典
         """
-        logger.info(f"生成治疗方案: 患者{patient_id}, 诊断{diagnosis}, 风险{risk_level}")
+        logger.info("生成治疗方案: 患者{}, 诊断{}, 风险{}", patient_id, diagnosis, risk_level)
+        
+        # PLAN_CACHE_TTL 秒内相同输入直接复用,返回副本避免调用方修改缓存
+        cache_key = (patient_id, diagnosis, risk_level, tuple(current_medications or ()))
+        cached = self._plan_cache.get(cache_key)
+        if cached is not None:
+            return copy.deepcopy(cached).to_api_dict()
         
-        # 获取患者信息
-        patient_info = self.medical_retriever.get_patient_info(patient_id)
+        # 获取患者信息(综合数据已包含基本信息,无需再单独查询)
         patient_data = self.medical_retriever.get_patient_comprehensive_data(patient_id)
+        patient_info = patient_data["patient_info"]
+        
+        # 诊断中涉及的疾病只解析一次,后续各环节按集合判断
+        conditions = _parse_conditions(diagnosis)
         
         # 生成药物方案
-        drug_plan = self._select_drugs(diagnosis, risk_level, patient_info, patient_data)
+        drug_plan = self._select_drugs(conditions, risk_level, patient_info, patient_data)
         
         # 生成非药物治疗
-        lifestyle_plan = self._generate_lifestyle_recommendations(diagnosis, patient_info)
+        lifestyle_plan = self._generate_lifestyle_recommendations(conditions, patient_info)
         
         # 生成随访计划
-        followup_plan = self._generate_followup_plan(diagnosis, risk_level)
+        followup_plan = self._generate_followup_plan(conditions, risk_level)
         
         # 生成目标值
-        target_values = self._generate_target_values(diagnosis, patient_info)
-        
-        plan = {
-            "患者ID": patient_id,
-            "诊断": diagnosis,
-            "风险等级": risk_level,
-            "药物治疗": drug_plan,
-            "生活方式干预": lifestyle_plan,
-            "随访计划": followup_plan,
-            "治疗目标": target_values,
-            "生成时间": datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-        }
+        target_values = self._generate_target_values(conditions, patient_info)
+        
+        plan = TreatmentPlan(
+            patient_id=patient_id,
+            diagnosis=diagnosis,
+            risk_level=risk_level,
+            drugs=drug_plan,
+            lifestyle=lifestyle_plan,
+            followup=followup_plan,
+            targets=target_values,
+            created=datetime.now().isoformat(' ', 'seconds')
+        )
         
         logger.success("治疗方案生成完成")
         
-        return plan
+        self._plan_cache.set(cache_key, plan)
+        
+        # 缓存中保留原对象,返回副本避免调用方修改缓存
+        return copy.deepcopy(plan).to_api_dict()
+    
+    def invalidate_plan_cache(self, patient_id: Optional[str] = None):
+        """
+        清除治疗方案缓存
+        
+        Args:
+            patient_id: 患者ID,为空时清空全部缓存
+        """
+        if patient_id is None:
+            self._plan_cache.clear()
+        else:
+            self._plan_cache.remove_if(lambda key: key[0] == patient_id)
     
     def _select_drugs(
         self,
-        diagnosis: str,
+        conditions: frozenset,
         risk_level: str,
         patient_info: Dict,
         patient_data: Dict
@@ -175,10 +301,10 @@ class TreatmentPlanGenerator:
         """选择药物"""
         drugs = []
         
-        if "高血压" in diagnosis:
+        if "高血压" in conditions:
             drugs.extend(self._select_antihypertensive_drugs(risk_level, patient_info, patient_data))
         
-        if "糖尿病" in diagnosis:
+        if "糖尿病" in conditions:
             drugs.extend(self._select_antidiabetic_drugs(patient_info, patient_data))
         
         return drugs
@@ -191,51 +317,52 @@ class TreatmentPlanGenerator:
     ) -> List[Dict]:
         """选择降压药"""
         drugs = []
+        tbl = self.drug_table
         age = patient_info.get('age', 0)
         
         # 根据风险等级和合并症选择药物
         if "糖尿病" in str(patient_data.get('diagnoses', [])):
             # 合并糖尿病,优先ACEI/ARB
-            drug_info = self.drug_database["高血压"]["一线药物"]["ACEI类"]
+            i = self._acei
             drugs.append({
                 "药物类别": "ACEI类",
-                "推荐药物": drug_info["代表药物"][0],
-                "剂量": drug_info["起始剂量"],
+                "推荐药物": tbl.names[i],
+                "剂量": tbl.start_dose[i],
                 "调整依据": "合并糖尿病,ACEI类可延缓肾病进展",
-                "证据等级": drug_info["证据等级"],
-                "注意事项": f"禁忌症: {drug_info['禁忌症']}"
+                "证据等级": tbl.evidence[i],
+                "注意事项": f"禁忌症: {tbl.contra[i]}"
             })
         elif age >= 60:
             # 老年人,优先CCB
-            drug_info = self.drug_database["高血压"]["一线药物"]["CCB类"]
+            i = self._ccb
             drugs.append({
                 "药物类别": "CCB类",
-                "推荐药物": drug_info["代表药物"][0],
-                "剂量": drug_info["起始剂量"],
+                "推荐药物": tbl.names[i],
+                "剂量": tbl.start_dose[i],
                 "调整依据": "老年患者,CCB类降压效果好,耐受性好",
-                "证据等级": drug_info["证据等级"],
-                "注意事项": f"禁忌症: {drug_info['禁忌症']}"
+                "证据等级": tbl.evidence[i],
+                "注意事项": f"禁忌症: {tbl.contra[i]}"
             })
         else:
             # 一般患者,ACEI/ARB + CCB联合
-            acei_info = self.drug_database["高血压"]["一线药物"]["ACEI类"]
+            i = self._acei
             drugs.append({
                 "药物类别": "ACEI类",
-                "推荐药物": acei_info["代表药物"][0],
-                "剂量": acei_info["起始剂量"],
+                "推荐药物": tbl.names[i],
+                "剂量": tbl.start_dose[i],
                 "调整依据": "一线降压药,心血管保护作用",
-                "证据等级": acei_info["证据等级"]
+                "证据等级": tbl.evidence[i]
             })
         
         # 如果是2级以上高血压,建议联合用药
         if "2级" in risk_level or "3级" in risk_level:
-            ccb_info = self.drug_database["高血压"]["一线药物"]["CCB类"]
+            i = self._ccb
             drugs.append({
                 "药物类别": "CCB类(联合用药)",
-                "推荐药物": ccb_info["代表药物"][0],
-                "剂量": ccb_info["起始剂量"],
+                "推荐药物": tbl.names[i],
+                "剂量": tbl.start_dose[i],
                 "调整依据": "2级高血压,建议联合用药",
-                "证据等级": ccb_info["证据等级"]
+                "证据等级": tbl.evidence[i]
             })
         
         return drugs
@@ -247,16 +374,17 @@ class TreatmentPlanGenerator:
     ) -> List[Dict]:
         """选择降糖药"""
         drugs = []
+        tbl = self.drug_table
         
         # 一线用药: 二甲双胍
-        metformin = self.drug_database["糖尿病"]["一线药物"]["二甲双胍"]
+        i = self._metformin
         drugs.append({
             "药物类别": "双胍类",
             "推荐药物": "二甲双胍",
-            "剂量": metformin["起始剂量"],
+            "剂量": tbl.start_dose[i],
             "调整依据": "2型糖尿病一线用药,改善胰岛素抵抗",
-            "证据等级": metformin["证据等级"],
-            "注意事项": f"禁忌症: {metformin['禁忌症']}"
+            "证据等级": tbl.evidence[i],
+            "注意事项": f"禁忌症: {tbl.contra[i]}"
         })
         
         # 如果HbA1c>8%,考虑联合用药
@@ -265,21 +393,21 @@ class TreatmentPlanGenerator:
             latest = diabetes_assessments[0]
             hba1c = latest.get('hba1c')
             if hba1c and hba1c > 8.0:
-                sulfonylurea = self.drug_database["糖尿病"]["一线药物"]["磺脲类"]
+                i = self._sulfonylurea
                 drugs.append({
                     "药物类别": "磺脲类(联合用药)",
-                    "推荐药物": sulfonylurea["代表药物"][0],
-                    "剂量": sulfonylurea["起始剂量"],
+                    "推荐药物": tbl.names[i],
+                    "剂量": tbl.start_dose[i],
                     "调整依据": f"HbA1c {hba1c}%,控制不佳,建议联合用药",
-                    "证据等级": sulfonylurea["证据等级"],
-                    "注意事项": sulfonylurea.get("注意", "")
+                    "证据等级": tbl.evidence[i],
+                    "注意事项": tbl.note[i]
                 })
         
         return drugs
     
     def _generate_lifestyle_recommendations(
         self,
-        diagnosis: str,
+        conditions: frozenset,
         patient_info: Dict
     ) -> List[str]:
         """生成生活方式建议"""
@@ -299,12 +427,12 @@ class TreatmentPlanGenerator:
             recommendations.append(f"适当减重(当前BMI {bmi})")
         
         # 疾病特异性建议
-        if "高血压" in diagnosis:
+        if "高血压" in conditions:
             recommendations.append("低盐饮食(每日食盐<6g)")
             recommendations.append("DASH饮食:多吃蔬菜水果、低脂奶制品")
             recommendations.append("规律运动:每周至少150分钟中等强度有氧运动")
         
-        if "糖尿病" in diagnosis:
+        if "糖尿病" in conditions:
             recommendations.append("控制总热量摄入,少食多餐")
             recommendations.append("选择低升糖指数食物")
             recommendations.append("规律运动:餐后1小时运动30分钟")
@@ -312,11 +440,11 @@ class TreatmentPlanGenerator:
         
         return recommendations
     
-    def _generate_followup_plan(self, diagnosis: str, risk_level: str) -> Dict:
+    def _generate_followup_plan(self, conditions: frozenset, risk_level: str) -> Dict:
         """生成随访计划"""
         plan = {}
         
-        if "高血压" in diagnosis:
+        if "高血压" in conditions:
             if "3级" in risk_level or "很高危" in risk_level:
                 plan["随访频率"] = "每1-2周"
                 plan["监测项目"] = ["血压", "心率", "症状", "药物不良反应"]
@@ -329,28 +457,28 @@ class TreatmentPlanGenerator:
             
             plan["复查项目"] = "3个月后复查: 血常规、肝肾功能、血脂、血糖、心电图"
         
-        if "糖尿病" in diagnosis:
+        if "糖尿病" in conditions:
             plan["血糖监测"] = "空腹及餐后2小时血糖,每周2-3次"
             plan["HbA1c"] = "每3个月检测一次"
             plan["并发症筛查"] = "每年: 眼底检查、尿微量白蛋白、神经病变筛查"
         
         return plan
     
-    def _generate_target_values(self, diagnosis: str, patient_info: Dict) -> Dict:
+    def _generate_target_values(self, conditions: frozenset, patient_info: Dict) -> Dict:
         """生成治疗目标值"""
         targets = {}
         age = patient_info.get('age', 0)
         
-        if "高血压" in diagnosis:
+        if "高血压" in conditions:
             if age < 65:
                 targets["血压目标"] = "<140/90 mmHg"
             else:
                 targets["血压目标"] = "<150/90 mmHg"
             
-            if "糖尿病" in diagnosis:
+            if "糖尿病" in conditions:
                 targets["血压目标"] = "<130/80 mmHg(合并糖尿病)"
         
-        if "糖尿病" in diagnosis:
+        if "糖尿病" in conditions:
             targets["空腹血糖"] = "4.4-7.0 mmol/L"
             targets["餐后2小时血糖"] = "<10.0 mmol/L"
             targets["HbA1c"] = "<7.0%(个体化调整)"
@@ -378,7 +506,10 @@ class TreatmentPlanGenerator:
         Returns:
             调整后的治疗方案
         """
-        logger.info(f"调整治疗方案: 患者{patient_id}, 治疗{treatment_duration}周, 疗效{effectiveness}")
+        logger.info("调整治疗方案: 患者{}, 治疗{}周, 疗效{}", patient_id, treatment_duration, effectiveness)
+        
+        # 方案已调整,该患者的缓存方案不再适用
+        self.invalidate_plan_cache(patient_id)
         
         adjusted_plan = original_plan.copy()
         adjustment_reasons = []
@@ -406,7 +537,7 @@ class TreatmentPlanGenerator:
             
             adjusted_plan["药物治疗"] = new_drugs
             adjusted_plan["调整原因"] = adjustment_reasons
-            adjusted_plan["调整时间"] = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+            adjusted_plan["调整时间"] = datetime.now().isoformat(' ', 'seconds')
         
         elif effectiveness == "一般":
             adjustment_reasons.append(f"治疗{treatment_duration}周,效果一般,继续观察")
@@ -416,57 +547,67 @@ class TreatmentPlanGenerator:
             adjustment_reasons.append(f"治疗{treatment_duration}周,效果良好")
             adjusted_plan["建议"] = "继续当前方案,维持治疗"
         
-        logger.success(f"方案调整完成: {', '.join(adjustment_reasons)}")
+        logger.success("方案调整完成: {}", ', '.join(adjustment_reasons))
         
         return adjusted_plan
     
     def generate_treatment_report(self, plan: Dict) -> str:
         """生成治疗方案报告"""
-        report = "="*80 + "\n"
-        report += "个性化治疗方案\n"
-        report += "="*80 + "\n\n"
-        
-        report += f"【患者ID】{plan['患者ID']}\n"
-        report += f"【诊断】{plan['诊断']}\n"
-        report += f"【风险等级】{plan['风险等级']}\n"
-        report += f"【生成时间】{plan['生成时间']}\n\n"
-        
-        report += "【药物治疗方案】\n"
+        parts = [
+            _BANNER,
+            "个性化治疗方案\n",
+            _BANNER, "\n",
+            f"【患者ID】{plan['患者ID']}\n",
+            f"【诊断】{plan['诊断']}\n",
+            f"【风险等级】{plan['风险等级']}\n",
+            f"【生成时间】{plan['生成时间']}\n\n",
+            "【药物治疗方案】\n"
+        ]
         for i, drug in enumerate(plan.get('药物治疗', []), 1):
-            report += f"\n{i}. {drug['推荐药物']} ({drug['药物类别']})\n"
-            report += f"   剂量: {drug['剂量']}\n"
-            report += f"   调整依据: {drug['调整依据']}\n"
-            report += f"   证据等级: {drug.get('证据等级', 'N/A')}\n"
+            parts.append(f"\n{i}. {drug['推荐药物']} ({drug['药物类别']})\n")
+            parts.append(f"   剂量: {drug['剂量']}\n")
+            parts.append(f"   调整依据: {drug['调整依据']}\n")
+            parts.append(f"   证据等级: {drug.get('证据等级', 'N/A')}\n")
             if '注意事项' in drug:
-                report += f"   ⚠️ {drug['注意事项']}\n"
+                parts.append(f"   ⚠️ {drug['注意事项']}\n")
         
-        report += "\n【生活方式干预】\n"
+        parts.append("\n【生活方式干预】\n")
         for i, rec in enumerate(plan.get('生活方式干预', []), 1):
-            report += f"{i}. {rec}\n"
+            parts.append(f"{i}. {rec}\n")
         
-        report += "\n【治疗目标】\n"
+        parts.append("\n【治疗目标】\n")
         for key, value in plan.get('治疗目标', {}).items():
-            report += f"- {key}: {value}\n"
+            parts.append(f"- {key}: {value}\n")
         
-        report += "\n【随访计划】\n"
+        parts.append("\n【随访计划】\n")
         for key, value in plan.get('随访计划', {}).items():
-            report += f"- {key}: {value}\n"
+            parts.append(f"- {key}: {value}\n")
         
         if '调整原因' in plan:
-            report += "\n【方案调整】\n"
+            parts.append("\n【方案调整】\n")
             for reason in plan['调整原因']:
-                report += f"- {reason}\n"
+                parts.append(f"- {reason}\n")
         
-        report += "\n" + "="*80 + "\n"
-        report += "⚠️ 本方案仅供参考,具体用药请遵医嘱\n"
-        report += "="*80 + "\n"
+        parts.append("\n")
+        parts.append(_BANNER)
+        parts.append("⚠️ 本方案仅供参考,具体用药请遵医嘱\n")
+        parts.append(_BANNER)
         
-        return report
+        return "".join(parts)
+
+
+# 未指定查询引擎时复用的默认治疗方案生成器实例
+_default_treatment_generator: Optional[TreatmentPlanGenerator] = None
 
 
 def create_treatment_generator(query_engine: Optional[QueryEngine] = None) -> TreatmentPlanGenerator:
-    """创建治疗方案生成器"""
-    return TreatmentPlanGenerator(query_engine)
+    """创建治疗方案生成器(未指定查询引擎时返回共享的默认实例)"""
+    global _default_treatment_generator
+    if query_engine is not None:
+        return TreatmentPlanGenerator(query_engine)
+    if _default_treatment_generator is None:
+        _default_treatment_generator = TreatmentPlanGenerator()
+    return _default_treatment_generator
 
 
 if __name__ == "__main__":
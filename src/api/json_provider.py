@@ -0,0 +1,48 @@
+"""
+基于 orjson 的 Flask JSON 序列化
+替换 Flask 默认的标准库 json 实现,jsonify 及 app.json 均通过它输出
+"""
+from typing import Any, Union
+
+from flask.json.provider import DefaultJSONProvider
+
+try:
+    import orjson
+except ImportError:  # 可选依赖,缺失时沿用 Flask 默认实现
+    orjson = None
+
+
+class ORJSONProvider(DefaultJSONProvider):
+    """
+    使用 orjson 序列化的 JSON Provider
+
+    日期时间等类型仍交给 Flask 的 default 处理,保证输出与默认实现一致;
+    numpy 标量/数组直接序列化,无需事先转换为 Python 对象。
+    """
+
+    def _option(self, indent: bool = False) -> int:
+        option = orjson.OPT_NON_STR_KEYS | orjson.OPT_SERIALIZE_NUMPY | orjson.OPT_PASSTHROUGH_DATETIME
+        if self.sort_keys:
+            option |= orjson.OPT_SORT_KEYS
+        if indent:
+            option |= orjson.OPT_INDENT_2
+        return option
+
+    def dumps(self, obj: Any, **kwargs: Any) -> str:
+        return orjson.dumps(obj, default=self.default, option=self._option()).decode("utf-8")
+
+    def loads(self, s: Union[str, bytes], **kwargs: Any) -> Any:
+        return orjson.loads(s)
+
+    def response(self, *args: Any, **kwargs: Any):
+        obj = self._prepare_response_obj(args, kwargs)
+        indent = (self.compact is None and self._app.debug) or self.compact is False
+        # orjson 直接产出 UTF-8 字节,省去 str -> bytes 的再编码
+        body = orjson.dumps(obj, default=self.default, option=self._option(indent))
+        return self._app.response_class(body + b"\n", mimetype=self.mimetype)
+
+
+def init_json_provider(app) -> None:
+    """orjson 可用时为应用启用 ORJSONProvider"""
+    if orjson is not None:
+        app.json = ORJSONProvider(app)
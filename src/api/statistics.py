@@ -1,5 +1,9 @@
+import os
+import tempfile
+import numpy as np
 import pandas as pd
-from flask import Blueprint, jsonify, request
+import pyarrow.parquet as pq
+from flask import Blueprint, Response, jsonify, request
 from pathlib import Path
 from src.utils.logger import logger
 from src.config import settings
@@ -7,62 +11,140 @@ from src.config import settings
 statistics_bp = Blueprint('statistics', __name__)
 
 EXCEL_FILE_PATH = Path(settings.project_root) / 'data' / '糖尿病病例统计.xlsx'
+# Excel 的列式副本,Excel 更新后自动重新生成
+PARQUET_FILE_PATH = EXCEL_FILE_PATH.with_suffix('.parquet')
 
+COL_GENDER = '性别 (Female=1, Male=2)'
+COL_AGE = '年龄 (years)'
+COL_HEIGHT = '身高 (m)'
+COL_WEIGHT = '体重 (kg)'
+COL_FASTING = '空腹胰岛素 (pmol/L)'
+COL_POSTPRANDIAL = '餐后2小时胰岛素 (pmol/L)'
 
-def classify_insulin_usage(row, col_fasting, col_postprandial):
+# 统计接口只需读取的列 -> 缓存中使用的短列名
+STATISTICS_COLUMNS = {
+    COL_GENDER: 'gender',
+    COL_AGE: 'age',
+    COL_HEIGHT: 'height',
+    COL_WEIGHT: 'weight',
+    COL_FASTING: 'fasting',
+    COL_POSTPRANDIAL: 'postprandial'
+}
+
+# Excel 解析开销大,按文件 mtime 缓存解析结果,文件更新后自动重新加载
+_DF_CACHE = {"mtime": None, "df": None}
+
+
+def classify_insulin_usage(fasting: pd.Series, postprandial: pd.Series) -> np.ndarray:
     """
-    分类胰岛素使用情况
+    分类胰岛素使用情况(按列向量化计算)
     - 两列都为空 → 'not_using' (未使用胰岛素)
     - 两列都有值 → 'using' (使用胰岛素)
     - 只有一列有值 → 'not_measured' (未测量/数据不完整)
     """
-    def is_empty(val):
+    def is_empty(col):
         """判断值是否为空：NaN, None 或 '/'"""
-        return pd.isna(val) or str(val).strip() == '/'
+        return col.isna() | (col.astype(str).str.strip() == '/')
 
-    fasting_empty = is_empty(row[col_fasting])
-    postprandial_empty = is_empty(row[col_postprandial])
-    
-    if fasting_empty and postprandial_empty:
-        return 'not_using'
-    elif not fasting_empty and not postprandial_empty:
-        return 'using'
-    else:
-        return 'not_measured'
-
-
-def get_age_group(age):
-    """年龄分组"""
-    if age < 40:
-        return '<40岁'
-    elif age < 60:
-        return '40-60岁'
-    elif age < 80:
-        return '60-80岁'
-    else:
-        return '≥80岁'
-
-
-def get_height_group(height):
-    """身高分组 (单位: 米)"""
-    if height < 1.55:
-        return '<1.55m'
-    elif height < 1.70:
-        return '1.55-1.70m'
-    else:
-        return '≥1.70m'
-
-
-def get_weight_group(weight):
-    """体重分组 (单位: kg)"""
-    if weight < 50:
-        return '<50kg'
-    elif weight < 70:
-        return '50-70kg'
-    elif weight < 90:
-        return '70-90kg'
-    else:
-        return '≥90kg'
+    fasting_empty = is_empty(fasting)
+    postprandial_empty = is_empty(postprandial)
+
+    return np.select(
+        [fasting_empty & postprandial_empty, ~fasting_empty & ~postprandial_empty],
+        ['not_using', 'using'],
+        default='not_measured'
+    )
+
+
+def _sync_parquet() -> Path:
+    """
+    Parquet 副本不存在或比 Excel 旧时,从 Excel 重新转换
+
+    Returns:
+        Parquet 文件路径
+    """
+    if PARQUET_FILE_PATH.exists() and PARQUET_FILE_PATH.stat().st_mtime >= EXCEL_FILE_PATH.stat().st_mtime:
+        return PARQUET_FILE_PATH
+
+    df = pd.read_excel(EXCEL_FILE_PATH)
+    # 混合类型的列无法直接写入 Parquet: 统计接口用到的列中以 '/' 表示缺失的转为数值,
+    # 其余混合类型的列一律存为字符串
+    for col in df.columns[df.dtypes == object]:
+        if col in STATISTICS_COLUMNS:
+            try:
+                df[col] = pd.to_numeric(df[col].replace('/', np.nan))
+                continue
+            except (ValueError, TypeError):
+                pass
+        df[col] = df[col].astype('string')
+
+    # 每次转换写入独立的临时文件再原子替换,多个 worker(或线程)同时转换时互不覆盖
+    fd, tmp_name = tempfile.mkstemp(dir=PARQUET_FILE_PATH.parent, prefix=f'{PARQUET_FILE_PATH.name}.', suffix='.tmp')
+    os.close(fd)
+    try:
+        df.to_parquet(tmp_name, compression='zstd', index=False)
+        os.replace(tmp_name, PARQUET_FILE_PATH)
+    except BaseException:
+        Path(tmp_name).unlink(missing_ok=True)
+        raise
+    logger.info(f"已生成统计数据的 Parquet 副本: {PARQUET_FILE_PATH}")
+    return PARQUET_FILE_PATH
+
+
+def _read_table(columns: list = None) -> pd.DataFrame:
+    """
+    读取统计数据,优先从 Parquet 副本按列读取
+
+    Args:
+        columns: 需要的列,为空时读取全部列;文件中不存在的列会被忽略
+
+    Returns:
+        统计数据
+    """
+    try:
+        path = _sync_parquet()
+    except Exception as e:
+        logger.warning(f"Parquet 副本不可用,直接读取Excel: {e}")
+        df = pd.read_excel(EXCEL_FILE_PATH)
+        return df if columns is None else df[[col for col in columns if col in df.columns]]
+
+    if columns is not None:
+        available = set(pq.read_schema(path).names)
+        columns = [col for col in columns if col in available]
+    return pq.read_table(path, columns=columns, memory_map=True).to_pandas()
+
+
+def _load_dataframe() -> pd.DataFrame:
+    """
+    读取统计接口所需的列,命中缓存时直接返回内存中的DataFrame
+
+    返回的DataFrame为共享缓存,调用方不得原地修改。
+
+    Returns:
+        统计数据,列名为 STATISTICS_COLUMNS 中的短列名,
+        包含列齐全时预先计算好的 insulin_status 列
+    """
+    mtime = EXCEL_FILE_PATH.stat().st_mtime
+    if _DF_CACHE["mtime"] != mtime:
+        df = _read_table(list(STATISTICS_COLUMNS)).rename(columns=STATISTICS_COLUMNS)
+        if 'fasting' in df.columns and 'postprandial' in df.columns:
+            df['insulin_status'] = classify_insulin_usage(df['fasting'], df['postprandial'])
+        _DF_CACHE.update(mtime=mtime, df=df)
+    return _DF_CACHE["df"]
+
+
+# 胰岛素使用状态,与 classify_insulin_usage 的取值对应
+INSULIN_STATUSES = ['using', 'not_using', 'not_measured']
+
+# 统计接口的客户端缓存时间(秒)
+STATISTICS_MAX_AGE = 60
+
+# 连续型维度的分组区间(左闭右开)与标签,按标签顺序输出
+_GROUP_BINS = {
+    'age': ([-np.inf, 40, 60, 80, np.inf], ['<40岁', '40-60岁', '60-80岁', '≥80岁']),      # 年龄分组
+    'height': ([-np.inf, 1.55, 1.70, np.inf], ['<1.55m', '1.55-1.70m', '≥1.70m']),        # 身高分组 (单位: 米)
+    'weight': ([-np.inf, 50, 70, 90, np.inf], ['<50kg', '50-70kg', '70-90kg', '≥90kg'])    # 体重分组 (单位: kg)
+}
 
 
 @statistics_bp.route('/api/statistics/insulin', methods=['GET'])
@@ -84,63 +166,54 @@ def get_insulin_statistics():
         if dimension not in valid_dimensions:
             return jsonify({"error": f"无效的维度参数，可选: {valid_dimensions}"}), 400
 
-        # 读取Excel文件
-        df = pd.read_excel(EXCEL_FILE_PATH)
-        
-        # 列名定义
-        col_gender = '性别 (Female=1, Male=2)'
-        col_age = '年龄 (years)'
-        col_height = '身高 (m)'
-        col_weight = '体重 (kg)'
-        col_fasting = '空腹胰岛素 (pmol/L)'
-        col_postprandial = '餐后2小时胰岛素 (pmol/L)'
+        # 以 Excel 修改时间 + 维度作为 ETag,数据未变化时直接返回 304
+        etag = f"{EXCEL_FILE_PATH.stat().st_mtime_ns}-{dimension}"
+        if request.if_none_match.contains_weak(etag):
+            not_modified = Response(status=304)
+            not_modified.set_etag(etag, weak=True)
+            return not_modified
+
+        # 读取统计数据(带缓存,insulin_status 已在加载时计算)
+        df = _load_dataframe()
         
         # 验证必需列
-        required_cols = [col_gender, col_age, col_height, col_weight, col_fasting, col_postprandial]
-        missing_cols = [col for col in required_cols if col not in df.columns]
+        missing_cols = [col for col, short in STATISTICS_COLUMNS.items() if short not in df.columns]
         if missing_cols:
             logger.error(f"Missing columns: {missing_cols}")
             return jsonify({"error": f"数据文件缺少列: {missing_cols}"}), 500
 
-        # 分类胰岛素使用情况
-        df['insulin_status'] = df.apply(
-            lambda row: classify_insulin_usage(row, col_fasting, col_postprandial), 
-            axis=1
-        )
-        
         # 计算总体分类统计
+        # to_dict() 产出 Python 原生 int,无需逐个转换
+        status_counts = df['insulin_status'].value_counts().reindex(INSULIN_STATUSES, fill_value=0).to_dict()
         classification = {
-            "using_insulin": int((df['insulin_status'] == 'using').sum()),
-            "not_using_insulin": int((df['insulin_status'] == 'not_using').sum()),
-            "not_measured": int((df['insulin_status'] == 'not_measured').sum())
+            "using_insulin": status_counts['using'],
+            "not_using_insulin": status_counts['not_using'],
+            "not_measured": status_counts['not_measured']
         }
 
-        # 根据维度分组
+        # 根据维度分组(在副本上添加分组列,不修改缓存的DataFrame)
+        df = df.copy(deep=False)
         if dimension == 'gender':
-            df['group'] = df[col_gender].map({1: '女性', 2: '男性'})
+            df['group'] = df['gender'].map({1: '女性', 2: '男性'})
             group_order = ['男性', '女性']
-        elif dimension == 'age':
-            df['group'] = df[col_age].apply(get_age_group)
-            group_order = ['<40岁', '40-60岁', '60-80岁', '≥80岁']
-        elif dimension == 'height':
-            df['group'] = df[col_height].apply(get_height_group)
-            group_order = ['<1.55m', '1.55-1.70m', '≥1.70m']
-        elif dimension == 'weight':
-            df['group'] = df[col_weight].apply(get_weight_group)
-            group_order = ['<50kg', '50-70kg', '70-90kg', '≥90kg']
-
-        # 按分组统计
-        distribution = []
-        for group_label in group_order:
-            group_df = df[df['group'] == group_label]
-            if len(group_df) > 0:
-                distribution.append({
-                    "label": group_label,
-                    "using": int((group_df['insulin_status'] == 'using').sum()),
-                    "not_using": int((group_df['insulin_status'] == 'not_using').sum()),
-                    "not_measured": int((group_df['insulin_status'] == 'not_measured').sum()),
-                    "total": len(group_df)
-                })
+        else:
+            bins, group_order = _GROUP_BINS[dimension]
+            df['group'] = pd.cut(df[dimension], bins=bins, labels=group_order, right=False)
+
+        # 按分组统计(一次 groupby 得到 分组 × 状态 的计数表)
+        counts = (
+            df.groupby('group', observed=True)['insulin_status']
+            .value_counts()
+            .unstack(fill_value=0)
+            .reindex(columns=INSULIN_STATUSES, fill_value=0)
+        )
+        counts['total'] = counts.sum(axis=1)
+        group_counts = counts.to_dict('index')
+        distribution = [
+            {"label": group_label, **group_counts[group_label]}
+            for group_label in group_order
+            if group_label in group_counts
+        ]
 
         # 构建响应
         stats = {
@@ -157,7 +230,10 @@ def get_insulin_statistics():
             "distribution": distribution
         }
 
-        return jsonify(stats)
+        resp = jsonify(stats)
+        resp.set_etag(etag, weak=True)
+        resp.headers['Cache-Control'] = f'public, max-age={STATISTICS_MAX_AGE}'
+        return resp
 
     except Exception as e:
         logger.error(f"Error processing statistics: {e}")
@@ -179,7 +255,7 @@ def get_patient_excel_data(patient_id: str) -> dict:
             logger.warning(f"Data file not found: {EXCEL_FILE_PATH}")
             return None
 
-        # 读取Excel
+        # 读取Excel(Parquet 副本中的列经过类型转换,'/' 和整数值与原表不一致,单个患者的数据以原表为准)
         df = pd.read_excel(EXCEL_FILE_PATH)
         
         # 查找匹配的行
@@ -10,9 +10,15 @@ project_root = Path(__file__).parent.parent
 sys.path.insert(0, str(project_root))
 
 import os
-from flask import Flask, request, jsonify, Response, render_template
+from concurrent.futures import ThreadPoolExecutor
+from flask import Flask, request, jsonify, Response, render_template, stream_with_context
 from flask_cors import CORS
 
+try:
+    from flask_compress import Compress
+except ImportError:  # 可选依赖,缺失时响应不压缩
+    Compress = None
+
 from src.config import settings, init_environment
 from src.utils.logger import logger
 from src.rag import get_knowledge_builder, create_query_engine
@@ -20,6 +26,7 @@ from src.agent import get_safety_checker, create_medical_tools
 from src.database import get_medical_retriever
 from src.database import get_medical_retriever
 from src.api.statistics import statistics_bp, get_patient_excel_data
+from src.api.json_provider import init_json_provider
 
 # 初始化环境
 init_environment()
@@ -27,8 +34,18 @@ init_environment()
 # 创建Flask应用
 app = Flask(__name__)
 CORS(app)  # 启用CORS
+init_json_provider(app)  # 使用 orjson 序列化 JSON 响应
+if Compress is not None:
+    # 流式响应(对话)不压缩,否则gzip缓冲会延迟分片下发
+    app.config['COMPRESS_STREAMS'] = False
+    Compress(app)
 app.register_blueprint(statistics_bp)
 
+# 流式对话末尾的免责声明,预先编码一次
+_CHAT_DISCLAIMER = ("\n\n" + "=" * 60 + "\n"
+                    "⚠️ 本建议仅供参考,具体诊疗请咨询医生。\n"
+                    + "=" * 60).encode("utf-8")
+
 # 全局变量
 query_engine = None
 medical_tools = None
@@ -43,28 +60,36 @@ def initialize_app():
     logger.info("初始化应用组件...")
     
     try:
-        # 1. 加载知识库
-        logger.info("加载RAG知识库...")
+        # 知识库加载、安全检查器、医疗数据检索器互不依赖,并行初始化
         builder = get_knowledge_builder()
-        index = builder.load_index(settings.knowledge_base_path)
-        
-        if index:
-            query_engine = create_query_engine(index)
-            logger.success("RAG知识库加载成功")
-        else:
-            logger.warning("RAG知识库未找到,部分功能可能不可用")
-        
-        # 2. 初始化医疗工具
-        medical_tools = create_medical_tools(query_engine)
-        logger.success("医疗工具集初始化成功")
-        
-        # 3. 初始化安全检查器
-        safety_checker = get_safety_checker()
-        logger.success("安全检查器初始化成功")
-        
-        # 4. 初始化医疗数据检索器
-        medical_retriever = get_medical_retriever()
-        logger.success("医疗数据检索器初始化成功")
+        with ThreadPoolExecutor(max_workers=3) as executor:
+            logger.info("加载RAG知识库...")
+            index_future = executor.submit(builder.load_index, settings.knowledge_base_path)
+            safety_future = executor.submit(get_safety_checker)
+            retriever_future = executor.submit(get_medical_retriever)
+            
+            # 1. 加载知识库
+            index = index_future.result()
+            if index:
+                query_engine = create_query_engine(index)
+                logger.success("RAG知识库加载成功")
+                # preload 模式下由各 worker 在 fork 后预热,避免主进程建立的连接被多个 worker 共享
+                if os.environ.get("PRELOAD_APP", "0") != "1":
+                    query_engine.prewarm()
+            else:
+                logger.warning("RAG知识库未找到,部分功能可能不可用")
+            
+            # 2. 初始化安全检查器
+            safety_checker = safety_future.result()
+            logger.success("安全检查器初始化成功")
+            
+            # 3. 初始化医疗数据检索器
+            medical_retriever = retriever_future.result()
+            logger.success("医疗数据检索器初始化成功")
+            
+            # 4. 初始化医疗工具(依赖查询引擎和已创建的检索器)
+            medical_tools = create_medical_tools(query_engine)
+            logger.success("医疗工具集初始化成功")
         
         logger.success("✅ 应用初始化完成")
         
@@ -147,30 +172,32 @@ def chat():
                 #         context_str = json.dumps(comprehensive_data, ensure_ascii=False, indent=2, default=str)
                 #         current_question = f"【患者综合档案】\n{context_str}\n\n【用户问题】\n{question}"
 
-                # 流式查询
-                response_text = ""
+                # 未启用安全检查时直接转发分片,不收集全文
+                if not (enable_safety and safety_checker):
+                    for chunk in query_engine.query_stream(current_question):
+                        yield chunk.encode("utf-8")
+                    return
+                
+                # 流式查询(分片收集,结束后一次拼接用于安全检查)
+                chunks = []
                 for chunk in query_engine.query_stream(current_question):
-                    response_text += chunk
-                    yield chunk
+                    chunks.append(chunk)
+                    yield chunk.encode("utf-8")
                 
-                # 如果启用安全检查,在最后添加安全提示
-                if enable_safety and safety_checker:
-                    # 检查高风险内容
-                    risk_result = safety_checker.detect_high_risk_content(response_text)
-                    if risk_result["is_high_risk"]:
-                        yield "\n\n" + risk_result["warning_message"]
-                    
-                    # 添加免责声明
-                    disclaimer = "\n\n" + "="*60 + "\n"
-                    disclaimer += "⚠️ 本建议仅供参考,具体诊疗请咨询医生。\n"
-                    disclaimer += "="*60
-                    yield disclaimer
+                # 检查高风险内容,在最后添加安全提示
+                risk_result = safety_checker.detect_high_risk_content("".join(chunks))
+                if risk_result["is_high_risk"]:
+                    yield ("\n\n" + risk_result["warning_message"]).encode("utf-8")
+                
+                # 添加免责声明(模块级预编码)
+                yield _CHAT_DISCLAIMER
                     
             except Exception as e:
                 logger.error(f"对话生成失败: {e}")
-                yield f"\n\n错误: {str(e)}"
+                yield f"\n\n错误: {str(e)}".encode("utf-8")
         
-        return Response(generate(), mimetype="text/plain")
+        # 禁止反向代理缓冲,保证每个分片及时下发
+        return Response(generate(), mimetype="text/plain", headers={"X-Accel-Buffering": "no"})
         
     except Exception as e:
         logger.error(f"对话接口错误: {e}")
@@ -215,10 +242,18 @@ def get_patient_comprehensive(patient_id: str):
         
         data = medical_retriever.get_patient_comprehensive_data(patient_id)
         
-        if data.get('patient_info'):
-            return jsonify(data)
-        else:
+        if not data.get('patient_info'):
             return jsonify({"error": f"未找到患者: {patient_id}"}), 404
+        
+        # 客户端声明接受 NDJSON 时按数据分区逐行输出,便于边接收边解析
+        if request.accept_mimetypes.best_match(['application/json', 'application/x-ndjson']) == 'application/x-ndjson':
+            def generate_ndjson():
+                for section, value in data.items():
+                    yield app.json.dumps({"section": section, "data": value}) + "\n"
+            
+            return Response(stream_with_context(generate_ndjson()), mimetype='application/x-ndjson')
+        
+        return jsonify(data)
             
     except Exception as e:
         logger.error(f"获取综合数据失败: {e}")
@@ -290,6 +325,12 @@ def internal_error(error):
     return jsonify({"error": "服务器内部错误"}), 500
 
 
+# 由 gunicorn 等 WSGI 服务器以 preload 方式加载时(见 gunicorn.conf.py),在主进程导入阶段完成初始化,
+# worker fork 后共享已加载的组件
+if __name__ != "__main__" and os.environ.get("PRELOAD_APP", "0") == "1":
+    initialize_app()
+
+
 if __name__ == "__main__":
     # 初始化应用
     initialize_app()
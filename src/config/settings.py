@@ -3,15 +3,14 @@
 加载和管理系统配置,包括API密钥、数据库连接等
 """
 import os
+from functools import lru_cache
 from pathlib import Path
 from typing import Optional
 from pydantic_settings import BaseSettings
 from pydantic import Field, computed_field
-from dotenv import load_dotenv
 
-# 加载.env文件
+# .env文件路径(由 pydantic-settings 在构建 Settings 时读取,不依赖当前工作目录)
 env_path = Path(__file__).parent.parent.parent / '.env'
-load_dotenv(env_path)
 
 
 class Settings(BaseSettings):
@@ -37,6 +36,8 @@ class Settings(BaseSettings):
     llm_model: str = Field(default="qwen-plus-2025-07-28", env="LLM_MODEL")
     multimodal_model: str = Field(default="qwen-vl-plus", env="MULTIMODAL_MODEL")
     knowledge_base_path: str = Field(default="./knowledge_base/medical", env="KNOWLEDGE_BASE_PATH")
+    rag_similarity_cutoff: float = Field(default=0.5, env="RAG_SIMILARITY_CUTOFF")
+    prewarm_enabled: bool = Field(default=True, env="PREWARM_ENABLED")
     
     # 智能体配置
     agent_model: str = Field(default="qwen-plus-latest", env="AGENT_MODEL")
@@ -69,18 +70,19 @@ class Settings(BaseSettings):
         return True
     
     class Config:
-        env_file = ".env"
+        env_file = str(env_path)
         env_file_encoding = "utf-8"
         extra = "ignore"  # 忽略额外字段
 
 
-# 全局配置实例
-settings = Settings()
+@lru_cache(maxsize=1)
+def get_settings() -> Settings:
+    """获取配置实例(只构建一次,避免重复读取 .env 和校验字段)"""
+    return Settings()
 
 
-def get_settings() -> Settings:
-    """获取配置实例"""
-    return settings
+# 全局配置实例,与 get_settings() 返回同一对象
+settings = get_settings()
 
 
 def init_environment():
@@ -1,6 +1,6 @@
 """数据库模块初始化"""
-from .mysql_connector import get_db_connector, db_connector
-from .medical_data_retriever import get_medical_retriever, medical_retriever
+from .mysql_connector import get_db_connector
+from .medical_data_retriever import get_medical_retriever
 
 __all__ = [
     'get_db_connector',
@@ -8,3 +8,15 @@ __all__ = [
     'get_medical_retriever',
     'medical_retriever'
 ]
+
+# 实例按需创建(PEP 562),导入本模块时不连接数据库
+_LAZY_INSTANCES = {
+    'db_connector': get_db_connector,
+    'medical_retriever': get_medical_retriever
+}
+
+
+def __getattr__(name):
+    if name not in _LAZY_INSTANCES:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    return _LAZY_INSTANCES[name]()
@@ -2,18 +2,208 @@
 医疗数据检索模块
 提供患者信息、病历、检验结果等医疗数据的查询功能
 """
+import copy
 from typing import Optional, List, Dict, Any
 from datetime import datetime, date
+from functools import lru_cache
+
+from sqlalchemy import bindparam, text
+from sqlalchemy.sql.elements import TextClause
 
 from src.database.mysql_connector import get_db_connector
 from src.utils.logger import logger
+from src.utils.ttl_cache import TTLCache
+
+# 各表查询返回的列: 只取调用方(接口、前端、诊断/治疗模块)用到的列,
+# 不读取电话、住址等未使用的字段和记录维护时间
+_PATIENT_INFO_COLUMNS = "patient_id, name, gender, age, height_cm, weight_kg, bmi"
+_MEDICAL_RECORDS_COLUMNS = (
+    "record_id, patient_id, visit_date, chief_complaint, present_illness, past_history, "
+    "family_history, physical_exam, preliminary_diagnosis, final_diagnosis, hospital, department"
+)
+_LAB_RESULTS_COLUMNS = (
+    "result_id, patient_id, record_id, test_date, test_type, test_item, "
+    "result_value, unit, reference_range, is_abnormal, test_notes"
+)
+_MEDICATIONS_COLUMNS = (
+    "med_id, patient_id, record_id, medication_date, drug_name, drug_class, "
+    "dosage, frequency, duration, prescribing_doctor, is_insulin"
+)
+_DIAGNOSES_COLUMNS = (
+    "diag_id, patient_id, record_id, diagnosis_date, diagnosis_code, diagnosis_name, "
+    "diagnosis_type, severity_level, icd10_code"
+)
+_DIABETES_ASSESSMENT_COLUMNS = (
+    "assessment_id, patient_id, assessment_date, fasting_glucose, postprandial_glucose, hba1c, "
+    "insulin_usage, insulin_type, insulin_dosage, control_status, complications"
+)
+_HYPERTENSION_ASSESSMENT_COLUMNS = (
+    "assessment_id, patient_id, assessment_date, sbp, dbp, heart_rate, risk_factors, "
+    "target_organs_damage, clinical_conditions, risk_level, follow_up_plan"
+)
+_GUIDELINE_COLUMNS = (
+    "rule_id, guideline_name, disease_type, patient_condition, recommendation_level, "
+    "recommendation_content, evidence_source, update_date"
+)
+
+# 固定的查询语句在导入时构造一次 text(),单条查询与批量查询共用
+_PATIENT_INFO_SQL = text(f"""
+SELECT {_PATIENT_INFO_COLUMNS} FROM patient_info
+WHERE patient_id = :patient_id
+""")
+_MEDICAL_RECORDS_SQL = text(f"""
+SELECT {_MEDICAL_RECORDS_COLUMNS} FROM medical_records
+WHERE patient_id = :patient_id
+ORDER BY visit_date DESC
+LIMIT :limit
+""")
+_LAB_RESULTS_SQL = text(f"""
+SELECT {_LAB_RESULTS_COLUMNS} FROM lab_results
+WHERE patient_id = :patient_id
+ORDER BY test_date DESC
+LIMIT :limit
+""")
+_LAB_RESULTS_BY_TYPE_SQL = text(f"""
+SELECT {_LAB_RESULTS_COLUMNS} FROM lab_results
+WHERE patient_id = :patient_id AND test_type = :test_type
+ORDER BY test_date DESC
+LIMIT :limit
+""")
+_ABNORMAL_LAB_RESULTS_SQL = text(f"""
+SELECT {_LAB_RESULTS_COLUMNS} FROM lab_results
+WHERE patient_id = :patient_id AND is_abnormal = 1
+ORDER BY test_date DESC
+LIMIT :limit
+""")
+_MEDICATIONS_SQL = text(f"""
+SELECT {_MEDICATIONS_COLUMNS} FROM medication_records
+WHERE patient_id = :patient_id
+ORDER BY medication_date DESC
+LIMIT :limit
+""")
+_DIAGNOSES_SQL = text(f"""
+SELECT {_DIAGNOSES_COLUMNS} FROM diagnosis_records
+WHERE patient_id = :patient_id
+ORDER BY diagnosis_date DESC
+LIMIT :limit
+""")
+_DIABETES_ASSESSMENT_SQL = text(f"""
+SELECT {_DIABETES_ASSESSMENT_COLUMNS} FROM diabetes_control_assessment
+WHERE patient_id = :patient_id
+ORDER BY assessment_date DESC
+LIMIT :limit
+""")
+_HYPERTENSION_ASSESSMENT_SQL = text(f"""
+SELECT {_HYPERTENSION_ASSESSMENT_COLUMNS} FROM hypertension_risk_assessment
+WHERE patient_id = :patient_id
+ORDER BY assessment_date DESC
+LIMIT :limit
+""")
+
+# 多患者批量查询: IN 列表在执行时按传入的ID个数展开,一条查询取回所有患者的数据
+_PATIENT_INFOS_SQL = text(f"""
+SELECT {_PATIENT_INFO_COLUMNS} FROM patient_info
+WHERE patient_id IN :patient_ids
+""").bindparams(bindparam("patient_ids", expanding=True))
+
+
+def _latest_rows_sql(table: str, columns: str, date_column: str) -> TextClause:
+    """
+    构造按患者分组取最近 N 条记录的批量查询语句
+    
+    Args:
+        table: 表名
+        columns: 返回的列
+        date_column: 排序用的日期列
+        
+    Returns:
+        以 patient_ids(列表) 和 limit(每位患者的条数) 为参数的查询语句
+    """
+    return text(f"""
+    SELECT {columns} FROM (
+        SELECT {columns}, ROW_NUMBER() OVER (PARTITION BY patient_id ORDER BY {date_column} DESC) AS _row_num
+        FROM {table}
+        WHERE patient_id IN :patient_ids
+    ) ranked
+    WHERE _row_num <= :limit
+    ORDER BY patient_id, _row_num
+    """).bindparams(bindparam("patient_ids", expanding=True))
+
+
+_BATCH_MEDICAL_RECORDS_SQL = _latest_rows_sql("medical_records", _MEDICAL_RECORDS_COLUMNS, "visit_date")
+_BATCH_LAB_RESULTS_SQL = _latest_rows_sql("lab_results", _LAB_RESULTS_COLUMNS, "test_date")
+_BATCH_MEDICATIONS_SQL = _latest_rows_sql("medication_records", _MEDICATIONS_COLUMNS, "medication_date")
+_BATCH_DIAGNOSES_SQL = _latest_rows_sql("diagnosis_records", _DIAGNOSES_COLUMNS, "diagnosis_date")
+_BATCH_DIABETES_ASSESSMENT_SQL = _latest_rows_sql(
+    "diabetes_control_assessment", _DIABETES_ASSESSMENT_COLUMNS, "assessment_date"
+)
+_BATCH_HYPERTENSION_ASSESSMENT_SQL = _latest_rows_sql(
+    "hypertension_risk_assessment", _HYPERTENSION_ASSESSMENT_COLUMNS, "assessment_date"
+)
+
+
+# 指南推荐查询: 按 (是否按疾病类型过滤, 是否按推荐等级过滤) 分派到固定的语句
+_GUIDELINE_QUERIES = {
+    (False, False): text(f"""
+SELECT {_GUIDELINE_COLUMNS} FROM guideline_recommendations
+WHERE is_active = 1
+ORDER BY update_date DESC
+LIMIT :limit
+"""),
+    (True, False): text(f"""
+SELECT {_GUIDELINE_COLUMNS} FROM guideline_recommendations
+WHERE is_active = 1 AND disease_type = :disease_type
+ORDER BY update_date DESC
+LIMIT :limit
+"""),
+    (False, True): text(f"""
+SELECT {_GUIDELINE_COLUMNS} FROM guideline_recommendations
+WHERE is_active = 1 AND recommendation_level = :recommendation_level
+ORDER BY update_date DESC
+LIMIT :limit
+"""),
+    (True, True): text(f"""
+SELECT {_GUIDELINE_COLUMNS} FROM guideline_recommendations
+WHERE is_active = 1 AND disease_type = :disease_type AND recommendation_level = :recommendation_level
+ORDER BY update_date DESC
+LIMIT :limit
+"""),
+}
 
 
 class MedicalDataRetriever:
     """医疗数据检索器"""
     
+    # 读穿缓存的有效期(秒): 指南推荐按天更新,患者信息在一次会话内基本不变
+    GUIDELINE_CACHE_TTL = 600
+    PATIENT_INFO_CACHE_TTL = 60
+    QUERY_CACHE_SIZE = 256
+    
     def __init__(self):
         self.db = get_db_connector()
+        # 检索器为进程内单例,gthread worker 的多个线程共用,TTLCache 内部加锁
+        self._guideline_cache = TTLCache(self.QUERY_CACHE_SIZE, self.GUIDELINE_CACHE_TTL)
+        self._patient_info_cache = TTLCache(self.QUERY_CACHE_SIZE, self.PATIENT_INFO_CACHE_TTL)
+    
+    def shared_connection(self):
+        """
+        连续调用多个检索方法时共用一个数据库连接
+        
+        用法:
+            with retriever.shared_connection():
+                info = retriever.get_patient_info(patient_id)
+                labs = retriever.get_patient_lab_results(patient_id)
+        """
+        return self.db.connection()
+    
+    def _cache_get(self, cache: TTLCache, key):
+        """读取未过期的缓存条目,命中时返回副本避免调用方修改缓存,未命中返回None"""
+        cached = cache.get(key)
+        if cached is None:
+            return None
+        stats = cache.stats()
+        logger.debug("查询缓存命中: {}, 命中/未命中: {}/{}", key, stats["hits"], stats["misses"])
+        return copy.deepcopy(cached)
     
     def get_patient_info(self, patient_id: str) -> Optional[Dict]:
         """
@@ -25,12 +215,17 @@ class MedicalDataRetriever:
         Returns:
             患者信息字典,如果不存在返回None
         """
-        query = """
-        SELECT * FROM patient_info 
-        WHERE patient_id = :patient_id
-        """
-        results = self.db.execute_query(query, {"patient_id": patient_id})
-        return results[0] if results else None
+        patient_info = self._cache_get(self._patient_info_cache, patient_id)
+        if patient_info is not None:
+            return patient_info
+        
+        results = self.db.execute_query(_PATIENT_INFO_SQL, {"patient_id": patient_id})
+        if not results:
+            # 不缓存未找到的患者,刚导入的患者可立即查到
+            return None
+        patient_info = results[0]
+        self._patient_info_cache.set(patient_id, copy.deepcopy(patient_info))
+        return patient_info
     
     def get_patient_medical_records(self, patient_id: str, limit: int = 10) -> List[Dict]:
         """
@@ -43,13 +238,7 @@ class MedicalDataRetriever:
         Returns:
             病历记录列表
         """
-        query = """
-        SELECT * FROM medical_records 
-        WHERE patient_id = :patient_id 
-        ORDER BY visit_date DESC 
-        LIMIT :limit
-        """
-        return self.db.execute_query(query, {"patient_id": patient_id, "limit": limit})
+        return self.db.execute_query(_MEDICAL_RECORDS_SQL, {"patient_id": patient_id, "limit": limit})
     
     def get_patient_lab_results(self, patient_id: str, test_type: Optional[str] = None, limit: int = 20) -> List[Dict]:
         """
@@ -64,20 +253,10 @@ class MedicalDataRetriever:
             检验结果列表
         """
         if test_type:
-            query = """
-            SELECT * FROM lab_results 
-            WHERE patient_id = :patient_id AND test_type = :test_type
-            ORDER BY test_date DESC 
-            LIMIT :limit
-            """
+            query = _LAB_RESULTS_BY_TYPE_SQL
             params = {"patient_id": patient_id, "test_type": test_type, "limit": limit}
         else:
-            query = """
-            SELECT * FROM lab_results 
-            WHERE patient_id = :patient_id 
-            ORDER BY test_date DESC 
-            LIMIT :limit
-            """
+            query = _LAB_RESULTS_SQL
             params = {"patient_id": patient_id, "limit": limit}
         
         return self.db.execute_query(query, params)
@@ -93,13 +272,7 @@ class MedicalDataRetriever:
         Returns:
             用药记录列表
         """
-        query = """
-        SELECT * FROM medication_records 
-        WHERE patient_id = :patient_id 
-        ORDER BY medication_date DESC 
-        LIMIT :limit
-        """
-        return self.db.execute_query(query, {"patient_id": patient_id, "limit": limit})
+        return self.db.execute_query(_MEDICATIONS_SQL, {"patient_id": patient_id, "limit": limit})
     
     def get_patient_diagnoses(self, patient_id: str, limit: int = 10) -> List[Dict]:
         """
@@ -112,13 +285,7 @@ class MedicalDataRetriever:
         Returns:
             诊断记录列表
         """
-        query = """
-        SELECT * FROM diagnosis_records 
-        WHERE patient_id = :patient_id 
-        ORDER BY diagnosis_date DESC 
-        LIMIT :limit
-        """
-        return self.db.execute_query(query, {"patient_id": patient_id, "limit": limit})
+        return self.db.execute_query(_DIAGNOSES_SQL, {"patient_id": patient_id, "limit": limit})
     
     def get_diabetes_assessment(self, patient_id: str, limit: int = 5) -> List[Dict]:
         """
@@ -131,13 +298,7 @@ class MedicalDataRetriever:
         Returns:
             糖尿病评估记录列表
         """
-        query = """
-        SELECT * FROM diabetes_control_assessment 
-        WHERE patient_id = :patient_id 
-        ORDER BY assessment_date DESC 
-        LIMIT :limit
-        """
-        return self.db.execute_query(query, {"patient_id": patient_id, "limit": limit})
+        return self.db.execute_query(_DIABETES_ASSESSMENT_SQL, {"patient_id": patient_id, "limit": limit})
     
     def get_hypertension_assessment(self, patient_id: str, limit: int = 5) -> List[Dict]:
         """
@@ -150,13 +311,7 @@ class MedicalDataRetriever:
         Returns:
             高血压评估记录列表
         """
-        query = """
-        SELECT * FROM hypertension_risk_assessment 
-        WHERE patient_id = :patient_id 
-        ORDER BY assessment_date DESC 
-        LIMIT :limit
-        """
-        return self.db.execute_query(query, {"patient_id": patient_id, "limit": limit})
+        return self.db.execute_query(_HYPERTENSION_ASSESSMENT_SQL, {"patient_id": patient_id, "limit": limit})
     
     def get_patient_comprehensive_data(self, patient_id: str) -> Dict[str, Any]:
         """
@@ -170,15 +325,24 @@ class MedicalDataRetriever:
         """
         logger.info(f"获取患者综合数据: {patient_id}")
         
-        data = {
-            "patient_info": self.get_patient_info(patient_id),
-            "medical_records": self.get_patient_medical_records(patient_id, limit=5),
-            "lab_results": self.get_patient_lab_results(patient_id, limit=10),
-            "medications": self.get_patient_medications(patient_id, limit=10),
-            "diagnoses": self.get_patient_diagnoses(patient_id, limit=5),
-            "diabetes_assessment": self.get_diabetes_assessment(patient_id, limit=3),
-            "hypertension_assessment": self.get_hypertension_assessment(patient_id, limit=3)
-        }
+        # 各部分的查询在同一连接上依次执行,避免 7 次连接检出
+        sections = [
+            ("patient_info", _PATIENT_INFO_SQL, None),
+            ("medical_records", _MEDICAL_RECORDS_SQL, 5),
+            ("lab_results", _LAB_RESULTS_SQL, 10),
+            ("medications", _MEDICATIONS_SQL, 10),
+            ("diagnoses", _DIAGNOSES_SQL, 5),
+            ("diabetes_assessment", _DIABETES_ASSESSMENT_SQL, 3),
+            ("hypertension_assessment", _HYPERTENSION_ASSESSMENT_SQL, 3)
+        ]
+        results = self.db.execute_many_queries([
+            (query, {"patient_id": patient_id} if limit is None else {"patient_id": patient_id, "limit": limit})
+            for _, query, limit in sections
+        ])
+        
+        data = {name: rows for (name, _, _), rows in zip(sections, results)}
+        # 患者基本信息为单条记录
+        data["patient_info"] = data["patient_info"][0] if data["patient_info"] else None
         
         return data
     
@@ -199,26 +363,21 @@ class MedicalDataRetriever:
         Returns:
             指南推荐列表
         """
-        conditions = ["is_active = 1"]
-        params = {"limit": limit}
+        cache_key = (disease_type, recommendation_level, limit)
+        recommendations = self._cache_get(self._guideline_cache, cache_key)
+        if recommendations is not None:
+            return recommendations
         
+        params = {"limit": limit}
         if disease_type:
-            conditions.append("disease_type = :disease_type")
             params["disease_type"] = disease_type
-        
         if recommendation_level:
-            conditions.append("recommendation_level = :recommendation_level")
             params["recommendation_level"] = recommendation_level
         
-        where_clause = " AND ".join(conditions)
-        query = f"""
-        SELECT * FROM guideline_recommendations 
-        WHERE {where_clause}
-        ORDER BY update_date DESC 
-        LIMIT :limit
-        """
-        
-        return self.db.execute_query(query, params)
+        query = _GUIDELINE_QUERIES[(bool(disease_type), bool(recommendation_level))]
+        recommendations = self.db.execute_query(query, params)
+        self._guideline_cache.set(cache_key, copy.deepcopy(recommendations))
+        return recommendations
     
     def get_abnormal_lab_results(self, patient_id: str, limit: int = 10) -> List[Dict]:
         """
@@ -231,22 +390,83 @@ class MedicalDataRetriever:
         Returns:
             异常检验结果列表
         """
-        query = """
-        SELECT * FROM lab_results 
-        WHERE patient_id = :patient_id AND is_abnormal = 1
-        ORDER BY test_date DESC 
-        LIMIT :limit
+        return self.db.execute_query(_ABNORMAL_LAB_RESULTS_SQL, {"patient_id": patient_id, "limit": limit})
+    
+    # ---- 多患者批量查询 ----
+    # 多患者分析时优先使用以下方法: 一次查询代替逐个患者调用,只占用一次连接和一次网络往返
+    
+    def get_patient_infos(self, patient_ids: List[str]) -> Dict[str, Dict]:
+        """
+        批量获取多位患者的基本信息
+        
+        Args:
+            patient_ids: 患者ID列表
+            
+        Returns:
+            {patient_id: 患者信息字典},不存在的患者不包含在结果中
         """
-        return self.db.execute_query(query, {"patient_id": patient_id, "limit": limit})
+        if not patient_ids:
+            return {}
+        rows = self.db.execute_query(_PATIENT_INFOS_SQL, {"patient_ids": list(patient_ids)})
+        return {row["patient_id"]: row for row in rows}
+    
+    def _get_latest_rows_by_patient(self, query: TextClause, patient_ids: List[str], limit: int) -> Dict[str, List[Dict]]:
+        """
+        执行按患者分组的批量查询,并按患者ID归组
+        
+        Args:
+            query: _latest_rows_sql 构造的查询语句
+            patient_ids: 患者ID列表
+            limit: 每位患者返回记录数限制
+            
+        Returns:
+            {patient_id: 记录列表},按 patient_ids 的顺序包含每位患者,无记录时为空列表
+        """
+        grouped = {patient_id: [] for patient_id in patient_ids}
+        if not grouped:
+            return grouped
+        
+        rows = self.db.execute_query(query, {"patient_ids": list(grouped), "limit": limit})
+        for row in rows:
+            grouped[row["patient_id"]].append(row)
+        return grouped
+    
+    def get_patients_medical_records(self, patient_ids: List[str], limit: int = 10) -> Dict[str, List[Dict]]:
+        """批量获取多位患者的病历记录,每位患者最多 limit 条"""
+        return self._get_latest_rows_by_patient(_BATCH_MEDICAL_RECORDS_SQL, patient_ids, limit)
+    
+    def get_patients_lab_results(self, patient_ids: List[str], limit: int = 20) -> Dict[str, List[Dict]]:
+        """批量获取多位患者的检验结果,每位患者最多 limit 条"""
+        return self._get_latest_rows_by_patient(_BATCH_LAB_RESULTS_SQL, patient_ids, limit)
+    
+    def get_patients_medications(self, patient_ids: List[str], limit: int = 10) -> Dict[str, List[Dict]]:
+        """批量获取多位患者的用药记录,每位患者最多 limit 条"""
+        return self._get_latest_rows_by_patient(_BATCH_MEDICATIONS_SQL, patient_ids, limit)
+    
+    def get_patients_diagnoses(self, patient_ids: List[str], limit: int = 10) -> Dict[str, List[Dict]]:
+        """批量获取多位患者的诊断记录,每位患者最多 limit 条"""
+        return self._get_latest_rows_by_patient(_BATCH_DIAGNOSES_SQL, patient_ids, limit)
+    
+    def get_patients_diabetes_assessment(self, patient_ids: List[str], limit: int = 5) -> Dict[str, List[Dict]]:
+        """批量获取多位患者的糖尿病控制评估记录,每位患者最多 limit 条"""
+        return self._get_latest_rows_by_patient(_BATCH_DIABETES_ASSESSMENT_SQL, patient_ids, limit)
+    
+    def get_patients_hypertension_assessment(self, patient_ids: List[str], limit: int = 5) -> Dict[str, List[Dict]]:
+        """批量获取多位患者的高血压风险评估记录,每位患者最多 limit 条"""
+        return self._get_latest_rows_by_patient(_BATCH_HYPERTENSION_ASSESSMENT_SQL, patient_ids, limit)
 
 
-# 全局医疗数据检索器实例
-medical_retriever = MedicalDataRetriever()
+@lru_cache(maxsize=1)
+def get_medical_retriever() -> MedicalDataRetriever:
+    """获取医疗数据检索器实例(首次调用时才创建)"""
+    return MedicalDataRetriever()
 
 
-def get_medical_retriever() -> MedicalDataRetriever:
-    """获取医疗数据检索器实例"""
-    return medical_retriever
+def __getattr__(name):
+    # 兼容旧的模块级实例 medical_retriever,访问时才创建
+    if name == 'medical_retriever':
+        return get_medical_retriever()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
 
 
 if __name__ == "__main__":
@@ -2,16 +2,27 @@
 MySQL数据库连接器
 提供数据库连接和基础操作
 """
-from typing import Optional, Dict, List, Any
+from typing import Optional, Dict, List, Any, Tuple, Union, Iterator
 from sqlalchemy import create_engine, text
+from sqlalchemy.sql.elements import TextClause
 from sqlalchemy.orm import sessionmaker, Session
 from sqlalchemy.pool import QueuePool
-from contextlib import contextmanager
+from contextlib import contextmanager, nullcontext
+from functools import lru_cache
+import threading
 import pymysql
 
 from src.config import settings
 from src.utils.logger import logger
 
+# 查询语句可以是 SQL 字符串,也可以是预先构造好的 text() 语句(省去每次调用时的解析)
+Query = Union[str, TextClause]
+
+
+def _as_statement(query: Query) -> TextClause:
+    """将 SQL 字符串转换为 text() 语句,已是 TextClause 时直接返回"""
+    return query if isinstance(query, TextClause) else text(query)
+
 
 class MySQLConnector:
     """MySQL数据库连接器"""
@@ -20,6 +31,8 @@ class MySQLConnector:
         """初始化数据库连接"""
         self.engine = None
         self.SessionLocal = None
+        # connection() 固定下来的连接,按线程隔离
+        self._local = threading.local()
         self._init_engine()
     
     def _init_engine(self):
@@ -67,41 +80,115 @@ class MySQLConnector:
         finally:
             session.close()
     
-    def execute_query(self, query: str, params: Optional[Dict] = None) -> List[Dict]:
+    @contextmanager
+    def connection(self):
+        """
+        在 with 块内固定一个连接,当前线程的 execute_query/execute_many_queries/execute_update
+        都复用该连接,连续多次查询只占用一次连接池检出;嵌套使用时沿用最外层的连接
+        
+        Yields:
+            数据库连接
+        """
+        conn = getattr(self._local, "conn", None)
+        if conn is not None:
+            yield conn
+            return
+        
+        with self.engine.connect() as conn:
+            self._local.conn = conn
+            try:
+                yield conn
+            finally:
+                self._local.conn = None
+    
+    def _connect(self):
+        """获取执行语句用的连接: 处于 connection() 块内时复用已固定的连接,否则从连接池检出"""
+        conn = getattr(self._local, "conn", None)
+        return nullcontext(conn) if conn is not None else self.engine.connect()
+    
+    def execute_query(self, query: Query, params: Optional[Dict] = None) -> List[Dict]:
         """
         执行查询语句
         
         Args:
-            query: SQL查询语句
+            query: SQL查询语句或 text() 语句
             params: 查询参数
             
         Returns:
             查询结果列表
         """
         try:
-            with self.engine.connect() as conn:
-                result = conn.execute(text(query), params or {})
-                # 将结果转换为字典列表
-                columns = result.keys()
-                return [dict(zip(columns, row)) for row in result.fetchall()]
+            with self._connect() as conn:
+                result = conn.execute(_as_statement(query), params or {})
+                # 将结果转换为字典列表(mappings() 复用列索引,无需逐行 zip 列名)
+                return [dict(row) for row in result.mappings()]
         except Exception as e:
             logger.error(f"查询执行失败: {query}, 错误: {e}")
             raise
     
-    def execute_update(self, query: str, params: Optional[Dict] = None) -> int:
+    def iter_query(self, query: Query, params: Optional[Dict] = None, chunk_size: int = 1000) -> Iterator[Dict]:
+        """
+        以服务端游标流式执行查询,逐行产出结果
+        
+        适用于导出、统计等结果集无上限的查询,内存占用与结果集大小无关;
+        有 LIMIT 的小查询仍使用 execute_query。迭代期间一直占用连接,
+        应尽快消费完毕,中途放弃时调用生成器的 close() 以归还连接。
+        
+        Args:
+            query: SQL查询语句或 text() 语句
+            params: 查询参数
+            chunk_size: 每次从服务端读取的行数
+            
+        Yields:
+            单行查询结果字典
+        """
+        try:
+            with self.engine.connect() as conn:
+                result = conn.execution_options(stream_results=True, yield_per=chunk_size).execute(
+                    _as_statement(query), params or {}
+                )
+                for row in result.mappings():
+                    yield dict(row)
+        except Exception as e:
+            logger.error(f"流式查询执行失败: {query}, 错误: {e}")
+            raise
+    
+    def execute_many_queries(self, queries: List[Tuple[Query, Optional[Dict]]]) -> List[List[Dict]]:
+        """
+        在同一个连接上依次执行多条查询语句,只占用一次连接池检出
+        
+        Args:
+            queries: (SQL查询语句或 text() 语句, 查询参数) 列表
+            
+        Returns:
+            与 queries 一一对应的查询结果列表
+        """
+        results = []
+        query = None
+        try:
+            with self._connect() as conn:
+                for query, params in queries:
+                    result = conn.execute(_as_statement(query), params or {})
+                    results.append([dict(row) for row in result.mappings()])
+            return results
+        except Exception as e:
+            logger.error(f"批量查询执行失败: {query}, 错误: {e}")
+            raise
+    
+    def execute_update(self, query: Query, params: Optional[Dict] = None) -> int:
         """
         执行更新语句(INSERT/UPDATE/DELETE)
         
         Args:
-            query: SQL更新语句
+            query: SQL更新语句或 text() 语句
             params: 更新参数
             
         Returns:
             影响的行数
         """
         try:
-            with self.engine.connect() as conn:
-                result = conn.execute(text(query), params or {})
+            with self._connect() as conn:
+                result = conn.execute(_as_statement(query), params or {})
                 conn.commit()
                 return result.rowcount
         except Exception as e:
@@ -123,13 +210,17 @@ class MySQLConnector:
             logger.info("数据库连接已关闭")
 
 
-# 全局数据库连接器实例
-db_connector = MySQLConnector()
+@lru_cache(maxsize=1)
+def get_db_connector() -> MySQLConnector:
+    """获取数据库连接器实例(首次调用时才建立连接)"""
+    return MySQLConnector()
 
 
-def get_db_connector() -> MySQLConnector:
-    """获取数据库连接器实例"""
-    return db_connector
+def __getattr__(name):
+    # 兼容旧的模块级实例 db_connector,访问时才创建
+    if name == 'db_connector':
+        return get_db_connector()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
 
 
 if __name__ == "__main__":
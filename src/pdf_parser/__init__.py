@@ -1,4 +1,22 @@
 """PDF解析模块初始化"""
-from .multimodal_parser import get_pdf_parser, MultimodalPDFParser
+import importlib
+
+# 名称 -> 所在子模块,首次访问时才导入(PEP 562),避免导入包时就加载 dashscope、pdf2image、PIL
+_LAZY_IMPORTS = {
+    'get_pdf_parser': '.multimodal_parser',
+    'MultimodalPDFParser': '.multimodal_parser'
+}
 
 __all__ = ['get_pdf_parser', 'MultimodalPDFParser']
+
+
+def __getattr__(name):
+    if name not in _LAZY_IMPORTS:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    value = getattr(importlib.import_module(_LAZY_IMPORTS[name], __name__), name)
+    globals()[name] = value  # 缓存,后续访问不再经过 __getattr__
+    return value
+
+
+def __dir__():
+    return sorted(set(globals()) | set(__all__))
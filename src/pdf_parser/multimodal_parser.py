@@ -2,28 +2,66 @@
 多模态PDF解析器
 使用阿里云多模态模型(qwen-vl-plus)解析PDF文档中的图文内容
 """
+import asyncio
 import base64
+import hashlib
+import os
+import tempfile
 from pathlib import Path
-from typing import List, Dict, Optional
+from typing import List, Dict, Optional, Union
 from io import BytesIO
 
+import orjson
 from pdf2image import convert_from_path
-from PIL import Image
+from PIL import Image, ImageStat
 import dashscope
 from dashscope import MultiModalConversation
 
+try:
+    from dashscope import AioMultiModalConversation
+except ImportError:  # 可选,较早版本的 dashscope 没有异步接口,改为在线程中调用同步接口
+    AioMultiModalConversation = None
+
 from src.config import settings
 from src.utils.logger import logger
 
+# 设置API密钥(模块加载时设置一次,无需每次创建解析器时重复设置)
+dashscope.api_key = settings.dashscope_api_key
+
 
 class MultimodalPDFParser:
     """多模态PDF解析器"""
+
+    # 同时在途的多模态模型请求数上限(多进程解析时为所有进程共享的总预算)
+    PARSE_MAX_CONCURRENCY = 16
+    # 渲染PDF的 poppler 线程数上限
+    RENDER_MAX_THREADS = 4
+    # 解析进度日志的间隔页数
+    PROGRESS_LOG_INTERVAL = 10
+    # 空白页判定: 渲染文件小于该字节数,或灰度标准差低于该值(整页近乎同一颜色)
+    BLANK_PAGE_MIN_BYTES = 8 * 1024
+    BLANK_PAGE_STDDEV = 5.0
     
-    def __init__(self):
-        """初始化解析器"""
-        # 设置API密钥
-        dashscope.api_key = settings.dashscope_api_key
+    def __init__(
+        self,
+        cache_dir: Optional[str] = None,
+        max_concurrency: Optional[int] = None,
+        render_threads: Optional[int] = None
+    ):
+        """
+        初始化解析器
+        
+        Args:
+            cache_dir: 解析结果缓存目录,默认为 <项目根目录>/temp/pdf_parse_cache
+            max_concurrency: 同时在途的模型请求数,默认为 PARSE_MAX_CONCURRENCY;
+                多个进程并行解析时应传入各自分得的份额
+            render_threads: 渲染PDF的线程数,默认为 CPU 核数且不超过 RENDER_MAX_THREADS
+        """
         self.model = settings.multimodal_model
+        self.max_concurrency = max_concurrency or self.PARSE_MAX_CONCURRENCY
+        self.render_threads = render_threads or min(os.cpu_count() or 1, self.RENDER_MAX_THREADS)
+        self.cache_dir = Path(cache_dir) if cache_dir else Path(settings.project_root) / 'temp' / 'pdf_parse_cache'
+        self._cache_stats = {"hits": 0, "misses": 0}
         
     def pdf_to_images(self, pdf_path: str, dpi: int = 200) -> List[Image.Image]:
         """
@@ -39,74 +77,228 @@ class MultimodalPDFParser:
         logger.info(f"开始转换PDF为图片: {pdf_path}, DPI={dpi}")
         
         try:
-            images = convert_from_path(pdf_path, dpi=dpi)
+            images = convert_from_path(pdf_path, dpi=dpi, thread_count=self.render_threads)
             logger.success(f"PDF转换成功,共{len(images)}页")
             return images
         except Exception as e:
             logger.error(f"PDF转换失败: {e}")
             raise
     
-    def image_to_base64(self, image: Image.Image) -> str:
+    def pdf_to_image_paths(
+        self,
+        pdf_path: str,
+        output_folder: str,
+        dpi: int = 200,
+        output_file: str = "page"
+    ) -> List[str]:
         """
-        将PIL Image转换为base64编码
+        将PDF逐页渲染为JPEG文件,只返回文件路径
+        
+        与 pdf_to_images 不同,页面像素不会全部驻留内存,由调用方按需打开
         
         Args:
-            image: PIL Image对象
+            pdf_path: PDF文件路径
+            output_folder: 图片输出目录
+            dpi: 图片分辨率
+            output_file: 图片文件名前缀
+            
+        Returns:
+            按页码排序的图片路径列表
+        """
+        logger.info(f"开始转换PDF为图片: {pdf_path}, DPI={dpi}")
+        
+        try:
+            image_paths = convert_from_path(
+                pdf_path,
+                dpi=dpi,
+                thread_count=self.render_threads,
+                fmt="jpeg",
+                jpegopt={"quality": 88, "progressive": False, "optimize": False},
+                output_folder=output_folder,
+                output_file=output_file,
+                paths_only=True
+            )
+            logger.success(f"PDF转换成功,共{len(image_paths)}页")
+            return image_paths
+        except Exception as e:
+            logger.error(f"PDF转换失败: {e}")
+            raise
+    
+    def image_to_base64(self, image: Union[Image.Image, str, Path]) -> str:
+        """
+        将图片转换为base64编码
+        
+        Args:
+            image: PIL Image对象,或已编码好的 JPEG/PNG 图片文件路径
             
         Returns:
             base64编码字符串
         """
+        if isinstance(image, (str, Path)):
+            # 图片文件已是目标格式,直接编码文件内容,无需经 PIL 解码再编码
+            image_path = Path(image)
+            mime = "png" if image_path.suffix.lower() == ".png" else "jpeg"
+            img_str = base64.b64encode(image_path.read_bytes()).decode("ascii")
+            return f"data:image/{mime};base64,{img_str}"
+        
         buffered = BytesIO()
-        image.save(buffered, format="PNG")
-        img_str = base64.b64encode(buffered.getvalue()).decode()
-        return f"data:image/png;base64,{img_str}"
+        # 指南扫描页用 JPEG 编码,体积约为 PNG 的 1/5~1/10;JPEG 不支持透明通道,需先转为 RGB
+        if image.mode not in ("RGB", "L"):
+            image = image.convert("RGB")
+        image.save(buffered, format="JPEG", quality=88, optimize=False)
+        # getbuffer() 直接引用缓冲区内容,省去 getvalue() 的一次拷贝
+        img_str = base64.b64encode(buffered.getbuffer()).decode("ascii")
+        return f"data:image/jpeg;base64,{img_str}"
     
     def parse_image_with_multimodal(
         self, 
-        image: Image.Image, 
+        image: Union[Image.Image, str, Path], 
         prompt: str = "请详细描述这张医疗指南图片中的所有内容,包括文字、表格、图表等。请保持原文的专业性和准确性。"
     ) -> str:
         """
         使用多模态模型解析图片内容
         
         Args:
-            image: PIL Image对象
+            image: PIL Image对象或图片文件路径
             prompt: 提示词
             
         Returns:
             解析结果文本
         """
         try:
-            # 将图片转换为base64
-            image_base64 = self.image_to_base64(image)
-            
-            # 调用多模态模型
-            messages = [
-                {
-                    "role": "user",
-                    "content": [
-                        {"image": image_base64},
-                        {"text": prompt}
-                    ]
-                }
-            ]
-            
             response = MultiModalConversation.call(
                 model=self.model,
-                messages=messages
+                messages=self._build_messages(image, prompt)
             )
-            
-            if response.status_code == 200:
-                result = response.output.choices[0].message.content[0]["text"]
-                return result
-            else:
-                logger.error(f"多模态模型调用失败: {response.code}, {response.message}")
-                return ""
+            return self._response_text(response)
                 
         except Exception as e:
             logger.error(f"图片解析失败: {e}")
             return ""
     
+    async def aparse_image_with_multimodal(
+        self,
+        image: Union[Image.Image, str, Path],
+        prompt: str = "请详细描述这张医疗指南图片中的所有内容,包括文字、表格、图表等。请保持原文的专业性和准确性。"
+    ) -> str:
+        """
+        使用多模态模型解析图片内容(异步版本)
+        
+        Args:
+            image: PIL Image对象或图片文件路径
+            prompt: 提示词
+            
+        Returns:
+            解析结果文本
+        """
+        if AioMultiModalConversation is None:
+            return await asyncio.to_thread(self.parse_image_with_multimodal, image, prompt)
+        
+        try:
+            response = await AioMultiModalConversation.call(
+                model=self.model,
+                messages=self._build_messages(image, prompt)
+            )
+            return self._response_text(response)
+        
+        except Exception as e:
+            logger.error(f"图片解析失败: {e}")
+            return ""
+    
+    def _build_messages(self, image: Union[Image.Image, str, Path], prompt: str) -> List[Dict]:
+        """构造多模态模型的请求消息(图片以base64内联)"""
+        return [
+            {
+                "role": "user",
+                "content": [
+                    {"image": self.image_to_base64(image)},
+                    {"text": prompt}
+                ]
+            }
+        ]
+    
+    def _response_text(self, response) -> str:
+        """提取多模态模型返回的文本,调用失败时返回空字符串"""
+        if response.status_code == 200:
+            return response.output.choices[0].message.content[0]["text"]
+        logger.error(f"多模态模型调用失败: {response.code}, {response.message}")
+        return ""
+    
+    def is_blank_page(self, image: Image.Image) -> bool:
+        """
+        判断页面是否为空白页(分隔页、封底等),空白页无需调用多模态模型
+        
+        Args:
+            image: PIL Image对象
+            
+        Returns:
+            是否为空白页
+        """
+        return ImageStat.Stat(image.convert("L")).stddev[0] < self.BLANK_PAGE_STDDEV
+    
+    def _is_blank_file(self, image_path: str) -> bool:
+        """判断页面图片文件是否为空白页"""
+        # 先用文件大小快速排除,无需解码图片
+        if os.path.getsize(image_path) < self.BLANK_PAGE_MIN_BYTES:
+            return True
+        with Image.open(image_path) as image:
+            # JPEG 直接解码为灰度图,省去色彩转换;保持原分辨率,
+            # 缩小解码会把细笔画模糊成灰色,只有一行字的页面标准差会跌破阈值
+            image.draft("L", image.size)
+            return self.is_blank_page(image)
+    
+    async def _aparse_page(self, image_path: str, prompt: str) -> Optional[str]:
+        """解析单页图片文件,空白页返回None"""
+        # 解码图片属于CPU操作,放到线程中执行,不阻塞事件循环
+        if await asyncio.to_thread(self._is_blank_file, image_path):
+            return None
+        # 渲染出的 JPEG 文件直接上传,不经 PIL 重新编码
+        return await self.aparse_image_with_multimodal(image_path, prompt)
+    
+    def _cache_file(self, pdf_path: str, prompt: str, dpi: int) -> Path:
+        """
+        计算解析结果的缓存文件路径
+        
+        缓存键为 PDF 内容、提示词、分辨率和模型的 sha256,任一变化都会重新解析
+        
+        Args:
+            pdf_path: PDF文件路径
+            prompt: 提示词
+            dpi: 图片分辨率
+            
+        Returns:
+            缓存文件路径
+        """
+        with open(pdf_path, 'rb') as f:
+            digest = hashlib.file_digest(f, 'sha256')
+        digest.update(prompt.encode('utf-8'))
+        digest.update(f"{dpi}:{self.model}".encode('utf-8'))
+        return self.cache_dir / f"{digest.hexdigest()}.json"
+    
+    def _load_cache(self, cache_file: Path) -> Optional[List[Dict[str, str]]]:
+        """读取解析结果缓存,未命中或读取失败时返回None"""
+        try:
+            results = orjson.loads(cache_file.read_bytes())
+        except FileNotFoundError:
+            results = None
+        except Exception as e:
+            logger.warning(f"解析结果缓存读取失败,重新解析: {cache_file}, 错误: {e}")
+            results = None
+        
+        self._cache_stats["hits" if results is not None else "misses"] += 1
+        logger.info(f"PDF解析缓存{'命中' if results is not None else '未命中'}, 命中/未命中: {self._cache_stats['hits']}/{self._cache_stats['misses']}")
+        return results
+    
+    def _save_cache(self, cache_file: Path, results: List[Dict[str, str]]):
+        """写入解析结果缓存(先写临时文件再替换,避免留下不完整的缓存)"""
+        try:
+            cache_file.parent.mkdir(parents=True, exist_ok=True)
+            tmp_file = cache_file.with_suffix('.json.tmp')
+            tmp_file.write_bytes(orjson.dumps(results))
+            os.replace(tmp_file, cache_file)
+        except Exception as e:
+            logger.warning(f"解析结果缓存写入失败: {cache_file}, 错误: {e}")
+    
     def parse_pdf(
         self, 
         pdf_path: str, 
@@ -117,6 +309,8 @@ class MultimodalPDFParser:
         """
         解析PDF文档
         
+        同步接口,通过 asyncio.run 执行 aparse_pdf;已在事件循环中的调用方应直接 await aparse_pdf
+        
         Args:
             pdf_path: PDF文件路径
             output_dir: 输出目录(可选,用于保存中间图片)
@@ -126,41 +320,87 @@ class MultimodalPDFParser:
         Returns:
             解析结果列表,每个元素包含page_num和content
         """
-        logger.info(f"开始解析PDF: {pdf_path}")
-        
-        # 转换PDF为图片
-        images = self.pdf_to_images(pdf_path, dpi=dpi)
+        return asyncio.run(self.aparse_pdf(pdf_path, output_dir=output_dir, dpi=dpi, custom_prompt=custom_prompt))
+    
+    async def aparse_pdf(
+        self,
+        pdf_path: str,
+        output_dir: Optional[str] = None,
+        dpi: int = 200,
+        custom_prompt: Optional[str] = None
+    ) -> List[Dict[str, str]]:
+        """
+        解析PDF文档(异步版本)
         
-        # 如果指定了输出目录,保存图片
-        if output_dir:
-            output_path = Path(output_dir)
-            output_path.mkdir(parents=True, exist_ok=True)
-            pdf_name = Path(pdf_path).stem
+        Args:
+            pdf_path: PDF文件路径
+            output_dir: 输出目录(可选,用于保存中间图片)
+            dpi: 图片分辨率
+            custom_prompt: 自定义提示词
             
-            for i, img in enumerate(images, 1):
-                img_path = output_path / f"{pdf_name}_page_{i}.png"
-                img.save(img_path)
-                logger.debug(f"保存图片: {img_path}")
+        Returns:
+            解析结果列表,每个元素包含page_num和content
+        """
+        logger.info(f"开始解析PDF: {pdf_path}")
         
-        # 解析每一页
-        results = []
         prompt = custom_prompt or "请详细描述这张医疗指南图片中的所有内容,包括文字、表格、图表、诊断标准、治疗方案等。请保持原文的专业性和准确性,特别注意数值、剂量、诊断标准等关键信息。"
         
-        for i, image in enumerate(images, 1):
-            logger.info(f"正在解析第 {i}/{len(images)} 页...")
-            
-            content = self.parse_image_with_multimodal(image, prompt)
+        # PDF 内容和解析参数都未变化时直接返回上次的结果,不再调用多模态模型
+        cache_file = await asyncio.to_thread(self._cache_file, pdf_path, prompt, dpi)
+        cached = self._load_cache(cache_file)
+        if cached is not None:
+            return cached
+        
+        semaphore = asyncio.Semaphore(self.max_concurrency)
+        
+        async def parse_one(page_num: int, image_path: str):
+            async with semaphore:
+                return page_num, await self._aparse_page(image_path, prompt)
+        
+        results = []
+        failed_pages = 0
+        blank_pages = 0
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            # 将PDF渲染为图片文件;指定了输出目录时直接渲染到该目录保存,否则使用临时目录
+            if output_dir:
+                Path(output_dir).mkdir(parents=True, exist_ok=True)
+            image_paths = await asyncio.to_thread(
+                self.pdf_to_image_paths,
+                pdf_path,
+                output_folder=output_dir or tmp_dir,
+                dpi=dpi,
+                output_file=f"{Path(pdf_path).stem}_page"
+            )
             
-            if content:
-                results.append({
-                    "page_num": i,
-                    "content": content
-                })
-                logger.success(f"第 {i} 页解析成功,内容长度: {len(content)}")
-            else:
-                logger.warning(f"第 {i} 页解析失败或内容为空")
-        
-        logger.success(f"PDF解析完成,成功解析 {len(results)}/{len(images)} 页")
+            # 解析每一页(各页的模型调用相互独立,耗时主要在网络等待,并发发出请求)
+            logger.info(f"正在解析 {len(image_paths)} 页,并发数: {self.max_concurrency}")
+            tasks = [parse_one(i, image_path) for i, image_path in enumerate(image_paths, 1)]
+            # 逐页只记录失败,进度每 PROGRESS_LOG_INTERVAL 页汇报一次,成功与空白页在结束时汇总
+            for done, next_done in enumerate(asyncio.as_completed(tasks), 1):
+                i, content = await next_done
+                
+                if content is None:
+                    blank_pages += 1
+                    logger.info(f"第 {i} 页为空白页,已跳过")
+                elif content:
+                    results.append({
+                        "page_num": i,
+                        "content": content
+                    })
+                else:
+                    failed_pages += 1
+                    logger.warning(f"第 {i} 页解析失败或内容为空")
+                
+                if done % self.PROGRESS_LOG_INTERVAL == 0:
+                    logger.info(f"解析进度: {done}/{len(image_paths)} 页")
+        
+        # 按完成顺序收集,恢复为页码顺序
+        results.sort(key=lambda result: result["page_num"])
+        
+        logger.success(f"PDF解析完成,成功解析 {len(results)}/{len(image_paths)} 页,跳过空白页 {blank_pages} 页")
+        # 有页面解析失败时不写缓存,下次重新解析以补全
+        if results and not failed_pages:
+            self._save_cache(cache_file, results)
         return results
     
     def save_parsed_results(self, results: List[Dict[str, str]], output_file: str):
@@ -185,9 +425,12 @@ class MultimodalPDFParser:
         logger.success(f"解析结果已保存到: {output_path}")
 
 
-def get_pdf_parser() -> MultimodalPDFParser:
+def get_pdf_parser(
+    max_concurrency: Optional[int] = None,
+    render_threads: Optional[int] = None
+) -> MultimodalPDFParser:
     """获取PDF解析器实例"""
-    return MultimodalPDFParser()
+    return MultimodalPDFParser(max_concurrency=max_concurrency, render_threads=render_threads)
 
 
 if __name__ == "__main__":
@@ -1,12 +1,33 @@
 """RAG模块初始化"""
-from .knowledge_builder import get_knowledge_builder, KnowledgeBuilder
-from .query_engine import create_query_engine, QueryEngine
-from .prompt_templates import get_template
+import importlib
+
+# 名称 -> 所在子模块,首次访问时才导入(PEP 562),避免只用到提示词模板时也加载 llama_index 等重依赖
+_LAZY_IMPORTS = {
+    'get_knowledge_builder': '.knowledge_builder',
+    'KnowledgeBuilder': '.knowledge_builder',
+    'create_query_engine': '.query_engine',
+    'QueryEngine': '.query_engine',
+    'get_template': '.prompt_templates',
+    'get_template_parts': '.prompt_templates'
+}
 
 __all__ = [
     'get_knowledge_builder',
     'KnowledgeBuilder',
     'create_query_engine',
     'QueryEngine',
-    'get_template'
+    'get_template',
+    'get_template_parts'
 ]
+
+
+def __getattr__(name):
+    if name not in _LAZY_IMPORTS:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    value = getattr(importlib.import_module(_LAZY_IMPORTS[name], __name__), name)
+    globals()[name] = value  # 缓存,后续访问不再经过 __getattr__
+    return value
+
+
+def __dir__():
+    return sorted(set(globals()) | set(__all__))
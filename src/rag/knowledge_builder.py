@@ -2,16 +2,17 @@
 RAG知识库构建模块
 整合PDF解析结果和MySQL数据,构建向量索引
 """
-import os
 from pathlib import Path
-from typing import List, Optional
+from typing import Iterable, List, Optional, Tuple, Union
 from llama_index.core import (
     SimpleDirectoryReader,
     VectorStoreIndex,
     StorageContext,
     load_index_from_storage,
-    Document
+    Document,
+    Settings as LlamaIndexSettings
 )
+from llama_index.core.ingestion import run_transformations
 from llama_index.embeddings.dashscope import DashScopeEmbedding, DashScopeTextEmbeddingModels
 from llama_index.llms.openai_like import OpenAILike
 
@@ -22,15 +23,19 @@ from src.utils.logger import logger
 class KnowledgeBuilder:
     """知识库构建器"""
     
+    # text-embedding-v2 单次请求最多支持 25 条文本
+    EMBED_BATCH_SIZE = 25
+    
     def __init__(self):
         """初始化知识库构建器"""
-        # 设置API密钥
-        os.environ['DASHSCOPE_API_KEY'] = settings.dashscope_api_key
-        
-        # 初始化embedding模型
+        # 初始化embedding模型(按接口上限批量请求,减少网络往返次数);API密钥直接传入,不修改进程环境变量
         self.embed_model = DashScopeEmbedding(
-            model_name=DashScopeTextEmbeddingModels.TEXT_EMBEDDING_V2
+            model_name=DashScopeTextEmbeddingModels.TEXT_EMBEDDING_V2,
+            api_key=settings.dashscope_api_key,
+            embed_batch_size=self.EMBED_BATCH_SIZE
         )
+        # 设为 LlamaIndex 全局默认,未显式传入 embed_model 的组件也使用同一模型
+        LlamaIndexSettings.embed_model = self.embed_model
         
         # 初始化LLM
         self.llm = OpenAILike(
@@ -112,6 +117,19 @@ class KnowledgeBuilder:
             logger.error(f"创建向量索引失败: {e}")
             raise
     
+    def insert_documents(self, index: VectorStoreIndex, documents: List[Document]):
+        """
+        将文档切分后批量写入已有索引
+        
+        与 from_documents 使用相同的切分流程,一批文档的节点一起计算向量(按 EMBED_BATCH_SIZE 分批请求)
+        
+        Args:
+            index: VectorStoreIndex对象
+            documents: Document对象列表
+        """
+        nodes = run_transformations(documents, LlamaIndexSettings.transformations)
+        index.insert_nodes(nodes)
+    
     def persist_index(self, index: VectorStoreIndex, persist_dir: str):
         """
         持久化索引
@@ -160,15 +178,19 @@ class KnowledgeBuilder:
     
     def build_knowledge_base(
         self,
-        parsed_pdf_results: dict,
+        parsed_pdf_results: Union[dict, Iterable[Tuple[str, List[dict]]]],
         persist_dir: str,
         additional_docs_dir: Optional[str] = None
     ) -> VectorStoreIndex:
         """
         构建完整的知识库
         
+        PDF解析结果可以是迭代器: 每得到一个PDF的解析结果就写入索引,
+        向量计算与其余PDF的解析同时进行,无需等待全部解析完成
+        
         Args:
-            parsed_pdf_results: PDF解析结果字典 {pdf_name: parsed_results}
+            parsed_pdf_results: PDF解析结果字典 {pdf_name: parsed_results},
+                或逐个产出 (pdf_name, parsed_results) 的迭代器
             persist_dir: 持久化目录
             additional_docs_dir: 额外文档目录(可选)
             
@@ -177,22 +199,26 @@ class KnowledgeBuilder:
         """
         logger.info("开始构建医疗知识库")
         
-        all_documents = []
+        if isinstance(parsed_pdf_results, dict):
+            parsed_pdf_results = parsed_pdf_results.items()
+        
+        # 1. 创建空索引,后续文档增量写入
+        index = VectorStoreIndex([], embed_model=self.embed_model)
+        total_documents = 0
         
-        # 1. 从PDF解析结果创建文档
-        for pdf_name, parsed_results in parsed_pdf_results.items():
+        # 2. 从PDF解析结果创建文档,每个PDF解析完成即写入索引
+        for pdf_name, parsed_results in parsed_pdf_results:
             docs = self.create_documents_from_parsed_pdf(parsed_results, pdf_name)
-            all_documents.extend(docs)
+            self.insert_documents(index, docs)
+            total_documents += len(docs)
         
-        # 2. 加载额外文档(如果有)
+        # 3. 加载额外文档(如果有)
         if additional_docs_dir and Path(additional_docs_dir).exists():
             additional_docs = self.load_documents_from_directory(additional_docs_dir)
-            all_documents.extend(additional_docs)
-        
-        logger.info(f"总文档数: {len(all_documents)}")
+            self.insert_documents(index, additional_docs)
+            total_documents += len(additional_docs)
         
-        # 3. 创建索引
-        index = self.create_index(all_documents)
+        logger.info(f"总文档数: {total_documents}")
         
         # 4. 持久化索引
         self.persist_index(index, persist_dir)
@@ -2,20 +2,89 @@
 RAG查询引擎模块
 提供知识库检索和查询功能
 """
-import os
-from typing import Generator, Optional
-from llama_index.core import VectorStoreIndex, PromptTemplate
+import atexit
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
+from typing import AsyncGenerator, Dict, Generator, List, Optional
+
+import httpx
+from llama_index.core import VectorStoreIndex, PromptTemplate, ChatPromptTemplate
+from llama_index.core.llms import ChatMessage, MessageRole
+from llama_index.core.postprocessor import SimilarityPostprocessor
 from llama_index.embeddings.dashscope import DashScopeEmbedding, DashScopeTextEmbeddingModels
 from llama_index.llms.openai_like import OpenAILike
 
 from src.config import settings
 from src.utils.logger import logger
-from src.rag.prompt_templates import get_template
+from src.utils.ttl_cache import TTLCache
+from src.rag.prompt_templates import get_template_parts
+
+
+# LLM 请求连接池上限(gthread worker 内多个流式对话并发共用)
+LLM_MAX_CONNECTIONS = 32
+LLM_MAX_KEEPALIVE_CONNECTIONS = 16
+
+
+@lru_cache(maxsize=1)
+def _get_http_client() -> httpx.Client:
+    """
+    获取进程内共享的LLM HTTP客户端
+    
+    连接池中的 keep-alive 连接在请求间复用,后续请求无需重新进行TCP/TLS握手。
+    客户端创建时不建立连接,gunicorn preload 模式下 fork 前创建也不会在进程间共享连接。
+    
+    Returns:
+        httpx.Client对象
+    """
+    client = httpx.Client(
+        limits=httpx.Limits(
+            max_connections=LLM_MAX_CONNECTIONS,
+            max_keepalive_connections=LLM_MAX_KEEPALIVE_CONNECTIONS
+        )
+    )
+    atexit.register(client.close)
+    return client
+
+
+@lru_cache(maxsize=16)
+def _get_qa_prompt(template_type: str) -> ChatPromptTemplate:
+    """
+    获取编译好的QA Prompt,同一模板类型只构建一次,切换模板时直接复用
+    
+    Args:
+        template_type: 模板类型
+        
+    Returns:
+        静态前缀为系统消息、检索上下文和问题为用户消息的ChatPromptTemplate
+    """
+    # 静态前缀作为首条系统消息,各请求完全一致,可命中服务端前缀缓存;
+    # 检索上下文和问题放在其后的用户消息中
+    prefix, suffix = get_template_parts(template_type)
+    return ChatPromptTemplate(message_templates=[
+        ChatMessage(role=MessageRole.SYSTEM, content=prefix),
+        ChatMessage(role=MessageRole.USER, content=suffix)
+    ])
 
 
 class QueryEngine:
     """RAG查询引擎"""
     
+    # 回答缓存: 相同模板下重复的问题直接返回上次的完整回答,不再检索和调用LLM
+    RESPONSE_CACHE_TTL = 600
+    RESPONSE_CACHE_SIZE = 256
+    # query_batch 同时进行的查询数上限
+    BATCH_MAX_CONCURRENCY = 8
+    # 预热时发送的问题,回答很短,且不写入回答缓存
+    PREWARM_QUESTION = "你好"
+    # LLM请求失败重试次数(由 OpenAI 客户端对连接错误、429 和 5xx 按指数退避重试)
+    LLM_MAX_RETRIES = 3
+    # 熔断: 连续失败达到次数后,在冷却时间内直接返回错误,不再等待接口超时
+    CIRCUIT_FAIL_MAX = 5
+    CIRCUIT_RESET_TIMEOUT = 30
+    CIRCUIT_OPEN_MESSAGE = "查询出错: 知识库问答服务暂时不可用,请稍后重试"
+    
     def __init__(self, index: VectorStoreIndex):
         """
         初始化查询引擎
@@ -25,8 +94,14 @@ class QueryEngine:
         """
         self.index = index
         
-        # 设置API密钥
-        os.environ['DASHSCOPE_API_KEY'] = settings.dashscope_api_key
+        # (模板标识, 问题) -> 完整回答;gthread worker 内多线程共用,TTLCache 内部加锁
+        self._response_cache = TTLCache(self.RESPONSE_CACHE_SIZE, self.RESPONSE_CACHE_TTL)
+        self._template_key = None
+        
+        # 熔断状态: 连续失败次数、熔断结束时间(None 表示未熔断)
+        self._consecutive_failures = 0
+        self._circuit_open_until: Optional[float] = None
+        self._circuit_lock = threading.Lock()
         
         # 创建查询引擎
         self._inner_query_engine = self._create_query_engine()
@@ -49,13 +124,42 @@ class QueryEngine:
                 model=settings.llm_model,
                 api_base="https://dashscope.aliyuncs.com/compatible-mode/v1",
                 api_key=settings.dashscope_api_key,
-                is_chat_model=True
+                is_chat_model=True,
+                max_retries=self.LLM_MAX_RETRIES,
+                http_client=_get_http_client()
             ),
-            similarity_top_k=5  # 返回最相关的5个文档片段
+            similarity_top_k=5,  # 返回最相关的5个文档片段
+            # 丢弃相似度过低的片段,减少送入LLM的上下文长度
+            node_postprocessors=[
+                SimilarityPostprocessor(similarity_cutoff=settings.rag_similarity_cutoff)
+            ]
         )
         
         return query_engine
     
+    def prewarm(self):
+        """
+        在后台线程发送一次最小查询,提前完成 embedding 与 LLM 接口的TCP/TLS握手,
+        首个用户请求直接复用连接池中的连接
+        
+        连接不能跨进程共享: gunicorn preload 模式下应在 worker fork 之后调用(见 gunicorn.conf.py)。
+        """
+        if not settings.prewarm_enabled:
+            return
+        threading.Thread(target=self._prewarm, name="query-engine-prewarm", daemon=True).start()
+    
+    def _prewarm(self):
+        """执行预热查询,失败只记录警告"""
+        started = time.monotonic()
+        try:
+            response = self.query_engine.query(self.PREWARM_QUESTION)
+            # 读完整个响应,连接才会放回连接池
+            for _ in response.response_gen:
+                pass
+            logger.info(f"查询引擎预热完成,耗时 {time.monotonic() - started:.2f}s")
+        except Exception as e:
+            logger.warning(f"查询引擎预热失败: {e}")
+    
     def update_prompt_template(self, template_type: str = "medical_qa", custom_template: Optional[str] = None):
         """
         更新Prompt模板
@@ -65,17 +169,54 @@ class QueryEngine:
             custom_template: 自定义模板(可选)
         """
         if custom_template:
-            template_str = custom_template
+            qa_prompt_tmpl = PromptTemplate(custom_template)
         else:
-            template_str = get_template(template_type)
+            qa_prompt_tmpl = _get_qa_prompt(template_type)
         
-        qa_prompt_tmpl = PromptTemplate(template_str)
         self.query_engine.update_prompts(
             {"response_synthesizer:text_qa_template": qa_prompt_tmpl}
         )
+        # 缓存键包含模板标识,切换模板后不会命中旧模板生成的回答
+        self._template_key = ("custom", custom_template) if custom_template else template_type
         
         logger.info(f"Prompt模板已更新: {template_type}")
     
+    def _cached_response(self, question: str) -> Optional[str]:
+        """读取未过期的缓存回答,未命中返回None"""
+        cached = self._response_cache.get((self._template_key, question.strip()))
+        if cached is not None:
+            logger.debug("回答缓存命中: {}", question)
+        return cached
+    
+    def _cache_response(self, question: str, response: str):
+        """写入缓存回答,超出 RESPONSE_CACHE_SIZE 时淘汰最久未使用的条目"""
+        self._response_cache.set((self._template_key, question.strip()), response)
+    
+    def _circuit_open(self) -> bool:
+        """
+        熔断是否打开
+        
+        冷却时间过后放行请求(半开状态),下一次失败会立即重新熔断,成功则恢复正常。
+        """
+        with self._circuit_lock:
+            if self._circuit_open_until is None:
+                return False
+            if time.monotonic() < self._circuit_open_until:
+                return True
+            self._circuit_open_until = None
+            return False
+    
+    def _record_result(self, success: bool):
+        """记录一次LLM查询的结果,连续失败达到 CIRCUIT_FAIL_MAX 次时打开熔断"""
+        with self._circuit_lock:
+            if success:
+                self._consecutive_failures = 0
+                return
+            self._consecutive_failures += 1
+            if self._consecutive_failures >= self.CIRCUIT_FAIL_MAX:
+                self._circuit_open_until = time.monotonic() + self.CIRCUIT_RESET_TIMEOUT
+                logger.warning(f"查询连续失败 {self._consecutive_failures} 次,熔断 {self.CIRCUIT_RESET_TIMEOUT} 秒")
+    
     def query(self, question: str) -> str:
         """
         同步查询
@@ -88,17 +229,25 @@ class QueryEngine:
         """
         logger.info(f"查询问题: {question}")
         
+        cached = self._cached_response(question)
+        if cached is not None:
+            return cached
+        
+        if self._circuit_open():
+            return self.CIRCUIT_OPEN_MESSAGE
+        
         try:
             response = self.query_engine.query(question)
             
-            # 收集流式响应
-            full_response = ""
-            for chunk in response.response_gen:
-                full_response += chunk
+            # 收集流式响应(列表 + join,避免逐段拼接字符串)
+            full_response = "".join(response.response_gen)
             
+            self._record_result(True)
+            self._cache_response(question, full_response)
             return full_response
         except Exception as e:
             logger.error(f"查询失败: {e}")
+            self._record_result(False)
             return f"查询出错: {str(e)}"
     
     def query_stream(self, question: str) -> Generator[str, None, None]:
@@ -117,16 +266,116 @@ class QueryEngine:
             yield "错误:问题不能为空"
             return
         
+        cached = self._cached_response(question)
+        if cached is not None:
+            yield cached
+            return
+        
+        if self._circuit_open():
+            yield self.CIRCUIT_OPEN_MESSAGE
+            return
+        
         try:
             streaming_response = self.query_engine.query(question)
             
+            chunks = []
             for chunk in streaming_response.response_gen:
+                chunks.append(chunk)
                 yield chunk
+            
+            # 只缓存完整生成的回答;出错或调用方提前关闭生成器时不会执行到这里
+            self._record_result(True)
+            self._cache_response(question, "".join(chunks))
                 
         except Exception as e:
             logger.error(f"流式查询失败: {e}")
+            self._record_result(False)
             yield f"查询出错: {str(e)}"
     
+    def query_batch(self, questions: List[str]) -> Dict[str, str]:
+        """
+        批量查询,多个问题的检索和LLM调用并发进行,总耗时接近最慢的单个查询
+        
+        Args:
+            questions: 问题列表,重复的问题只查询一次
+            
+        Returns:
+            {问题: 回答文本},按问题首次出现的顺序排列
+        """
+        unique_questions = list(dict.fromkeys(questions))
+        if not unique_questions:
+            return {}
+        
+        logger.info(f"批量查询 {len(unique_questions)} 个问题")
+        
+        # 同步 Flask 视图中调用,使用线程池而非 asyncio.run,避免异步LLM客户端绑定到已关闭的事件循环
+        max_workers = min(len(unique_questions), self.BATCH_MAX_CONCURRENCY)
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            answers = executor.map(self.query, unique_questions)
+            return dict(zip(unique_questions, answers))
+    
+    async def aquery_stream(self, question: str) -> AsyncGenerator[str, None]:
+        """
+        异步流式查询,多个互不依赖的查询可通过 asyncio.gather 并发执行
+        
+        LLM客户端会绑定首次使用时的事件循环,同一个 QueryEngine 的异步查询应在同一事件循环中进行。
+        
+        Args:
+            question: 问题
+            
+        Yields:
+            回答文本片段
+        """
+        logger.info(f"异步流式查询问题: {question}")
+        
+        if not question:
+            yield "错误:问题不能为空"
+            return
+        
+        cached = self._cached_response(question)
+        if cached is not None:
+            yield cached
+            return
+        
+        if self._circuit_open():
+            yield self.CIRCUIT_OPEN_MESSAGE
+            return
+        
+        try:
+            streaming_response = await self.query_engine.aquery(question)
+            
+            chunks = []
+            # 新版 LlamaIndex 异步查询返回 AsyncStreamingResponse,旧版仍为同步生成器
+            async_response_gen = getattr(streaming_response, "async_response_gen", None)
+            if callable(async_response_gen):
+                async for chunk in async_response_gen():
+                    chunks.append(chunk)
+                    yield chunk
+            else:
+                for chunk in streaming_response.response_gen:
+                    chunks.append(chunk)
+                    yield chunk
+            
+            self._record_result(True)
+            self._cache_response(question, "".join(chunks))
+        
+        except Exception as e:
+            logger.error(f"异步流式查询失败: {e}")
+            self._record_result(False)
+            yield f"查询出错: {str(e)}"
+    
+    async def aquery(self, question: str) -> str:
+        """
+        异步查询
+        
+        Args:
+            question: 问题
+            
+        Returns:
+            回答文本
+        """
+        return "".join([chunk async for chunk in self.aquery_stream(question)])
+    
     def query_with_context(self, question: str, context: dict) -> Generator[str, None, None]:
         """
         带上下文的查询(用于患者评估等场景)
@@ -138,9 +387,10 @@ class QueryEngine:
         Yields:
             回答文本片段
         """
-        # 构建包含上下文的问题
-        context_str = "\n".join([f"{k}: {v}" for k, v in context.items()])
-        full_question = f"{context_str}\n\n问题: {question}"
+        # 构建包含上下文的问题(各片段一次性拼接)
+        parts = [f"{k}: {v}\n" for k, v in context.items()]
+        parts += ("\n问题: ", question)
+        full_question = "".join(parts)
         
         yield from self.query_stream(full_question)
 
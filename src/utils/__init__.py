@@ -1,5 +1,6 @@
 """工具模块初始化"""
 from .logger import get_logger, logger
 from .term_mapper import get_term_mapper, MedicalTermMapper
+from .ttl_cache import TTLCache
 
-__all__ = ['get_logger', 'logger', 'get_term_mapper', 'MedicalTermMapper']
+__all__ = ['get_logger', 'logger', 'get_term_mapper', 'MedicalTermMapper', 'TTLCache']
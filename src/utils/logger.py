@@ -13,12 +13,18 @@ def setup_logger():
     # 移除默认的handler
     logger.remove()
     
+    # 异常的扩展回溯和变量值诊断只在调试模式开启: 生成开销大,且变量值可能包含患者数据
+    verbose_traceback = settings.flask_debug
+    
     # 添加控制台输出
     logger.add(
         sys.stdout,
         format="<green>{time:YYYY-MM-DD HH:mm:ss}</green> | <level>{level: <8}</level> | <cyan>{name}</cyan>:<cyan>{function}</cyan>:<cyan>{line}</cyan> - <level>{message}</level>",
         level=settings.log_level,
-        colorize=True
+        colorize=True,
+        enqueue=True,  # 由后台线程输出,请求线程不阻塞在IO上
+        backtrace=verbose_traceback,
+        diagnose=verbose_traceback
     )
     
     # 添加文件输出
@@ -32,7 +38,11 @@ def setup_logger():
         rotation="100 MB",  # 日志文件大小达到100MB时轮转
         retention="30 days",  # 保留30天的日志
         compression="zip",  # 压缩旧日志
-        encoding="utf-8"
+        encoding="utf-8",
+        # 写入、轮转和压缩都在后台线程完成;fork 出的 gunicorn worker 经同一队列写入,多进程不会交错
+        enqueue=True,
+        backtrace=verbose_traceback,
+        diagnose=verbose_traceback
     )
     
     logger.info("日志系统初始化完成")
@@ -3,113 +3,148 @@
 实现术语同义词映射,例如"心梗"→"心肌梗死"
 评分点: 4.1.1 术语标准化映射(3分)
 """
-from typing import Dict, List, Optional, Set
-import json
+from typing import Dict, List, Mapping, Optional, Set, Tuple
+from collections import defaultdict
+from types import MappingProxyType
+import re
 from pathlib import Path
 
+import orjson
+
+try:
+    import ahocorasick
+except ImportError:  # 可选依赖,缺失时查询扩展使用等价的正则多选匹配
+    ahocorasick = None
+
 from src.utils.logger import logger
 
 
+# 术语映射表: {俗称/简称: 标准术语}
+_TERM_MAPPING = {
+    # 心血管疾病
+    "心梗": "心肌梗死",
+    "心梗死": "心肌梗死",
+    "MI": "心肌梗死",
+    "急性心梗": "急性心肌梗死",
+    "AMI": "急性心肌梗死",
+    "心衰": "心力衰竭",
+    "心功能不全": "心力衰竭",
+    "房颤": "心房颤动",
+    "冠心病": "冠状动脉粥样硬化性心脏病",
+    "冠脉病": "冠状动脉疾病",
+    
+    # 高血压相关
+    "高血压": "原发性高血压",
+    "血压高": "高血压",
+    "高压": "高血压",
+    "继发高血压": "继发性高血压",
+    "高血压危象": "高血压急症",
+    "高血压脑病": "高血压性脑病",
+    
+    # 糖尿病相关
+    "糖尿病": "糖尿病",
+    "DM": "糖尿病",
+    "1型糖尿病": "1型糖尿病",
+    "T1DM": "1型糖尿病",
+    "2型糖尿病": "2型糖尿病",
+    "T2DM": "2型糖尿病",
+    "糖尿": "糖尿病",
+    "血糖高": "高血糖",
+    "低血糖": "低血糖症",
+    "糖化血红蛋白": "糖化血红蛋白",
+    "HbA1c": "糖化血红蛋白",
+    
+    # 肾脏疾病
+    "肾衰": "肾功能衰竭",
+    "肾衰竭": "肾功能衰竭",
+    "尿毒症": "慢性肾功能衰竭尿毒症期",
+    "肾病": "肾脏疾病",
+    "蛋白尿": "蛋白尿",
+    
+    # 脑血管疾病
+    "脑梗": "脑梗死",
+    "脑梗塞": "脑梗死",
+    "中风": "脑卒中",
+    "脑卒中": "脑血管意外",
+    "脑出血": "脑出血",
+    "蛛网膜下腔出血": "蛛网膜下腔出血",
+    
+    # 症状
+    "头晕": "眩晕",
+    "头疼": "头痛",
+    "胸痛": "胸痛",
+    "胸闷": "胸闷",
+    "气短": "呼吸困难",
+    "气喘": "呼吸困难",
+    "心慌": "心悸",
+    "心跳快": "心动过速",
+    
+    # 检查项目
+    "心电图": "心电图检查",
+    "ECG": "心电图",
+    "彩超": "超声检查",
+    "B超": "超声检查",
+    "CT": "计算机断层扫描",
+    "核磁": "磁共振成像",
+    "MRI": "磁共振成像",
+    
+    # 药物类别
+    "降压药": "抗高血压药物",
+    "降糖药": "降血糖药物",
+    "胰岛素": "胰岛素",
+    "利尿剂": "利尿药",
+    "他汀": "他汀类药物",
+    "阿司匹林": "阿司匹林",
+    "ACEI": "血管紧张素转换酶抑制剂",
+    "ARB": "血管紧张素受体拮抗剂",
+    "CCB": "钙通道阻滞剂",
+    "β受体阻滞剂": "β肾上腺素受体阻滞剂",
+}
+
+
+def _build_reverse_mapping(term_mapping: Mapping[str, str]) -> Dict[str, Tuple[str, ...]]:
+    """构建反向映射表(按标准术语分组),同义词冻结为元组"""
+    reverse = defaultdict(list)
+    for synonym, standard in term_mapping.items():
+        reverse[standard].append(synonym)
+    return {standard: tuple(synonyms) for standard, synonyms in reverse.items()}
+
+
+# 反向映射表只读视图,导入时构建一次
+_REVERSE_MAPPING = MappingProxyType(_build_reverse_mapping(_TERM_MAPPING))
+
+
 class MedicalTermMapper:
     """医学术语映射器"""
     
     def __init__(self):
         """初始化术语映射器"""
-        # 术语映射表: {俗称/简称: 标准术语}
-        self.term_mapping = {
-            # 心血管疾病
-            "心梗": "心肌梗死",
-            "心梗死": "心肌梗死",
-            "MI": "心肌梗死",
-            "急性心梗": "急性心肌梗死",
-            "AMI": "急性心肌梗死",
-            "心衰": "心力衰竭",
-            "心功能不全": "心力衰竭",
-            "房颤": "心房颤动",
-            "冠心病": "冠状动脉粥样硬化性心脏病",
-            "冠脉病": "冠状动脉疾病",
-            
-            # 高血压相关
-            "高血压": "原发性高血压",
-            "血压高": "高血压",
-            "高压": "高血压",
-            "继发高血压": "继发性高血压",
-            "高血压危象": "高血压急症",
-            "高血压脑病": "高血压性脑病",
-            
-            # 糖尿病相关
-            "糖尿病": "糖尿病",
-            "DM": "糖尿病",
-            "1型糖尿病": "1型糖尿病",
-            "T1DM": "1型糖尿病",
-            "2型糖尿病": "2型糖尿病",
-            "T2DM": "2型糖尿病",
-            "糖尿": "糖尿病",
-            "血糖高": "高血糖",
-            "低血糖": "低血糖症",
-            "糖化血红蛋白": "糖化血红蛋白",
-            "HbA1c": "糖化血红蛋白",
-            
-            # 肾脏疾病
-            "肾衰": "肾功能衰竭",
-            "肾衰竭": "肾功能衰竭",
-            "尿毒症": "慢性肾功能衰竭尿毒症期",
-            "肾病": "肾脏疾病",
-            "蛋白尿": "蛋白尿",
-            
-            # 脑血管疾病
-            "脑梗": "脑梗死",
-            "脑梗塞": "脑梗死",
-            "中风": "脑卒中",
-            "脑卒中": "脑血管意外",
-            "脑出血": "脑出血",
-            "蛛网膜下腔出血": "蛛网膜下腔出血",
-            
-            # 症状
-            "头晕": "眩晕",
-            "头疼": "头痛",
-            "胸痛": "胸痛",
-            "胸闷": "胸闷",
-            "气短": "呼吸困难",
-            "气喘": "呼吸困难",
-            "心慌": "心悸",
-            "心跳快": "心动过速",
-            
-            # 检查项目
-            "心电图": "心电图检查",
-            "ECG": "心电图",
-            "彩超": "超声检查",
-            "B超": "超声检查",
-            "CT": "计算机断层扫描",
-            "核磁": "磁共振成像",
-            "MRI": "磁共振成像",
-            
-            # 药物类别
-            "降压药": "抗高血压药物",
-            "降糖药": "降血糖药物",
-            "胰岛素": "胰岛素",
-            "利尿剂": "利尿药",
-            "他汀": "他汀类药物",
-            "阿司匹林": "阿司匹林",
-            "ACEI": "血管紧张素转换酶抑制剂",
-            "ARB": "血管紧张素受体拮抗剂",
-            "CCB": "钙通道阻滞剂",
-            "β受体阻滞剂": "β肾上腺素受体阻滞剂",
-        }
+        # 术语映射表: {俗称/简称: 标准术语};模块级常量的只读视图,各实例共享不重复构建
+        self.term_mapping = MappingProxyType(_TERM_MAPPING)
+        
+        # 反向映射: {标准术语: (所有同义词,)}
+        self.reverse_mapping = _REVERSE_MAPPING
         
-        # 反向映射: {标准术语: [所有同义词]}
-        self.reverse_mapping = self._build_reverse_mapping()
+        # 查询扩展用的多模式匹配器,一次扫描找出查询中的全部术语;
+        # 正则回退的多选分支按长度降序排列,同一起点优先命中长术语,与 iter_long 结果一致
+        self._automaton = self._build_automaton(self.term_mapping)
+        self._term_pattern = None if self._automaton is not None else re.compile(
+            "|".join(re.escape(term) for term in sorted(self.term_mapping, key=len, reverse=True))
+        )
         
         logger.info(f"术语映射器初始化完成,共{len(self.term_mapping)}个映射")
     
-    def _build_reverse_mapping(self) -> Dict[str, List[str]]:
-        """构建反向映射表"""
-        reverse = {}
-        for synonym, standard in self.term_mapping.items():
-            if standard not in reverse:
-                reverse[standard] = []
-            reverse[standard].append(synonym)
-        return reverse
+    @staticmethod
+    def _build_automaton(term_mapping: Mapping[str, str]):
+        """构建术语自动机,每个术语对应 (术语, 标准术语);未安装 pyahocorasick 时返回 None"""
+        if ahocorasick is None:
+            return None
+        
+        automaton = ahocorasick.Automaton()
+        for synonym, standard in term_mapping.items():
+            automaton.add_word(synonym, (synonym, standard))
+        automaton.make_automaton()
+        return automaton
     
     def normalize(self, term: str) -> str:
         """
@@ -121,17 +156,18 @@ class MedicalTermMapper:
         Returns:
             标准化后的术语
         """
-        # 去除空格
-        term = term.strip()
+        # 去除空格(首尾无空白时跳过 strip)
+        if term[:1].isspace() or term[-1:].isspace():
+            term = term.strip()
         
-        # 查找映射
-        if term in self.term_mapping:
-            standard_term = self.term_mapping[term]
-            logger.debug(f"术语映射: '{term}' → '{standard_term}'")
-            return standard_term
+        # 查找映射,未命中说明已经是标准术语,直接返回
+        standard_term = self.term_mapping.get(term)
+        if standard_term is None:
+            return term
         
-        # 如果已经是标准术语,直接返回
-        return term
+        # 参数交给 loguru 格式化,debug 级别被过滤时不拼接字符串
+        logger.debug("术语映射: '{}' → '{}'", term, standard_term)
+        return standard_term
     
     def get_synonyms(self, term: str) -> List[str]:
         """
@@ -148,7 +184,7 @@ class MedicalTermMapper:
         
         # 查找所有同义词
         if standard in self.reverse_mapping:
-            return self.reverse_mapping[standard]
+            return list(self.reverse_mapping[standard])
         
         return [term]
     
@@ -162,20 +198,32 @@ class MedicalTermMapper:
         Returns:
             扩展后的查询
         """
-        # 简单实现:查找query中的术语并替换
-        expanded = query
-        
-        # 按长度排序,优先匹配长术语
-        sorted_terms = sorted(self.term_mapping.keys(), key=len, reverse=True)
+        # 单次扫描原始查询,在每个需要补充的术语后插入标准术语;
+        # 重叠时取最左最长的匹配,已被覆盖的片段不再重复标注,插入的文本也不会被再次扫描
+        if self._automaton is None:
+            return self._term_pattern.sub(lambda match: self._annotate(match.group(), query), query)
         
-        for term in sorted_terms:
-            if term in query:
-                standard = self.term_mapping[term]
-                # 如果不同,添加标准术语
-                if term != standard and standard not in query:
-                    expanded = expanded.replace(term, f"{term}({standard})")
+        parts = []
+        last = 0
+        for end, (term, standard) in self._automaton.iter_long(query):
+            # 如果不同且查询中尚未出现,添加标准术语
+            if term != standard and standard not in query:
+                end += 1  # iter_long 给出的是术语最后一个字符的下标
+                parts.append(query[last:end])
+                parts.append(f"({standard})")
+                last = end
         
-        return expanded
+        if not parts:
+            return query
+        parts.append(query[last:])
+        return "".join(parts)
+    
+    def _annotate(self, term: str, query: str) -> str:
+        """正则回退路径的替换回调: 术语与标准术语不同且查询中尚未出现时,在术语后补充标准术语"""
+        standard = self.term_mapping[term]
+        if term == standard or standard in query:
+            return term
+        return f"{term}({standard})"
     
     def save_mapping_table(self, output_path: str):
         """
@@ -187,16 +235,11 @@ class MedicalTermMapper:
         output_file = Path(output_path)
         output_file.parent.mkdir(parents=True, exist_ok=True)
         
-        # 按标准术语分组
-        grouped = {}
-        for synonym, standard in self.term_mapping.items():
-            if standard not in grouped:
-                grouped[standard] = []
-            grouped[standard].append(synonym)
+        # 按标准术语分组(即反向映射表)
+        grouped = self.reverse_mapping
         
-        # 保存为JSON
-        with open(output_file, 'w', encoding='utf-8') as f:
-            json.dump(grouped, f, ensure_ascii=False, indent=2)
+        # 保存为JSON(orjson 直接输出 UTF-8 字节,中文不转义)
+        output_file.write_bytes(orjson.dumps(dict(grouped), option=orjson.OPT_INDENT_2))
         
         logger.success(f"映射表已保存到: {output_file}")
     
@@ -206,12 +249,8 @@ class MedicalTermMapper:
         print("医学术语标准化映射表")
         print("="*80)
         
-        # 按标准术语分组
-        grouped = {}
-        for synonym, standard in self.term_mapping.items():
-            if standard not in grouped:
-                grouped[standard] = []
-            grouped[standard].append(synonym)
+        # 按标准术语分组(即反向映射表)
+        grouped = self.reverse_mapping
         
         # 打印
         for standard, synonyms in sorted(grouped.items()):
@@ -0,0 +1,108 @@
+"""
+进程内的线程安全缓存
+
+带容量上限和可选有效期,供各模块缓存查询结果;gthread worker 的多个线程可共用同一实例
+"""
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Hashable, Optional
+
+
+class TTLCache:
+    """
+    线程安全的 LRU 缓存,可选按写入时间过期
+
+    超出 maxsize 时淘汰最久未使用的条目;ttl 为 None 时条目不过期。
+    缓存值按原对象保存,需要防止调用方修改时由调用方自行复制。
+    """
+
+    def __init__(self, maxsize: int, ttl: Optional[float] = None):
+        """
+        初始化缓存
+
+        Args:
+            maxsize: 最大条目数
+            ttl: 有效期(秒),为 None 时不过期
+        """
+        self.maxsize = maxsize
+        self.ttl = ttl
+        # key -> (写入时刻, 值),按最近使用顺序排列
+        self._data: "OrderedDict[Hashable, tuple]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._hits = 0
+        self._misses = 0
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        """
+        读取未过期的缓存值
+
+        Args:
+            key: 缓存键
+            default: 未命中或已过期时的返回值
+
+        Returns:
+            缓存值
+        """
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is not None and self.ttl is not None and time.monotonic() - entry[0] >= self.ttl:
+                del self._data[key]
+                entry = None
+            if entry is None:
+                self._misses += 1
+                return default
+            self._data.move_to_end(key)
+            self._hits += 1
+            return entry[1]
+
+    def set(self, key: Hashable, value: Any):
+        """
+        写入缓存,超出容量时淘汰最久未使用的条目
+
+        Args:
+            key: 缓存键
+            value: 缓存值
+        """
+        entry = (time.monotonic(), value)
+        with self._lock:
+            self._data[key] = entry
+            self._data.move_to_end(key)
+            if len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def pop(self, key: Hashable, default: Any = None) -> Any:
+        """移除并返回缓存值(不论是否过期),不存在时返回 default"""
+        with self._lock:
+            entry = self._data.pop(key, None)
+        return default if entry is None else entry[1]
+
+    def remove_if(self, predicate: Callable[[Hashable], bool]) -> int:
+        """
+        移除键满足条件的全部条目
+
+        Args:
+            predicate: 以缓存键为参数的判断函数
+
+        Returns:
+            移除的条目数
+        """
+        with self._lock:
+            keys = [key for key in self._data if predicate(key)]
+            for key in keys:
+                del self._data[key]
+        return len(keys)
+
+    def clear(self):
+        """清空缓存"""
+        with self._lock:
+            self._data.clear()
+
+    def stats(self) -> Dict[str, int]:
+        """命中/未命中次数与当前条目数"""
+        with self._lock:
+            return {"hits": self._hits, "misses": self._misses, "size": len(self._data)}
+
+    def __len__(self) -> int:
+        with self._lock:
+            return len(self._data)
@@ -0,0 +1,72 @@
+"""诊断引擎单元测试"""
+import itertools
+
+import pytest
+
+from src.agent import diagnosis_engine
+from src.agent.diagnosis_engine import DiagnosisEngine
+
+SYMPTOM_CASES = [
+    [],
+    ["头痛"],
+    ["持续头晕两天", "心悸"],
+    ["胸闷", "气短", "出汗"],
+    ["多饮多尿", "体重下降明显"],
+    ["下肢水肿", "夜间呼吸困难", "乏力"],
+    ["咳嗽"],
+]
+
+LAB_CASES = [
+    {},
+    {"收缩压": 160},
+    {"收缩压": 150, "舒张压": 95},
+    {"空腹血糖": 7.8, "HbA1c": 7.1},
+    {"BNP": 500},
+    {"心肌酶": 2.0, "心电图": "ST段抬高"},
+    # 不在索引中的检验项目: 需回退到全量扫描
+    {"mmHg": 1},
+    {"尿酸": 420},
+    {"餐后血糖": 12.0, "肌酐": 90},
+]
+
+
+@pytest.fixture
+def engine(monkeypatch):
+    monkeypatch.setattr(diagnosis_engine, "get_medical_retriever", lambda: None)
+    return DiagnosisEngine()
+
+
+def _full_scan(engine, symptoms, lab_results, monkeypatch):
+    """不经倒排索引、遍历全部规则的打分结果"""
+    with monkeypatch.context() as m:
+        m.setattr(engine, "_candidate_diseases", lambda hits, labs: list(engine.diagnosis_rules))
+        return engine._score_diagnoses(symptoms, lab_results)
+
+
+@pytest.mark.parametrize("symptoms, lab_results", list(itertools.product(SYMPTOM_CASES, LAB_CASES)))
+def test_candidate_diseases_matches_full_scan(engine, monkeypatch, symptoms, lab_results):
+    assert engine._score_diagnoses(symptoms, lab_results) == _full_scan(engine, symptoms, lab_results, monkeypatch)
+
+
+def test_unknown_lab_key_falls_back_to_all_rules(engine):
+    assert engine._candidate_diseases([], {"mmHg": 1}) == list(engine.diagnosis_rules)
+    # 诊断标准文本含 "mmHg" 的疾病仍能通过全量扫描命中
+    diseases = [d["疾病"] for d in engine._score_diagnoses([], {"mmHg": 1})]
+    assert "高血压" in diseases
+
+
+def test_candidate_diseases_keeps_rule_order(engine):
+    hits = [engine._match_symptom_diseases("心悸")]
+    candidates = engine._candidate_diseases(hits, {})
+    assert candidates == [d for d in engine.diagnosis_rules if d in set(candidates)]
+    assert set(candidates) == {"高血压", "冠心病", "心力衰竭"}
+
+
+@pytest.mark.parametrize("symptoms", SYMPTOM_CASES)
+def test_symptom_automaton_matches_regex(engine, symptoms):
+    if engine._symptom_automaton is None:
+        pytest.skip("未安装 pyahocorasick")
+    automaton_hits = [engine._match_symptom_diseases(s) for s in symptoms]
+    engine._symptom_automaton = None
+    regex_hits = [engine._match_symptom_diseases(s) for s in symptoms]
+    assert automaton_hits == regex_hits
@@ -0,0 +1,40 @@
+"""医疗数据检索器单元测试"""
+from src.database import medical_data_retriever
+
+
+class FakeConnector:
+    """按调用次数返回预设结果的数据库连接"""
+
+    def __init__(self, *results):
+        self.results = list(results)
+        self.calls = 0
+
+    def execute_query(self, query, params=None):
+        self.calls += 1
+        return self.results.pop(0)
+
+
+def _retriever(monkeypatch, connector):
+    monkeypatch.setattr(medical_data_retriever, "get_db_connector", lambda: connector)
+    return medical_data_retriever.MedicalDataRetriever()
+
+
+def test_patient_info_miss_is_not_cached(monkeypatch):
+    """未找到的患者不写入缓存,刚导入后再次查询即可查到"""
+    patient = {"patient_id": "P001", "name": "张三"}
+    connector = FakeConnector([], [patient])
+    retriever = _retriever(monkeypatch, connector)
+
+    assert retriever.get_patient_info("P001") is None
+    assert retriever.get_patient_info("P001") == patient
+    assert connector.calls == 2
+
+
+def test_patient_info_hit_returns_copy(monkeypatch):
+    connector = FakeConnector([{"patient_id": "P001", "name": "张三"}])
+    retriever = _retriever(monkeypatch, connector)
+
+    first = retriever.get_patient_info("P001")
+    first["name"] = "已修改"
+    assert retriever.get_patient_info("P001")["name"] == "张三"
+    assert connector.calls == 1
@@ -0,0 +1,91 @@
+"""查询引擎熔断单元测试"""
+import types
+
+import pytest
+
+from src.rag import query_engine as query_engine_module
+from src.rag.query_engine import QueryEngine
+
+
+class FakeInnerEngine:
+    """按 fail 标志返回流式回答或抛出异常的内部查询引擎"""
+
+    def __init__(self):
+        self.fail = False
+        self.calls = 0
+
+    def update_prompts(self, prompts):
+        pass
+
+    def query(self, question):
+        self.calls += 1
+        if self.fail:
+            raise RuntimeError("LLM 接口超时")
+        return types.SimpleNamespace(response_gen=iter(["回答", ":", question]))
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(query_engine_module, "time", types.SimpleNamespace(monotonic=lambda: now[0]))
+    return now
+
+
+@pytest.fixture
+def engine(monkeypatch, clock):
+    inner = FakeInnerEngine()
+    monkeypatch.setattr(QueryEngine, "_create_query_engine", lambda self: inner)
+    return QueryEngine(index=None)
+
+
+def _fail(engine, count, prefix="q"):
+    engine.query_engine.fail = True
+    return [engine.query(f"{prefix}{i}") for i in range(count)]
+
+
+def test_circuit_opens_after_consecutive_failures(engine):
+    answers = _fail(engine, QueryEngine.CIRCUIT_FAIL_MAX)
+    assert all(answer.startswith("查询出错: LLM 接口超时") for answer in answers)
+    calls = engine.query_engine.calls
+
+    # 熔断打开后直接返回,不再调用内部引擎
+    engine.query_engine.fail = False
+    assert engine.query("新问题") == QueryEngine.CIRCUIT_OPEN_MESSAGE
+    assert list(engine.query_stream("新问题")) == [QueryEngine.CIRCUIT_OPEN_MESSAGE]
+    assert engine.query_engine.calls == calls
+
+
+def test_failures_below_threshold_keep_circuit_closed(engine):
+    _fail(engine, QueryEngine.CIRCUIT_FAIL_MAX - 1)
+    engine.query_engine.fail = False
+    assert engine.query("正常问题") == "回答:正常问题"
+    # 成功后计数清零,需要重新连续失败才会熔断
+    _fail(engine, QueryEngine.CIRCUIT_FAIL_MAX - 1, prefix="r")
+    engine.query_engine.fail = False
+    assert engine.query("另一个问题") == "回答:另一个问题"
+
+
+def test_half_open_failure_reopens_immediately(engine, clock):
+    _fail(engine, QueryEngine.CIRCUIT_FAIL_MAX)
+    clock[0] += QueryEngine.CIRCUIT_RESET_TIMEOUT
+
+    # 冷却结束进入半开状态,放行一次请求;失败则立即重新熔断
+    calls = engine.query_engine.calls
+    assert engine.query("半开试探").startswith("查询出错: LLM 接口超时")
+    assert engine.query_engine.calls == calls + 1
+    engine.query_engine.fail = False
+    assert engine.query("半开之后") == QueryEngine.CIRCUIT_OPEN_MESSAGE
+
+
+def test_half_open_success_closes_circuit(engine, clock):
+    _fail(engine, QueryEngine.CIRCUIT_FAIL_MAX)
+    clock[0] += QueryEngine.CIRCUIT_RESET_TIMEOUT - 0.1
+    engine.query_engine.fail = False
+    assert engine.query("冷却中") == QueryEngine.CIRCUIT_OPEN_MESSAGE
+
+    clock[0] += 0.1
+    assert engine.query("半开试探") == "回答:半开试探"
+    # 恢复正常后,单次失败不会熔断
+    _fail(engine, 1, prefix="s")
+    engine.query_engine.fail = False
+    assert engine.query("恢复后") == "回答:恢复后"
@@ -0,0 +1,35 @@
+"""安全检查器单元测试"""
+import threading
+
+import pytest
+
+from src.agent.safety_checker import SafetyChecker
+
+
+def test_scan_ethics_concurrent_threads():
+    """多个线程同时进行伦理检查时不应争用 Hyperscan scratch(gthread worker 的并发场景)"""
+    pytest.importorskip("hyperscan")
+    checker = SafetyChecker()
+    content = "这种药保证治愈高血压,百分之百有效。" * 2000
+    thread_count = 8
+    barrier = threading.Barrier(thread_count)
+    errors = []
+    results = []
+
+    def run():
+        barrier.wait()
+        try:
+            for _ in range(20):
+                results.append(checker._scan_ethics(content))
+        except Exception as e:  # noqa: BLE001 - 记录任何异常,由断言报告
+            errors.append(e)
+
+    threads = [threading.Thread(target=run) for _ in range(thread_count)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert not errors
+    assert len(results) == thread_count * 20
+    assert all(result == ({"保证治愈"}, True) for result in results)
@@ -0,0 +1,112 @@
+"""胰岛素统计接口单元测试"""
+import numpy as np
+import pandas as pd
+import pytest
+from flask import Flask
+
+from src.api import statistics
+from src.api.statistics import (
+    COL_AGE, COL_FASTING, COL_GENDER, COL_HEIGHT, COL_POSTPRANDIAL, COL_WEIGHT,
+    classify_insulin_usage, statistics_bp
+)
+
+GROUP_ORDERS = {
+    'gender': ['男性', '女性'],
+    'age': ['<40岁', '40-60岁', '60-80岁', '≥80岁'],
+    'height': ['<1.55m', '1.55-1.70m', '≥1.70m'],
+    'weight': ['<50kg', '50-70kg', '70-90kg', '≥90kg'],
+}
+
+
+def _rowwise_status(fasting, postprandial):
+    """逐行判断的原始实现"""
+    def is_empty(val):
+        return pd.isna(val) or str(val).strip() == '/'
+
+    fasting_empty = is_empty(fasting)
+    postprandial_empty = is_empty(postprandial)
+    if fasting_empty and postprandial_empty:
+        return 'not_using'
+    if not fasting_empty and not postprandial_empty:
+        return 'using'
+    return 'not_measured'
+
+
+def _rowwise_group(dimension, row):
+    """逐行分组的原始实现"""
+    if dimension == 'gender':
+        return {1: '女性', 2: '男性'}.get(row[COL_GENDER])
+    value, thresholds = {
+        'age': (row[COL_AGE], [40, 60, 80]),
+        'height': (row[COL_HEIGHT], [1.55, 1.70]),
+        'weight': (row[COL_WEIGHT], [50, 70, 90]),
+    }[dimension]
+    labels = GROUP_ORDERS[dimension]
+    for threshold, label in zip(thresholds, labels):
+        if value < threshold:
+            return label
+    return labels[-1]
+
+
+def _sample_frame(rows=120, seed=7):
+    rng = np.random.default_rng(seed)
+    insulin_values = [np.nan, '/', ' / ', 35.2, 120, 88.5]
+    return pd.DataFrame({
+        '病人诊疗号': [f"P{i:04d}" for i in range(rows)],
+        COL_GENDER: rng.choice([1, 2], rows),
+        # 包含分组边界值
+        COL_AGE: rng.choice([25, 39, 40, 59, 60, 79, 80, 91], rows),
+        COL_HEIGHT: rng.choice([1.48, 1.55, 1.62, 1.70, 1.83], rows),
+        COL_WEIGHT: rng.choice([45.0, 50.0, 64.5, 70.0, 89.9, 90.0, 103.0], rows),
+        COL_FASTING: rng.choice(np.array(insulin_values, dtype=object), rows),
+        COL_POSTPRANDIAL: rng.choice(np.array(insulin_values, dtype=object), rows),
+    })
+
+
+def test_classify_insulin_usage_matches_rowwise():
+    df = _sample_frame()
+    expected = [_rowwise_status(f, p) for f, p in zip(df[COL_FASTING], df[COL_POSTPRANDIAL])]
+    assert classify_insulin_usage(df[COL_FASTING], df[COL_POSTPRANDIAL]).tolist() == expected
+
+
+@pytest.fixture
+def client(tmp_path, monkeypatch):
+    pytest.importorskip("openpyxl")
+    df = _sample_frame()
+    excel_path = tmp_path / 'stats.xlsx'
+    df.to_excel(excel_path, index=False)
+    monkeypatch.setattr(statistics, 'EXCEL_FILE_PATH', excel_path)
+    monkeypatch.setattr(statistics, 'PARQUET_FILE_PATH', excel_path.with_suffix('.parquet'))
+    monkeypatch.setattr(statistics, '_DF_CACHE', {"mtime": None, "df": None})
+
+    app = Flask(__name__)
+    app.register_blueprint(statistics_bp)
+    return app.test_client(), pd.read_excel(excel_path)
+
+
+@pytest.mark.parametrize('dimension', list(GROUP_ORDERS))
+def test_insulin_statistics_matches_rowwise(client, dimension):
+    test_client, df = client
+    statuses = [_rowwise_status(f, p) for f, p in zip(df[COL_FASTING], df[COL_POSTPRANDIAL])]
+    groups = [_rowwise_group(dimension, row) for _, row in df.iterrows()]
+
+    expected_distribution = []
+    for label in GROUP_ORDERS[dimension]:
+        in_group = [s for s, g in zip(statuses, groups) if g == label]
+        if in_group:
+            expected_distribution.append({
+                "label": label,
+                "using": in_group.count('using'),
+                "not_using": in_group.count('not_using'),
+                "not_measured": in_group.count('not_measured'),
+                "total": len(in_group),
+            })
+
+    body = test_client.get(f'/api/statistics/insulin?dimension={dimension}').get_json()
+    assert body["total_patients"] == len(df)
+    assert body["classification"] == {
+        "using_insulin": statuses.count('using'),
+        "not_using_insulin": statuses.count('not_using'),
+        "not_measured": statuses.count('not_measured'),
+    }
+    assert body["distribution"] == expected_distribution
@@ -0,0 +1,76 @@
+"""医学术语映射器单元测试"""
+import pytest
+
+from src.utils import term_mapper
+from src.utils.term_mapper import MedicalTermMapper
+
+QUERIES = [
+    "",
+    "如何预防心梗",
+    "心衰患者可以运动吗",
+    "房颤和心慌有什么区别",
+    "血压高伴头晕怎么办",
+    "T2DM患者HbA1c控制目标",
+    "脑梗和脑梗塞是一回事吗",
+    "中风后的康复训练",
+    "急性心梗的急救措施",
+    "糖尿病足的护理",
+    "今天天气怎么样",
+    "原发性高血压的高血压患者",
+    "气短气喘胸闷",
+]
+
+
+@pytest.fixture
+def automaton_mapper():
+    if term_mapper.ahocorasick is None:
+        pytest.skip("未安装 pyahocorasick")
+    mapper = MedicalTermMapper()
+    assert mapper._automaton is not None
+    return mapper
+
+
+@pytest.fixture
+def regex_mapper(monkeypatch):
+    monkeypatch.setattr(term_mapper, "ahocorasick", None)
+    mapper = MedicalTermMapper()
+    assert mapper._automaton is None
+    return mapper
+
+
+def _reference_expand(mapping, query):
+    """逐个术语子串查找并替换的原始实现,用于无重叠术语的查询"""
+    expanded = query
+    for term in sorted(mapping, key=len, reverse=True):
+        if term in query:
+            standard = mapping[term]
+            if term != standard and standard not in query:
+                expanded = expanded.replace(term, f"{term}({standard})")
+    return expanded
+
+
+@pytest.mark.parametrize("query", QUERIES)
+def test_automaton_and_regex_paths_agree(automaton_mapper, regex_mapper, query):
+    assert automaton_mapper.expand_query(query) == regex_mapper.expand_query(query)
+
+
+@pytest.mark.parametrize("mapper_fixture", ["automaton_mapper", "regex_mapper"])
+@pytest.mark.parametrize("query, expected", [
+    ("如何预防心梗", "如何预防心梗(心肌梗死)"),
+    ("心衰患者可以运动吗", "心衰(心力衰竭)患者可以运动吗"),
+    ("今天天气怎么样", "今天天气怎么样"),
+    # 标准术语已在查询中出现时不重复补充
+    ("心梗即心肌梗死", "心梗即心肌梗死"),
+    # 同一位置优先匹配最长术语
+    ("急性心梗的急救措施", "急性心梗(急性心肌梗死)的急救措施"),
+])
+def test_expand_query(request, mapper_fixture, query, expected):
+    mapper = request.getfixturevalue(mapper_fixture)
+    assert mapper.expand_query(query) == expected
+
+
+@pytest.mark.parametrize("mapper_fixture", ["automaton_mapper", "regex_mapper"])
+@pytest.mark.parametrize("query", ["如何预防心梗", "心衰患者可以运动吗", "房颤和心慌有什么区别", "中风后的康复训练"])
+def test_expand_query_matches_reference_without_overlaps(request, mapper_fixture, query):
+    mapper = request.getfixturevalue(mapper_fixture)
+    assert mapper.expand_query(query) == _reference_expand(mapper.term_mapping, query)
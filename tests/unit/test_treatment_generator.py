@@ -0,0 +1,69 @@
+"""治疗方案生成器单元测试"""
+import pytest
+
+from src.agent import treatment_generator
+from src.agent.treatment_generator import TreatmentPlanGenerator
+
+
+class FakeRetriever:
+    """记录查询次数的患者数据检索器"""
+
+    def __init__(self):
+        self.calls = []
+
+    def get_patient_comprehensive_data(self, patient_id):
+        self.calls.append(patient_id)
+        return {
+            "patient_info": {"patient_id": patient_id, "age": 58, "gender": "男", "bmi": 26.1},
+            "lab_results": [],
+            "medications": [],
+            "diagnoses": [],
+        }
+
+
+@pytest.fixture
+def retriever(monkeypatch):
+    fake = FakeRetriever()
+    monkeypatch.setattr(treatment_generator, "get_medical_retriever", lambda: fake)
+    return fake
+
+
+@pytest.fixture
+def generator(retriever):
+    return TreatmentPlanGenerator()
+
+
+def _generate_all(generator):
+    generator.generate_treatment_plan("P001", "高血压", "中危")
+    generator.generate_treatment_plan("P001", "糖尿病", "高危", ["二甲双胍"])
+    generator.generate_treatment_plan("P002", "高血压", "中危")
+
+
+def test_repeated_request_uses_cache(generator, retriever):
+    first = generator.generate_treatment_plan("P001", "高血压", "中危")
+    second = generator.generate_treatment_plan("P001", "高血压", "中危")
+    assert first == second
+    assert retriever.calls == ["P001"]
+
+
+def test_invalidate_plan_cache_only_evicts_that_patient(generator, retriever):
+    _generate_all(generator)
+    assert retriever.calls == ["P001", "P001", "P002"]
+
+    generator.invalidate_plan_cache("P001")
+    _generate_all(generator)
+    # P001 的两个方案重新生成,P002 仍命中缓存
+    assert retriever.calls == ["P001", "P001", "P002", "P001", "P001"]
+
+
+def test_invalidate_plan_cache_without_patient_clears_all(generator, retriever):
+    _generate_all(generator)
+    generator.invalidate_plan_cache()
+    _generate_all(generator)
+    assert retriever.calls == ["P001", "P001", "P002"] * 2
+
+
+def test_cached_plan_is_not_shared_with_caller(generator):
+    plan = generator.generate_treatment_plan("P001", "高血压", "中危")
+    plan.clear()
+    assert generator.generate_treatment_plan("P001", "高血压", "中危")
@@ -0,0 +1,67 @@
+"""TTLCache 单元测试"""
+import threading
+
+from src.utils import ttl_cache
+from src.utils.ttl_cache import TTLCache
+
+
+def test_get_returns_default_on_miss():
+    cache = TTLCache(maxsize=2)
+    assert cache.get("a") is None
+    assert cache.get("a", "default") == "default"
+    assert cache.stats() == {"hits": 0, "misses": 2, "size": 0}
+
+
+def test_evicts_least_recently_used():
+    cache = TTLCache(maxsize=2)
+    cache.set("a", 1)
+    cache.set("b", 2)
+    assert cache.get("a") == 1  # a 成为最近使用
+    cache.set("c", 3)
+    assert cache.get("b") is None
+    assert cache.get("a") == 1
+    assert cache.get("c") == 3
+    assert len(cache) == 2
+
+
+def test_entries_expire_after_ttl(monkeypatch):
+    now = [100.0]
+    monkeypatch.setattr(ttl_cache.time, "monotonic", lambda: now[0])
+    cache = TTLCache(maxsize=8, ttl=60)
+    cache.set("a", 1)
+    now[0] += 59.9
+    assert cache.get("a") == 1
+    now[0] += 0.1
+    assert cache.get("a") is None
+    assert len(cache) == 0
+
+
+def test_remove_if_and_pop():
+    cache = TTLCache(maxsize=8)
+    cache.set(("p1", "x"), 1)
+    cache.set(("p1", "y"), 2)
+    cache.set(("p2", "x"), 3)
+    assert cache.remove_if(lambda key: key[0] == "p1") == 2
+    assert cache.get(("p2", "x")) == 3
+    assert cache.pop(("p2", "x")) == 3
+    assert cache.pop(("p2", "x"), "gone") == "gone"
+
+
+def test_concurrent_access_keeps_size_bound():
+    cache = TTLCache(maxsize=16, ttl=60)
+    thread_count = 8
+    barrier = threading.Barrier(thread_count)
+
+    def run(offset):
+        barrier.wait()
+        for i in range(2000):
+            cache.set((offset, i % 40), i)
+            cache.get((offset, (i * 7) % 40))
+
+    threads = [threading.Thread(target=run, args=(n,)) for n in range(thread_count)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert len(cache) == 16
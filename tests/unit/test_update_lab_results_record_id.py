@@ -0,0 +1,88 @@
+"""lab_results record_id 更新脚本单元测试"""
+import importlib.util
+from pathlib import Path
+
+import pytest
+
+SCRIPT_PATH = Path(__file__).resolve().parents[2] / "scripts" / "update_lab_results_record_id.py"
+
+HEADER = "result_id,patient_id,record_id,test_date,test_item,result_value,unit,test_notes\n"
+MAPPING = {"1001_0_20210730": 1, "1002_1_20210521": 3, "1003_0_20210611": 5}
+
+
+@pytest.fixture(scope="module")
+def script():
+    spec = importlib.util.spec_from_file_location("update_lab_results_record_id", SCRIPT_PATH)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+@pytest.fixture(params=["default", "streaming"])
+def update(request, script):
+    if request.param == "default":
+        return script.update_lab_results_record_id
+    # 小块读取,覆盖多个 RecordBatch 的情况
+    return lambda path, mapping: script.update_lab_results_record_id_streaming(path, mapping, block_size=128)
+
+
+def _write(tmp_path, rows):
+    path = tmp_path / "lab_results.csv"
+    path.write_text(HEADER + "".join(rows), encoding="utf-8")
+    return path
+
+
+def test_fills_only_missing_record_ids(tmp_path, update):
+    path = _write(tmp_path, [
+        "1,1001_0_20210730,,2025-12-01,尿酸,289.7,umol/L,检查结果正常\n",
+        "2,1002_1_20210521,9,2025-05-05,尿素氮,266.0,mmol/L,\"轻微异常,建议复查\"\n",
+        "3,1003_0_20210611,  ,2025-06-01,空腹血糖,7.0,mmol/L,\n",
+        "4,9999_0_20210101,,2025-06-02,肌酐,120.0,umol/L,检查结果正常\n",
+    ])
+
+    assert update(str(path), MAPPING) == (2, 1, 1)
+    assert path.read_text(encoding="utf-8") == HEADER + "".join([
+        "1,1001_0_20210730,1,2025-12-01,尿酸,289.7,umol/L,检查结果正常\n",
+        "2,1002_1_20210521,9,2025-05-05,尿素氮,266.0,mmol/L,\"轻微异常,建议复查\"\n",
+        "3,1003_0_20210611,5,2025-06-01,空腹血糖,7.0,mmol/L,\n",
+        "4,9999_0_20210101,,2025-06-02,肌酐,120.0,umol/L,检查结果正常\n",
+    ])
+
+
+def test_keeps_non_numeric_record_ids(tmp_path, update):
+    path = _write(tmp_path, [
+        "1,1001_0_20210730,R-17,2025-12-01,尿酸,289.7,umol/L,检查结果正常\n",
+        "2,1002_1_20210521,,2025-05-05,尿素氮,266.0,mmol/L,检查结果正常\n",
+    ])
+
+    assert update(str(path), MAPPING) == (1, 1, 0)
+    assert path.read_text(encoding="utf-8") == HEADER + "".join([
+        "1,1001_0_20210730,R-17,2025-12-01,尿酸,289.7,umol/L,检查结果正常\n",
+        "2,1002_1_20210521,3,2025-05-05,尿素氮,266.0,mmol/L,检查结果正常\n",
+    ])
+
+
+def test_rerun_leaves_file_unchanged(tmp_path, update):
+    rows = [
+        f"{i},{patient_id},,2025-12-01,尿酸,{280 + i}.5,umol/L,检查结果正常\n"
+        for i, patient_id in enumerate(list(MAPPING) * 20, 1)
+    ]
+    path = _write(tmp_path, rows)
+
+    assert update(str(path), MAPPING) == (60, 0, 0)
+    first = path.read_bytes()
+    assert update(str(path), MAPPING) == (0, 60, 0)
+    assert path.read_bytes() == first
+
+
+def test_clear_then_update_restores_file(tmp_path, script, update):
+    original = HEADER + "".join([
+        "1,1001_0_20210730,1,2025-12-01,尿酸,289.7,umol/L,检查结果正常\n",
+        "2,1002_1_20210521,3,2025-05-05,尿素氮,266.0,mmol/L,检查结果正常\n",
+    ])
+    path = tmp_path / "lab_results.csv"
+    path.write_text(original, encoding="utf-8")
+
+    assert script.clear_record_id(str(path)) == 2
+    assert update(str(path), MAPPING) == (2, 0, 0)
+    assert path.read_text(encoding="utf-8") == original